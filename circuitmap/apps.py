@@ -14,3 +14,39 @@ class CircuitmapConfig(AppConfig):
             'import_user': control.DEFAULT_IMPORT_USER,
             'connector_id_offset': control.CONNECTORID_OFFSET,
         }
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from catmaid.models import Class, Project, Relation
+        from circuitmap.control.catmaid_ids import invalidate_project_ids
+
+        # Cached relation and class IDs of a project are dropped, when
+        # relations or classes are changed in this process. Other processes
+        # need to call invalidate_project_ids() themselves.
+        def invalidate(sender, instance, **kwargs):
+            invalidate_project_ids(instance.id if sender is Project else instance.project_id)
+
+        for model in (Class, Project, Relation):
+            post_save.connect(invalidate, sender=model,
+                    dispatch_uid=f'circuitmap-ids-save-{model.__name__}')
+            post_delete.connect(invalidate, sender=model,
+                    dispatch_uid=f'circuitmap-ids-delete-{model.__name__}')
+
+        # Volumes are created lazily on first use. Optionally, they are
+        # created in the background right after startup and in each new
+        # Celery worker process.
+        from circuitmap.control.volume import warm_up, warm_up_enabled
+        if warm_up_enabled():
+            from celery.signals import worker_process_init
+            warm_up()
+            worker_process_init.connect(lambda **kwargs: warm_up(), weak=False,
+                    dispatch_uid='circuitmap-volume-warm-up')
+
+        # Runtimes of circuitmap tasks are recorded as metrics, which are
+        # written after each task.
+        from celery.signals import task_postrun, task_prerun
+        from circuitmap.control.metrics import task_finished, task_started
+        task_prerun.connect(task_started, weak=False,
+                dispatch_uid='circuitmap-metrics-task-start')
+        task_postrun.connect(task_finished, weak=False,
+                dispatch_uid='circuitmap-metrics-task-end')
@@ -3,36 +3,68 @@
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from django.http import HttpRequest, JsonResponse, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.core.cache import cache
 from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
+import hashlib
+import json
+import time
 import traceback
 import numpy as np
 import pandas as pd
-import scipy.spatial as sp
-import fafbseg
 import networkx as nx
 import sqlite3
 import logging
 from timeit import default_timer as timer
 from itertools import chain
 
-from cloudvolume import CloudVolume
-from cloudvolume.datasource.precomputed.skeleton.sharded import ShardedPrecomputedSkeletonSource
-
-from celery import shared_task
+from celery import chord, current_app, shared_task
 from celery.utils.log import get_task_logger
 
+# Defaults of optional settings, which can be overridden in the circuitmap
+# settings file. Interactive imports (single segments and skeletons) and bulk
+# imports (partners and batches) can be routed to different Celery queues
+# with different priorities. None uses Celery's defaults.
+INTERACTIVE_IMPORT_QUEUE = None
+INTERACTIVE_IMPORT_PRIORITY = None
+BULK_IMPORT_QUEUE = None
+BULK_IMPORT_PRIORITY = None
+
 from .settings import *
 from circuitmap import CircuitMapError
-from circuitmap.models import SynapseImport, SegmentImport
+from circuitmap.models import SynapseImport, SegmentImport, LINK_SCORE_COLUMNS
+from circuitmap.control.spatial import (SkeletonTree, cluster_bounding_boxes,
+        get_skeleton_tree, match_links_to_tree)
+from circuitmap.control.skeleton import (mapping_skel_nid,
+        autoseg_skeleton_to_rows, simplify_skeleton_rows)
+from circuitmap.control.skeleton_cache import get_skeleton_cache
+from circuitmap.control.pipeline import Pipeline, Stage, StageError
+from circuitmap.control.progress import ImportProgress, get_cached_progress
+from circuitmap.control import coalescing
+from circuitmap.control.checkpoints import (ImportCancelled, cancel_import,
+        check_cancelled, complete_stage, get_checkpoint, is_cancelled,
+        save_unless_cancelled)
+from circuitmap.control.change_feed import (get_last_update,
+        wait_for_import_changes)
+from circuitmap.control.timings import (collects_timings, measure,
+        partner_timings, store_segment_timings)
+from circuitmap.control import metrics
+from circuitmap.control.volume import (get_cloudvolume, get_segment_ids,
+        get_segment_lookup, use_google_storage)
+from circuitmap.control.catmaid_ids import (get_project_ids, get_class_id,
+        get_relation_id)
 from django.conf import settings
 
 from catmaid.control.common import get_request_bool, get_request_list
+from catmaid.error import ClientError
 from catmaid.consumers import msg_user
 from catmaid.models import Message, User, UserRole
 from catmaid.control.message import notify_user
-from catmaid.control.authentication import requires_user_role
+from catmaid.control.authentication import requires_user_role, PermissionError
 from catmaid.tasks import LoggingTask
 
 # Make psycopg2 understand numpy 64 bit types
@@ -40,11 +72,6 @@ import psycopg2
 psycopg2.extensions.register_adapter(np.int64, psycopg2._psycopg.AsIs)
 psycopg2.extensions.register_adapter(np.uint64, psycopg2._psycopg.AsIs)
 
-cv = CloudVolume(CLOUDVOLUME_URL, use_https=True, parallel=False)
-cv.meta.info['skeletons'] = CLOUDVOLUME_SKELETONS
-cv.skeleton.meta.refresh_info()
-cv.skeleton = ShardedPrecomputedSkeletonSource(cv.skeleton.meta, cv.cache, cv.config)
-
 cols = ["id", "pre_x","pre_y","pre_z","post_x","post_y","post_z","scores",
             "cleft_id","cleft_scores","clust_con_offset","dist","offset",
             "prob_count","prob_max","prob_mean","prob_min","prob_sum",
@@ -53,18 +80,110 @@ cols = ["id", "pre_x","pre_y","pre_z","post_x","post_y","post_z","scores",
 task_logger = get_task_logger(__name__)
 
 
-def get_links(cursor, segment_id, where='segmentid_pre'):
+def get_task_options(kind):
+    """Get the Celery routing options (queue and priority) for 'interactive'
+    or 'bulk' import tasks.
+    """
+    if kind == 'interactive':
+        queue, priority = INTERACTIVE_IMPORT_QUEUE, INTERACTIVE_IMPORT_PRIORITY
+    elif kind == 'bulk':
+        queue, priority = BULK_IMPORT_QUEUE, BULK_IMPORT_PRIORITY
+    else:
+        raise ValueError(f'Unknown task kind: {kind}')
+    options = {}
+    if queue:
+        options['queue'] = queue
+    if priority is not None:
+        options['priority'] = priority
+    return options
+
+
+def get_queue_name(options):
+    """Get the name of the queue tasks with the passed in options are sent
+    to.
+    """
+    return options.get('queue') or current_app.conf.task_default_queue
+
+
+def runs_partners_separately():
+    """Whether partner imports run on a different queue than interactive
+    imports.
+    """
+    return bool(BULK_IMPORT_QUEUE) and BULK_IMPORT_QUEUE != INTERACTIVE_IMPORT_QUEUE
+
+
+def get_autoseg_skeleton(segment_id):
+    """Get the autoseg skeleton of the passed in segment, either from the
+    skeleton cache of this host or from the skeleton source.
+    """
+    skeleton_cache = get_skeleton_cache()
+    if skeleton_cache:
+        s1 = skeleton_cache.get(CLOUDVOLUME_URL, CLOUDVOLUME_SKELETONS, segment_id)
+        metrics.inc('circuitmap_cache_requests_total', cache='skeleton',
+                result='miss' if s1 is None else 'hit')
+        if s1 is not None:
+            task_logger.debug(f'Using cached skeleton for segment {segment_id}')
+            return s1
+
+    with measure('skeleton_download'):
+        s1 = get_cloudvolume().skeleton.get(int(segment_id))
+    if skeleton_cache:
+        skeleton_cache.put(CLOUDVOLUME_URL, CLOUDVOLUME_SKELETONS, segment_id, s1)
+    return s1
+
+
+def get_links(cursor, segment_id, where='segmentid_pre', bounding_box=None,
+        score_thresholds=None):
+    """Get all synaptic links of the passed in segment. With
+    where='segmentid_pre', links that have the segment on the presynaptic side
+    are returned, with where='segmentid_post' links with the segment on the
+    postsynaptic side. Optionally, only links with their respective location
+    (pre or post) in <bounding_box> (a pair of minimum and maximum corner) and
+    only links with at least the scores given in <score_thresholds> (a dict
+    mapping score columns to minimum values) are returned.
+    """
+    return get_links_for_segments(cursor, [segment_id], where, bounding_box,
+            score_thresholds)
+
+
+def get_links_for_segments(cursor, segment_ids, where='segmentid_pre',
+        bounding_box=None, score_thresholds=None):
+    """Like get_links(), but return the links of all segments in
+    <segment_ids> with a single query.
+    """
     exclude_partners = list(getattr(settings, 'CIRCUITMAP_IGNORED_SEGMENT_IDS', []))
     partner_column = 'segmentid_post' if where == 'segmentid_pre' else 'segmentid_pre'
-    cursor.execute(f'''
-        SELECT * FROM circuitmap_synlinks
-        WHERE {where} = %(segment_id)s
-        AND {partner_column} <> ANY(%(exclude_partners)s::bigint[])
-    ''', {
-        'segment_id': segment_id,
+    location_prefix = 'pre' if where == 'segmentid_pre' else 'post'
+    params = {
+        'segment_ids': [int(s) for s in segment_ids],
         'exclude_partners': exclude_partners,
-    })
-    return pd.DataFrame.from_records(cursor.fetchall(), columns=cols)
+    }
+
+    constraints = []
+    if bounding_box is not None:
+        for dim, min_value, max_value in zip('xyz', *bounding_box):
+            constraints.append(f'AND {location_prefix}_{dim} BETWEEN %(min_{dim})s AND %(max_{dim})s')
+            params[f'min_{dim}'] = float(min_value)
+            params[f'max_{dim}'] = float(max_value)
+
+    for column, min_value in (score_thresholds or {}).items():
+        if column not in LINK_SCORE_COLUMNS:
+            raise ValueError(f'Unknown link score column: {column}')
+        constraints.append(f'AND {column} >= %(min_{column})s')
+        params[f'min_{column}'] = min_value
+
+    with measure('link_fetch') as counters:
+        cursor.execute(f'''
+            SELECT * FROM circuitmap_synlinks
+            WHERE {where} = ANY(%(segment_ids)s::bigint[])
+            AND {partner_column} <> ALL(%(exclude_partners)s::bigint[])
+            {' '.join(constraints)}
+        ''', params)
+        links = pd.DataFrame.from_records(cursor.fetchall(), columns=cols)
+        counters['rows'] = len(links)
+        counters['bytes'] = int(links.memory_usage(index=False).sum())
+    metrics.inc('circuitmap_links_fetched_total', len(links))
+    return links
 
 
 def get_links_from_offset(cursor, offsets):
@@ -77,13 +196,108 @@ def get_links_from_offset(cursor, offsets):
     return pd.DataFrame.from_records(cursor.fetchall(), columns=cols)
 
 
-def load_subgraph(cursor, start_segment_id, order = 0):
+def get_overlapping_segments(locations):
+    """Return the set of segment IDs found at the passed in physical locations
+    (N x 3). Segments marked as ignored in CIRCUITMAP_IGNORED_SEGMENT_IDS are
+    not included.
+    """
+    return get_overlapping_segments_for_each([locations])[0]
+
+
+def get_overlapping_segments_for_each(location_sets):
+    """Like get_overlapping_segments(), but for a list of location arrays, e.g.
+    of multiple skeletons. All locations are looked up together and a list with
+    one segment ID set per location array is returned.
+    """
+    all_locations = np.concatenate([np.asarray(l).reshape(-1, 3)
+            for l in location_sets]) if location_sets else np.zeros((0, 3))
+    with measure('segment_lookup', locations=len(all_locations)):
+        segment_ids = get_segment_ids(all_locations) \
+                if len(all_locations) > 0 else []
+    task_logger.debug(f'Found segment IDs for {len(all_locations)} locations')
+
+    ignored_segment_ids = set(getattr(settings, 'CIRCUITMAP_IGNORED_SEGMENT_IDS', []))
+
+    result = []
+    offset = 0
+    for locations in location_sets:
+        n_locations = len(np.asarray(locations).reshape(-1, 3))
+        overlapping_segmentids = set(chain.from_iterable(
+                segment_ids[offset:offset + n_locations]))
+        offset += n_locations
+        task_logger.debug(f'found {len(overlapping_segmentids)} overlapping segments')
+
+        # Explicitly remove segments with IDs marked as ignored (e.g.
+        # background).
+        result.append(overlapping_segmentids - ignored_segment_ids)
+
+    return result
+
+
+def get_incremental_base_import(synapse_import):
+    """Find the most recent completed import for the skeleton of the passed in
+    import that used the same parameters and recorded the skeleton state it
+    was computed for. If there is none, None is returned.
+    """
+    score_thresholds = dict((f'min_{c}', getattr(synapse_import, f'min_{c}'))
+            for c in LINK_SCORE_COLUMNS)
+    return SynapseImport.objects.filter(project_id=synapse_import.project_id,
+            skeleton_id=synapse_import.skeleton_id,
+            status=SynapseImport.Status.DONE,
+            distance_threshold=synapse_import.distance_threshold,
+            with_autapses=synapse_import.with_autapses,
+            skeleton_edition_time__isnull=False,
+            **score_thresholds) \
+        .exclude(id=synapse_import.id) \
+        .order_by('-skeleton_edition_time', '-id') \
+        .first()
+
+
+def get_changed_node_locations(cursor, project_id, skeleton_id, since):
+    """Return the locations (N x 3) of all nodes of the passed in skeleton that
+    have been created or changed after <since>.
+    """
+    cursor.execute('''
+        SELECT t.location_x, t.location_y, t.location_z
+        FROM treenode t
+        WHERE t.skeleton_id = %(skeleton_id)s
+        AND t.project_id = %(project_id)s
+        AND t.edition_time > %(since)s
+    ''', {
+        'project_id': int(project_id),
+        'skeleton_id': int(skeleton_id),
+        'since': since,
+    })
+    return np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+
+
+def get_skeleton_links(cursor, project_id, skeleton_id):
+    """Return a set of (connector ID, relation name) tuples for all connector
+    links of the passed in skeleton.
+    """
+    relation_names = dict((v, k) for k, v in
+            get_project_ids(cursor, project_id).relations.items())
+    cursor.execute('''
+        SELECT tc.connector_id, tc.relation_id
+        FROM treenode_connector tc
+        WHERE tc.skeleton_id = %(skeleton_id)s
+        AND tc.project_id = %(project_id)s
+    ''', {
+        'project_id': int(project_id),
+        'skeleton_id': int(skeleton_id),
+    })
+    return set((c, relation_names.get(r)) for c, r in cursor.fetchall())
+
+
+def load_subgraph(cursor, start_segment_id, order = 0, score_thresholds=None):
     """ Return a NetworkX graph with segments as nodes and synaptic connection
     as edges with synapse counts
 
     start_segment_id: starting segment for subgraph loading
 
     order: number of times to expand along edges
+
+    score_thresholds: optional minimum link scores, see get_links()
     """
     fetch_segments = set([start_segment_id])
     fetched_segments = set()
@@ -96,10 +310,12 @@ def load_subgraph(cursor, start_segment_id, order = 0):
             task_logger.debug(f'process segment {i} with segment_id {segment_id}')
 
             task_logger.debug('retrieve pre_links')
-            pre_links = get_links(cursor, segment_id, where='segmentid_pre')
+            pre_links = get_links(cursor, segment_id, where='segmentid_pre',
+                    score_thresholds=score_thresholds)
 
             task_logger.debug('retrieve post_links')
-            post_links = get_links(cursor, segment_id, where='segmentid_post')
+            post_links = get_links(cursor, segment_id, where='segmentid_post',
+                    score_thresholds=score_thresholds)
 
             task_logger.debug('build graph ...')
 
@@ -212,6 +428,63 @@ def testtask():
     task_logger.info('testtask')
 
 
+def get_request_score_thresholds(request):
+    """Parse optional minimum scores for synaptic links, e.g.
+    "min_cleft_scores", from the passed in request. Returns a dictionary
+    mapping SynapseImport field names to values.
+    """
+    score_thresholds = {}
+    for column in LINK_SCORE_COLUMNS:
+        value = request.POST.get(f'min_{column}')
+        if value not in (None, ''):
+            score_thresholds[f'min_{column}'] = float(value) \
+                    if column == 'scores' else int(value)
+    return score_thresholds
+
+
+def get_annotated_skeleton_ids(cursor, project_id, annotations):
+    """Return the IDs of all skeletons that model a neuron annotated with at
+    least one of the passed in annotation names.
+    """
+    cursor.execute("""
+        SELECT DISTINCT skeleton_neuron.class_instance_a
+        FROM class_instance a
+        JOIN class_instance_class_instance neuron_annotation
+            ON neuron_annotation.class_instance_b = a.id
+        JOIN class_instance_class_instance skeleton_neuron
+            ON skeleton_neuron.class_instance_b = neuron_annotation.class_instance_a
+        WHERE a.project_id = %(project_id)s
+        AND a.class_id = %(annotation_class_id)s
+        AND a.name = ANY(%(annotations)s::text[])
+        AND neuron_annotation.relation_id = %(annotated_with_id)s
+        AND skeleton_neuron.relation_id = %(model_of_id)s
+    """, {
+        'project_id': int(project_id),
+        'annotations': list(annotations),
+        'annotation_class_id': get_class_id(cursor, project_id, 'annotation'),
+        'annotated_with_id': get_relation_id(cursor, project_id, 'annotated_with'),
+        'model_of_id': get_relation_id(cursor, project_id, 'model_of'),
+    })
+    return [r[0] for r in cursor.fetchall()]
+
+
+@api_view(['POST'])
+@requires_user_role(UserRole.Browse)
+def get_segments_at_locations(request: HttpRequest, project_id=None):
+    """Look up the segment IDs at a list of voxel locations. Locations are
+    passed in as a list of [x, y, z] lists (locations). The segment IDs are
+    returned as strings in the same order, "0" means no segment.
+    """
+    locations = get_request_list(request.POST, 'locations', [], map_fn=float)
+    if not locations:
+        raise ValueError("Need at least one location")
+    points = np.round(np.array(locations, dtype=np.float64).reshape(-1, 3))
+    segment_ids = get_segment_lookup().lookup(points)
+    return JsonResponse({
+        'segment_ids': [str(s) for s in segment_ids],
+    })
+
+
 @api_view(['POST'])
 @transaction.non_atomic_requests
 def fetch_synapses(request: HttpRequest, project_id=None):
@@ -222,6 +495,8 @@ def fetch_synapses(request: HttpRequest, project_id=None):
     fetch_upstream = get_request_bool(request.POST, 'fetch_upstream', False)
     fetch_downstream = get_request_bool(request.POST, 'fetch_downstream', False)
     with_autapses = get_request_bool(request.POST, 'with_autapses', False)
+    incremental = get_request_bool(request.POST, 'incremental', False)
+    preview = get_request_bool(request.POST, 'preview', False)
     distance_threshold = int(request.POST.get('distance_threshold', 1000 ))
     active_skeleton_id = int(request.POST.get('active_skeleton', -1 ))
     upstream_syn_count = int(request.POST.get('upstream_syn_count', -1 )) if fetch_upstream else -1
@@ -229,6 +504,16 @@ def fetch_synapses(request: HttpRequest, project_id=None):
     annotations = [a.strip() for a in get_request_list(request.POST, 'annotations', [])]
     tags = [a.strip() for a in get_request_list(request.POST, 'tags', [])]
 
+    score_thresholds = get_request_score_thresholds(request)
+
+    # Optional simplification of imported autoseg skeletons
+    simplify_tolerance = request.POST.get('simplify_tolerance',
+            getattr(settings, 'CIRCUITMAP_SIMPLIFY_TOLERANCE', None))
+    simplify_tolerance = None if simplify_tolerance in (None, '') else float(simplify_tolerance)
+    simplify_node_budget = request.POST.get('simplify_node_budget',
+            getattr(settings, 'CIRCUITMAP_SIMPLIFY_NODE_BUDGET', None))
+    simplify_node_budget = None if simplify_node_budget in (None, '') else int(simplify_node_budget)
+
     request_id = request.POST.get('request_id')
 
     pid = int(project_id)
@@ -240,18 +525,41 @@ def fetch_synapses(request: HttpRequest, project_id=None):
         'request_id': request_id,
     }
 
+    # Identical imports that are requested while one is running follow the
+    # running import, see coalescing.is_enabled().
+    coalesce = coalescing.is_enabled()
+    import_options = {
+        'fetch_upstream': fetch_upstream,
+        'fetch_downstream': fetch_downstream,
+        'upstream_syn_count': upstream_syn_count,
+        'downstream_syn_count': downstream_syn_count,
+        'distance_threshold': distance_threshold,
+        'with_autapses': with_autapses,
+        'incremental': incremental,
+        'preview': preview,
+        'annotations': tuple(annotations),
+        'tags': tuple(tags),
+        'score_thresholds': tuple(sorted(score_thresholds.items())),
+        'simplify_tolerance': simplify_tolerance,
+        'simplify_node_budget': simplify_node_budget,
+    }
+
+    task_options = get_task_options('interactive')
+
     # Create result entry (skeleton ID can be -1). We need to make sure the
     # SynapseImport model object is committed # to the DB, before we call the
     # async task that uses it.
     with transaction.atomic():
         synapse_import = SynapseImport.objects.create(user=request.user,
+                queue=get_queue_name(task_options),
                 project_id=pid, request_id=request_id,
                 skeleton_id=active_skeleton_id, status=SynapseImport.Status.QUEUED,
                 upstream_partner_syn_threshold=upstream_syn_count,
                 downsteam_partner_syn_threshold=downstream_syn_count,
                 distance_threshold=distance_threshold,
                 with_autapses=with_autapses, tags=tags,
-                annotations=annotations)
+                annotations=annotations, incremental=incremental,
+                preview=preview, **score_thresholds)
 
     status = dict()
     if active_skeleton_id == -1:
@@ -262,7 +570,7 @@ def fetch_synapses(request: HttpRequest, project_id=None):
 
         # look up segment id at location and fetch synapses
         try:
-            segment_id = int(cv[voxel_x,voxel_y,voxel_z,0][0][0][0][0])
+            segment_id = int(get_segment_lookup().lookup([[voxel_x, voxel_y, voxel_z]])[0])
         except Exception as ex:
             error_message = traceback.format_exc()
             task_logger.debug('Exception occurred: {}'.format(error_message))
@@ -274,25 +582,42 @@ def fetch_synapses(request: HttpRequest, project_id=None):
         else:
             task_logger.debug('no active skeleton')
             # We need to make sure the SynapseImport model object is committed
-            # to the DB, before we call the async task that uses it.
+            # to the DB, before we call the async task that uses it. Imports
+            # that follow another import need it too, in case they are
+            # started later.
             with transaction.atomic():
                 segment_import = SegmentImport.objects.create(
                         synapse_import=synapse_import, segment_id=segment_id,
                         source=CLOUDVOLUME_URL,
                         voxel_x=voxel_x, voxel_y=voxel_y, voxel_z=voxel_z,
-                        physical_x=x, physical_y=y, physical_z=z)
-
-
-            def run_import():
-                import_synapses_and_segment.delay(pid, request.user.id,
-                        synapse_import.id, segment_id, fetch_upstream,
-                        fetch_downstream, upstream_syn_count,
-                        downstream_syn_count, True, msg_payload, with_autapses,
-                        annotations, tags)
+                        physical_x=x, physical_y=y, physical_z=z,
+                        simplify_tolerance=simplify_tolerance,
+                        simplify_node_budget=simplify_node_budget)
+
+            task = import_synapses_and_segment.s(pid, request.user.id,
+                    synapse_import.id, segment_id, fetch_upstream,
+                    fetch_downstream, upstream_syn_count, downstream_syn_count,
+                    True, msg_payload, with_autapses, annotations, tags,
+                    preview).set(**task_options)
+
+            if coalesce:
+                inflight_key = coalescing.get_inflight_key(pid, 'segment',
+                        segment_id, import_options)
+                leader_id = coalescing.claim(inflight_key, synapse_import.id)
+                if leader_id is not None:
+                    task_logger.debug(f'Following running import {leader_id}')
+                    coalescing.follow(synapse_import, leader_id, inflight_key,
+                            task)
+                    return JsonResponse({
+                        'project_id': pid,
+                        'segment_id': str(segment_id),
+                        'import_ref': synapse_import.id,
+                        'coalesced_with': leader_id,
+                    })
 
             # This is run after the commit so that we can be sure all task
             # tracking objects have been created.
-            transaction.on_commit(run_import)
+            transaction.on_commit(task.apply_async)
 
             return JsonResponse({
                 'project_id': pid,
@@ -300,10 +625,29 @@ def fetch_synapses(request: HttpRequest, project_id=None):
                 'import_ref': synapse_import.id
             })
     else:
+        task = import_synapses_for_existing_skeleton.s(pid, request.user.id,
+                synapse_import.id, distance_threshold, active_skeleton_id,
+                None, True, msg_payload, with_autapses,
+                annotations=annotations, tags=tags,
+                preview=preview).set(**task_options)
+
+        if coalesce:
+            inflight_key = coalescing.get_inflight_key(pid, 'skeleton',
+                    active_skeleton_id, import_options)
+            leader_id = coalescing.claim(inflight_key, synapse_import.id)
+            if leader_id is not None:
+                task_logger.debug(f'Following running import {leader_id}')
+                coalescing.follow(synapse_import, leader_id, inflight_key,
+                        task)
+                return JsonResponse({
+                    'project_id': pid,
+                    'import_ref': synapse_import.id,
+                    'edition_time': synapse_import.edition_time,
+                    'coalesced_with': leader_id,
+                })
+
         # fetch synapses for manual skeleton
-        import_synapses_for_existing_skeleton.delay(pid, request.user.id,
-            synapse_import.id, distance_threshold, active_skeleton_id, None,
-            True, msg_payload, with_autapses, annotations=annotations, tags=tags)
+        task.apply_async()
 
         return JsonResponse({
             'project_id': pid,
@@ -312,53 +656,640 @@ def fetch_synapses(request: HttpRequest, project_id=None):
         })
 
 
+@api_view(['POST'])
+@transaction.non_atomic_requests
+def fetch_synapses_batch(request: HttpRequest, project_id=None):
+    """Import synapses for many existing skeletons in a single task. Skeletons
+    are passed in as list of IDs (skeleton_ids) and/or are all skeletons
+    modeling neurons with one of the annotations in annotated_with. Segment
+    look-ups and synaptic links are shared between all skeletons and all
+    results are written in one transaction. The returned import reference is a
+    parent import, one child import per skeleton is created.
+    """
+    pid = int(project_id)
+    skeleton_ids = get_request_list(request.POST, 'skeleton_ids', [], map_fn=int)
+    annotated_with = [a.strip() for a in get_request_list(request.POST, 'annotated_with', [])]
+    with_autapses = get_request_bool(request.POST, 'with_autapses', False)
+    preview = get_request_bool(request.POST, 'preview', False)
+    distance_threshold = int(request.POST.get('distance_threshold', 1000 ))
+    tags = [a.strip() for a in get_request_list(request.POST, 'tags', [])]
+    score_thresholds = get_request_score_thresholds(request)
+    request_id = request.POST.get('request_id')
+
+    if annotated_with:
+        skeleton_ids = skeleton_ids + get_annotated_skeleton_ids(
+                connection.cursor(), pid, annotated_with)
+    # Remove duplicates, but keep the order
+    skeleton_ids = list(dict.fromkeys(skeleton_ids))
+
+    if not skeleton_ids:
+        raise ValueError("Need at least one skeleton ID or annotation")
+
+    import_params = {
+        'user': request.user,
+        'project_id': pid,
+        'request_id': request_id,
+        'status': SynapseImport.Status.QUEUED,
+        'upstream_partner_syn_threshold': -1,
+        'downsteam_partner_syn_threshold': -1,
+        'distance_threshold': distance_threshold,
+        'with_autapses': with_autapses,
+        'tags': tags,
+        'preview': preview,
+    }
+    import_params.update(score_thresholds)
+    task_options = get_task_options('bulk')
+    import_params['queue'] = get_queue_name(task_options)
+
+    with transaction.atomic():
+        synapse_import = SynapseImport.objects.create(skeleton_id=-1,
+                **import_params)
+        SynapseImport.objects.bulk_create([SynapseImport(parent=synapse_import,
+                skeleton_id=skeleton_id, **import_params)
+                for skeleton_id in skeleton_ids])
+
+    msg_payload = {
+        'request_id': request_id,
+    }
+
+    def run_import():
+        import_synapses_for_skeletons.apply_async((pid, request.user.id,
+                synapse_import.id, True, msg_payload), **task_options)
+
+    # This is run after the commit so that we can be sure all task tracking
+    # objects have been created.
+    transaction.on_commit(run_import)
+
+    return JsonResponse({
+        'project_id': pid,
+        'import_ref': synapse_import.id,
+        'skeleton_ids': skeleton_ids,
+    })
+
+
 @shared_task(base=LoggingTask)
+@collects_timings
+def import_synapses_for_skeletons(project_id, user_id, import_id,
+        message_user=True, message_payload=None):
+    """Find and import all synapses for the skeletons of all child imports of
+    the passed in parent import. The segment look-up is done for all skeleton
+    nodes at once and links are retrieved only once for each group of
+    skeletons with overlapping bounding boxes, regardless of how many skeletons
+    overlap with a segment. All connectors and
+    links are written in a single transaction.
+    """
+    task_logger.debug('task: import_synapses_for_skeletons started')
+    error = None
+    start_time = timer()
+    n_connectors, n_links = 0, 0
+
+    synapse_import = SynapseImport.objects.get(id=import_id)
+    if synapse_import.status == SynapseImport.Status.CANCELLED:
+        task_logger.info(f'Import {import_id} was cancelled')
+        return
+    children = list(synapse_import.children.all().order_by('id'))
+    metrics.observe_queue_wait(synapse_import)
+    try:
+        synapse_import.status = SynapseImport.Status.COMPUTING
+        save_unless_cancelled(synapse_import, ['status'])
+        synapse_import.children.exclude(status=SynapseImport.Status.CANCELLED) \
+                .update(status=SynapseImport.Status.COMPUTING)
+
+        distance_threshold = synapse_import.distance_threshold
+        with_autapses = synapse_import.with_autapses
+        score_thresholds = synapse_import.get_score_thresholds()
+
+        cursor = connection.cursor()
+        trees = [get_skeleton_tree(cursor, project_id, child.skeleton_id)
+                for child in children]
+        task_logger.debug(f'Loaded {len(trees)} skeletons with {sum(map(len, trees))} nodes')
+
+        # accessing the most recent autoseg data
+        use_google_storage()
+        segment_sets = get_overlapping_segments_for_each(
+                [tree.locations for tree in trees])
+        all_segment_ids = set(chain.from_iterable(segment_sets))
+        task_logger.debug(f'Found {len(all_segment_ids)} distinct overlapping segments')
+
+        # Links are retrieved once for each group of skeletons with
+        # overlapping bounding boxes, constrained to the group's bounding box.
+        # Skeletons far apart therefore don't fetch the links in between.
+        if distance_threshold >= 0:
+            link_queries = [(set(chain.from_iterable(segment_sets[i] for i in indices)),
+                    bounding_box) for indices, bounding_box in cluster_bounding_boxes(
+                    [tree.bounding_box(distance_threshold) for tree in trees])]
+        else:
+            link_queries = [(all_segment_ids, None)]
+        pre_links, post_links = fetch_link_queries(cursor, link_queries,
+                score_thresholds)
+        # Links on the border of two bounding boxes are found twice.
+        pre_links = pre_links.drop_duplicates(subset='id')
+        post_links = post_links.drop_duplicates(subset='id')
+
+        plans = {}
+        for child, tree, segment_ids in zip(children, trees, segment_sets):
+            segment_list = list(segment_ids)
+            plan = compute_synapse_plan(cursor, tree,
+                    pre_links[pre_links['segmentid_pre'].isin(segment_list)],
+                    post_links[post_links['segmentid_post'].isin(segment_list)],
+                    distance_threshold, with_autapses)
+            plan['segment_ids'] = segment_ids
+            plans[child.skeleton_id] = plan
+
+        match_existing_connectors(cursor, project_id, plans)
+
+        txid = None
+        if not synapse_import.preview:
+            txid = insert_synapse_plans(cursor, project_id, plans,
+                    synapse_import.tags)
+
+        for child, tree in zip(children, trees):
+            plan = plans[child.skeleton_id]
+            child.status = SynapseImport.Status.DONE
+            child.status_detail = ""
+            child.runtime = timer() - start_time
+            if synapse_import.preview:
+                child.n_expected_connectors = len(plan['connectors'])
+                child.n_expected_links = len(plan['treenode_connector'])
+            else:
+                child.txid = txid
+                child.skeleton_edition_time = tree.version[1]
+                child.segment_ids = sorted(plan['segment_ids'])
+                child.n_imported_connectors = len(plan['connectors'])
+                child.n_imported_links = len(plan['treenode_connector'])
+            save_unless_cancelled(child, ['status', 'status_detail', 'runtime',
+                    'n_expected_connectors', 'n_expected_links', 'txid',
+                    'skeleton_edition_time', 'segment_ids',
+                    'n_imported_connectors', 'n_imported_links'])
+
+        n_connectors = len(set(chain.from_iterable(p['connectors'] for p in plans.values())))
+        n_links = sum(len(p['treenode_connector']) for p in plans.values())
+
+        synapse_import.status = SynapseImport.Status.DONE
+        synapse_import.status_detail = ""
+        synapse_import.runtime = timer() - start_time
+        if synapse_import.preview:
+            synapse_import.n_expected_connectors = n_connectors
+            synapse_import.n_expected_links = n_links
+        else:
+            synapse_import.txid = txid
+            synapse_import.n_imported_connectors = n_connectors
+            synapse_import.n_imported_links = n_links
+        save_unless_cancelled(synapse_import, ['status', 'status_detail',
+                'runtime', 'n_expected_connectors', 'n_expected_links', 'txid',
+                'n_imported_connectors', 'n_imported_links'])
+        task_logger.debug('task: import_synapses_for_skeletons: done')
+    except Exception as ex:
+        error_message = traceback.format_exc()
+        task_logger.error(f'Exception occurred: {error_message}')
+        error = ex
+        synapse_import.runtime = timer() - start_time
+        synapse_import.status = SynapseImport.Status.ERROR
+        synapse_import.status_detail = str(error)
+        save_unless_cancelled(synapse_import, ['runtime', 'status',
+                'status_detail'])
+        synapse_import.children.exclude(status__in=[SynapseImport.Status.DONE,
+                SynapseImport.Status.CANCELLED]).update(
+                status=SynapseImport.Status.ERROR, status_detail=str(error))
+
+    if message_user:
+        user = User.objects.get(pk=user_id)
+        msg = Message()
+        msg.user = user
+        msg.read = False
+        if error:
+            msg.title = f"Error while importing synapses for {len(children)} skeletons"
+            msg.text = f"No synapses could be created due to the following error: {error}"
+        elif synapse_import.preview:
+            msg.title = f"Synapse import preview for {len(children)} skeletons"
+            msg.text = (f"Importing would create {n_connectors} synapses (connector nodes) " +
+                f"and {n_links} links")
+        else:
+            msg.title = f"Synapses imported for {len(children)} skeletons"
+            msg.text = (f"Imported {n_connectors} synapses (connector nodes) " +
+                f"and created {n_links} links")
+        msg.action = ""
+        msg.save()
+
+        notify_user(user.id, msg.id, msg.title)
+
+        payload = {
+            'task': 'import-synapses-batch',
+            'n_inserted_synapses': n_connectors,
+            'n_inserted_links': n_links,
+            'skeleton_ids': [child.skeleton_id for child in children],
+            'preview': synapse_import.preview,
+        }
+        if error:
+            payload['error'] = str(error)
+        if message_payload:
+            payload.update(message_payload)
+        msg_user(user_id, 'circuitmap-update', payload)
+
+
+@shared_task(base=LoggingTask, acks_late=True, reject_on_worker_lost=True)
+@collects_timings
 def import_synapses_and_segment(project_id, user_id, import_id, segment_id,
         fetch_upstream, fetch_downstream, upstream_syn_count,
         downstream_syn_count, message_user=True, message_payload=None,
-        with_autapses=False, annotations=None, tags=None):
+        with_autapses=False, annotations=None, tags=None, preview=False):
 
     start_time = timer()
+    start_timestamp = time.time()
     task_logger.debug('task: import_synapses_and_segment')
     message_payload['task'] = 'import-location'
 
-    synapse_import = SynapseImport.objects.get(id=import_id)
-    synapse_import.status = SynapseImport.Status.COMPUTING
-    synapse_import.save()
-
-    task_logger.debug('call: import_autoseg_skeleton_with_synapses')
-    was_imported = import_autoseg_skeleton_with_synapses(project_id, user_id,
-            import_id, segment_id, False, message_payload, with_autapses,
-            set_status=True, annotations=annotations, tags=tags)
-
-    if was_imported:
-        task_logger.debug('call: import_upstream_downstream_partners')
-        import_upstream_downstream_partners(project_id, user_id, import_id,
-                segment_id, fetch_upstream, fetch_downstream, upstream_syn_count,
-                downstream_syn_count, False, message_payload, with_autapses,
-                annotations=annotations, tags=tags)
-        status = SynapseImport.Status.DONE
-    else:
-        task_logger.debug('no data found')
-        status = SynapseImport.Status.NO_DATA
+    # The import is released on all paths, unless it is handed off to other
+    # tasks, which then finish it.
+    handed_off = False
+    try:
+        # The task is run again if its worker dies. Completed stages are then
+        # skipped.
+        synapse_import = SynapseImport.objects.get(id=import_id)
+        if synapse_import.status == SynapseImport.Status.CANCELLED:
+            task_logger.info(f'Import {import_id} was cancelled')
+            return
+        metrics.observe_queue_wait(synapse_import)
+        SynapseImport.objects.filter(id=import_id) \
+                .exclude(status=SynapseImport.Status.CANCELLED) \
+                .update(status=SynapseImport.Status.COMPUTING)
+
+        if 'segment' in synapse_import.completed_stages:
+            task_logger.debug('Segment was imported before, resuming')
+            was_imported = True
+        else:
+            task_logger.debug('call: import_autoseg_skeleton_with_synapses')
+            was_imported = import_autoseg_skeleton_with_synapses(project_id,
+                    user_id, import_id, segment_id, False, message_payload,
+                    with_autapses, set_status=True, annotations=annotations,
+                    tags=tags, preview=preview)
+            if was_imported:
+                store_segment_timings(import_id)
+                complete_stage(import_id, 'segment')
+
+        # The import might have been cancelled while the segment was imported.
+        check_cancelled(import_id)
+
+        if was_imported and (fetch_upstream or fetch_downstream) and \
+                runs_partners_separately():
+            # Partners are imported by a task on the bulk queue, which also
+            # finishes this import.
+            task_options = get_task_options('bulk')
+            SynapseImport.objects.filter(id=import_id).update(
+                    queue=get_queue_name(task_options))
+            import_segment_partners.apply_async((project_id, user_id,
+                    import_id, segment_id, fetch_upstream, fetch_downstream,
+                    upstream_syn_count, downstream_syn_count, message_payload,
+                    with_autapses, annotations, tags, preview,
+                    start_timestamp), **task_options)
+            handed_off = True
+            return
+
+        if was_imported:
+            task_logger.debug('call: import_upstream_downstream_partners')
+            handed_off = import_upstream_downstream_partners(project_id,
+                    user_id, import_id, segment_id, fetch_upstream,
+                    fetch_downstream, upstream_syn_count, downstream_syn_count,
+                    False, message_payload, with_autapses,
+                    annotations=annotations, tags=tags, preview=preview,
+                    start_time=start_timestamp)
+            if handed_off:
+                task_logger.debug('task: import_synapses_and_segment: partner import continues in parallel')
+                return
+            status = SynapseImport.Status.DONE
+        else:
+            task_logger.debug('no data found')
+            status = SynapseImport.Status.NO_DATA
+
+        finish_segment_import(import_id, status, timer() - start_time)
+        task_logger.debug('task: import_synapses_and_segment: done')
+    except ImportCancelled:
+        task_logger.info(f'Import {import_id} was cancelled')
+    except Exception as ex:
+        task_logger.error(f'Exception occurred: {traceback.format_exc()}')
+        fail_segment_import(import_id, ex, timer() - start_time)
+        raise
+    finally:
+        if not handed_off:
+            coalescing.release(import_id)
 
-    synapse_import.refresh_from_db()
 
+def finish_segment_import(import_id, status, runtime):
+    """Set the final status and runtime of a segment import, unless it failed
+    or was cancelled. The import has to be released afterwards.
+    """
     # Only attempt to load import data after the processing is done to not
     # override the newly createad state.
     synapse_import = SynapseImport.objects.get(id=import_id)
-    if synapse_import.status != SynapseImport.Status.ERROR:
+    if synapse_import.status not in (SynapseImport.Status.ERROR,
+            SynapseImport.Status.CANCELLED):
         synapse_import.status = status
-    synapse_import.runtime = timer() - start_time
-    synapse_import.save()
-    task_logger.debug('task: import_synapses_and_segment: done')
+    synapse_import.runtime = runtime
+    synapse_import.save(update_fields=['status', 'runtime'])
+
+
+def fail_segment_import(import_id, error, runtime):
+    """Mark a segment import as failed with <error>, unless it was cancelled.
+    The import has to be released afterwards.
+    """
+    SynapseImport.objects.filter(id=import_id) \
+            .exclude(status=SynapseImport.Status.CANCELLED) \
+            .update(status=SynapseImport.Status.ERROR,
+                    status_detail=str(error), runtime=runtime)
+
+
+@shared_task(base=LoggingTask, acks_late=True, reject_on_worker_lost=True)
+@collects_timings
+def import_segment_partners(project_id, user_id, import_id, segment_id,
+        fetch_upstream, fetch_downstream, upstream_syn_count,
+        downstream_syn_count, message_payload=None, with_autapses=False,
+        annotations=None, tags=None, preview=False, start_time=None):
+    """Import the partners of an imported segment on the bulk queue and
+    finish the segment import.
+    """
+    task_logger.debug('task: import_segment_partners')
+    start_time = time.time() if start_time is None else start_time
+    fanned_out = False
+    try:
+        check_cancelled(import_id)
+        fanned_out = import_upstream_downstream_partners(project_id, user_id,
+                import_id, segment_id, fetch_upstream, fetch_downstream,
+                upstream_syn_count, downstream_syn_count, False,
+                message_payload, with_autapses, annotations=annotations,
+                tags=tags, preview=preview, start_time=start_time)
+        if not fanned_out:
+            finish_segment_import(import_id, SynapseImport.Status.DONE,
+                    time.time() - start_time)
+    except ImportCancelled:
+        task_logger.info(f'Import {import_id} was cancelled')
+    except Exception as ex:
+        task_logger.error(f'Exception occurred: {traceback.format_exc()}')
+        fail_segment_import(import_id, ex, time.time() - start_time)
+        raise
+    finally:
+        if not fanned_out:
+            coalescing.release(import_id)
+
+
+def get_imported_segment_skeletons(cursor, project_id, segment_ids):
+    """Return a dictionary mapping all passed in segments that have been
+    imported before to their skeleton ID, using a single query.
+    """
+    root_ids = dict((mapping_skel_nid(segment_id, 0, project_id), int(segment_id))
+            for segment_id in segment_ids)
+    cursor.execute("""
+        SELECT t.id, t.skeleton_id
+        FROM treenode t
+        WHERE t.project_id = %(project_id)s
+        AND t.id = ANY(%(root_ids)s::bigint[])
+    """, {
+        'project_id': int(project_id),
+        'root_ids': list(root_ids.keys()),
+    })
+    return dict((root_ids[node_id], skeleton_id)
+            for node_id, skeleton_id in cursor.fetchall())
+
+
+def import_partner_segments(project_id, user_id, synapse_import,
+        partner_segment_ids, with_autapses=False, annotations=None, tags=None):
+    """Import all passed in partner segments along with their synapses and
+    yield (segment ID, was imported) for each of them. Previously imported
+    segments are found with a single query and only get synapses attached.
+    Skeletons of new segments are downloaded in the background and imported
+    as soon as they are available.
+    """
+    cursor = connection.cursor()
+    existing_skeletons = get_imported_segment_skeletons(cursor, project_id,
+            partner_segment_ids)
+    task_logger.debug(f'{len(existing_skeletons)} of {len(partner_segment_ids)} partners were imported before')
+
+    segment_import = synapse_import.segmentimport_set.first()
+    score_thresholds = synapse_import.get_score_thresholds()
+    new_segment_ids = [s for s in partner_segment_ids
+            if int(s) not in existing_skeletons]
+
+    def download(segment_id):
+        with partner_timings(segment_id):
+            return segment_id, get_autoseg_skeleton(segment_id)
+
+    def prepare(downloaded):
+        segment_id, s1 = downloaded
+        with partner_timings(segment_id):
+            return s1, prepare_autoseg_skeleton(connection.cursor(), project_id,
+                    segment_id, s1, with_autapses, score_thresholds,
+                    segment_import, compute_plan=True)
+
+    # New skeletons are downloaded, converted and matched with synapses in
+    # background threads, while previous partners are written to the
+    # database.
+    pipeline = Pipeline([
+        Stage('download', download, getattr(settings,
+                'CIRCUITMAP_SKELETON_PREFETCH_WORKERS', 8)),
+        Stage('prepare', prepare, getattr(settings,
+                'CIRCUITMAP_PIPELINE_PREPARE_WORKERS', 2)),
+    ])
+    results = pipeline.run(new_segment_ids)
+    # The threads are stopped on all paths, including errors or a
+    # cancellation before the results are consumed.
+    try:
+        for partner_segment_id, skeleton_id in existing_skeletons.items():
+            with partner_timings(partner_segment_id):
+                import_synapses_for_existing_skeleton(project_id, user_id,
+                        synapse_import.id, -1, skeleton_id, partner_segment_id, False,
+                        with_autapses=with_autapses, set_status=False,
+                        annotations=annotations, tags=tags,
+                        synapse_import=synapse_import)
+            yield partner_segment_id, True
+
+        for partner_segment_id, result in results:
+            if isinstance(result, StageError):
+                # Let the import try again on its own
+                task_logger.error(f'Could not prepare segment {partner_segment_id} '
+                        f'in stage {result.stage}: {result.error}')
+                skeleton, prepared = None, None
+            else:
+                skeleton, prepared = result
+            with partner_timings(partner_segment_id):
+                was_imported = import_autoseg_skeleton_with_synapses(project_id,
+                        user_id, synapse_import.id, partner_segment_id, False,
+                        with_autapses=with_autapses, set_status=False,
+                        annotations=annotations, tags=tags, skeleton=skeleton,
+                        synapse_import=synapse_import, segment_import=segment_import,
+                        imported_before=False, prepared=prepared)
+            yield partner_segment_id, was_imported
+    finally:
+        pipeline.stop()
+
+    task_logger.debug(f'Partner pipeline stage timings: {dict(pipeline.timings)}')
+
+
+def fan_out_partner_imports(project_id, user_id, synapse_import, segment_id,
+        upstream_partners, downstream_partners, fetch_upstream,
+        fetch_downstream, message_user=True, message_payload=None,
+        with_autapses=False, annotations=None, tags=None, start_time=None):
+    """Import the passed in partners with a Celery chord of at most
+    CIRCUITMAP_PARTNER_FANOUT_CONCURRENCY (default: 8) tasks. Each task imports
+    a share of the partners one after another. Segments that are both
+    upstream and downstream partners are only imported by one task. The chord
+    callback finalizes the import.
+    """
+    directions = {}
+    for partner_segment_id in upstream_partners:
+        directions.setdefault(int(partner_segment_id), []).append('upstream')
+    for partner_segment_id in downstream_partners:
+        directions.setdefault(int(partner_segment_id), []).append('downstream')
+    partners = list(directions.items())
+
+    max_tasks = getattr(settings, 'CIRCUITMAP_PARTNER_FANOUT_CONCURRENCY', 8)
+    n_tasks = max(1, min(max_tasks, len(partners)))
+    chunks = [partners[i::n_tasks] for i in range(n_tasks)]
+    task_logger.debug(f'Importing {len(partners)} partners with {n_tasks} tasks')
+
+    synapse_import.status = SynapseImport.Status.FETCH_PRE_PARTNERS \
+            if upstream_partners else SynapseImport.Status.FETCH_POST_PARTNERS
+    if not save_unless_cancelled(synapse_import, ['status']):
+        # No tasks are started for a cancelled import, the caller releases it.
+        raise ImportCancelled(f'Import {synapse_import.id} was cancelled')
+
+    # If a chunk fails, the callback isn't run and its error callback
+    # finalizes the import instead.
+    task_options = get_task_options('bulk')
+    finalize_args = {
+        'project_id': project_id,
+        'user_id': user_id,
+        'import_id': synapse_import.id,
+        'segment_id': segment_id,
+        'fetch_upstream': fetch_upstream,
+        'fetch_downstream': fetch_downstream,
+        'message_user': message_user,
+        'message_payload': message_payload,
+        'start_time': start_time,
+    }
+    callback = finalize_partner_imports.s(**finalize_args).set(**task_options)
+    callback.link_error(fail_partner_imports.s(**finalize_args).set(**task_options))
+    chord(import_partner_segment_chunk.s(project_id, user_id,
+            synapse_import.id, chunk, with_autapses, annotations,
+            tags).set(**task_options) for chunk in chunks)(callback)
+
+
+@shared_task(base=LoggingTask, acks_late=True, reject_on_worker_lost=True)
+@collects_timings
+def import_partner_segment_chunk(project_id, user_id, import_id, partners,
+        with_autapses=False, annotations=None, tags=None):
+    """Import a list of (segment ID, directions) partners of a fanned out
+    partner import. The partner counters of the import are increased
+    atomically for each imported partner. Partners completed by an earlier
+    run of this task are skipped. Returns the number of partners this run
+    imported upstream and downstream. Errors mark the import as failed and are
+    raised again, so that the chord fails.
+    """
+    n_imported = {'upstream': 0, 'downstream': 0}
+    progress = None
+    try:
+        _, completed_partners = get_checkpoint(import_id)
+        directions = dict((int(s), d) for s, d in partners
+                if int(s) not in completed_partners)
+        synapse_import = SynapseImport.objects.get(id=import_id)
+        progress = ImportProgress(import_id, user_id, {
+            'request_id': synapse_import.request_id,
+        })
+        check_cancelled(import_id)
+        for partner_segment_id, was_imported in import_partner_segments(
+                project_id, user_id, synapse_import, list(directions.keys()),
+                with_autapses, annotations, tags):
+            if was_imported:
+                for direction in directions[int(partner_segment_id)]:
+                    n_imported[direction] += 1
+                    progress.increment(**{f'n_{direction}_partners': 1})
+            progress.complete_partner(partner_segment_id)
+            check_cancelled(import_id)
+    except ImportCancelled:
+        task_logger.info(f'Import {import_id} was cancelled')
+    except Exception as ex:
+        task_logger.error(f'Exception in partner import: {traceback.format_exc()}')
+        SynapseImport.objects.filter(id=import_id) \
+                .exclude(status=SynapseImport.Status.CANCELLED) \
+                .update(status=SynapseImport.Status.ERROR,
+                        status_detail=str(ex))
+        raise
+    finally:
+        if progress is not None:
+            progress.flush()
+    return n_imported
+
+
+def get_partner_counts(import_id):
+    """Return the number of imported upstream and downstream partners of an
+    import as stored in the database. Tasks that were run again skip
+    completed partners, their own counts are therefore incomplete.
+    """
+    return SynapseImport.objects.values_list('n_upstream_partners',
+            'n_downstream_partners').get(id=import_id)
+
+
+@shared_task(base=LoggingTask)
+def finalize_partner_imports(results, project_id, user_id, import_id,
+        segment_id, fetch_upstream, fetch_downstream, message_user=True,
+        message_payload=None, start_time=None):
+    """Chord callback of fanned out partner imports: mark the import as done
+    and inform the user. Partner counts are read from the import, <results>
+    of chunks that were run again don't include partners completed before.
+    """
+    synapse_import = SynapseImport.objects.get(id=import_id)
+    if synapse_import.status not in (SynapseImport.Status.ERROR,
+            SynapseImport.Status.CANCELLED):
+        synapse_import.status = SynapseImport.Status.DONE
+    if start_time is not None:
+        synapse_import.runtime = time.time() - start_time
+    synapse_import.save(update_fields=['status', 'runtime'])
+    coalescing.release(import_id)
+
+    n_upstream_partners, n_downstream_partners = get_partner_counts(import_id)
+    notify_partner_import(project_id, user_id, segment_id, fetch_upstream,
+            fetch_downstream, n_upstream_partners, n_downstream_partners,
+            message_user, message_payload)
+
+
+@shared_task(base=LoggingTask)
+def fail_partner_imports(task_id, *, project_id, user_id, import_id,
+        segment_id, fetch_upstream, fetch_downstream, message_user=True,
+        message_payload=None, start_time=None):
+    """Error callback of fanned out partner imports, called with the ID of
+    the chord callback if a chunk failed: mark the import as failed and
+    inform the user. Parameters are keyword-only, so that Celery passes only
+    the task ID instead of the request and exception.
+    """
+    task_logger.error(f'Partner import of import {import_id} failed')
+    synapse_import = SynapseImport.objects.get(id=import_id)
+    if synapse_import.status not in (SynapseImport.Status.ERROR,
+            SynapseImport.Status.CANCELLED):
+        synapse_import.status = SynapseImport.Status.ERROR
+        synapse_import.status_detail = 'Partner import failed'
+    if start_time is not None:
+        synapse_import.runtime = time.time() - start_time
+    save_unless_cancelled(synapse_import, ['status', 'status_detail', 'runtime'])
+    coalescing.release(import_id)
+
+    n_upstream_partners, n_downstream_partners = get_partner_counts(import_id)
+    notify_partner_import(project_id, user_id, segment_id, fetch_upstream,
+            fetch_downstream, n_upstream_partners, n_downstream_partners,
+            message_user, message_payload,
+            error=synapse_import.status_detail or 'Partner import failed')
+
 
 @shared_task()
+@collects_timings
 def import_upstream_downstream_partners(project_id, user_id, import_id, segment_id,
         fetch_upstream, fetch_downstream, upstream_syn_count,
         downstream_syn_count, message_user=True, message_payload=None,
-        with_autapses=False, annotations=None, tags=None):
-    error = None
+        with_autapses=False, annotations=None, tags=None, preview=False,
+        start_time=None):
+    """Import the upstream and/or downstream partners of the passed in
+    segment. Returns True if the import was handed off to parallel partner
+    tasks (CIRCUITMAP_PARTNER_FANOUT), which then also finalize the import.
+    Otherwise the calling task finalizes and releases the import, also if
+    this raises an exception.
+    """
     n_upstream_partners = 0
     n_downstream_partners = 0
     task_logger.info(f'task: import_upstream_downstream_partners start {segment_id}')
@@ -371,10 +1302,16 @@ def import_upstream_downstream_partners(project_id, user_id, import_id, segment_
         task_logger.error("Need existing skeleton ID for partner import")
         raise ValueError("Need existing skeleton ID for partner import")
 
-    task_logger.debug('load subgraph')
-    g = load_subgraph(cur, segment_id)
-
-    update_step = 5
+    # The partner graph of a preview is cached for the actual import.
+    score_thresholds = synapse_import.get_score_thresholds()
+    subgraph_key = get_plan_key('subgraph', project_id, segment_id, None, -1,
+            False, score_thresholds)
+    g = cache.get(subgraph_key)
+    if g is None:
+        task_logger.debug('load subgraph')
+        g = load_subgraph(cur, segment_id, score_thresholds=score_thresholds)
+        if preview:
+            cache_plan(subgraph_key, g)
 
     task_logger.debug(f'start fetching with graph size {len(g)}...')
 
@@ -391,57 +1328,85 @@ def import_upstream_downstream_partners(project_id, user_id, import_id, segment_
             downstream_partners = get_postsynaptic_skeletons(g, segment_id,
                     synaptic_count_threshold = downstream_syn_count)
             synapse_import.n_expected_downstream_partners = len(downstream_partners)
-        synapse_import.save()
+        synapse_import.save(update_fields=['n_expected_upstream_partners',
+                'n_expected_downstream_partners'])
+
+    if preview:
+        task_logger.debug('Preview only, no partners are imported')
+        return False
+
+    # Optionally, partners are imported by multiple tasks in parallel, which
+    # also finalize this import.
+    if getattr(settings, 'CIRCUITMAP_PARTNER_FANOUT', False) and \
+            (fetch_upstream_partners or fetch_downstream_partners):
+        fan_out_partner_imports(project_id, user_id, synapse_import, segment_id,
+                upstream_partners if fetch_upstream_partners else [],
+                downstream_partners if fetch_downstream_partners else [],
+                fetch_upstream, fetch_downstream, message_user,
+                message_payload, with_autapses, annotations, tags, start_time)
+        return True
+
+    # Partner counts and status changes are written with throttled updates
+    # of only the changed fields and pushed to the user.
+    progress = ImportProgress(import_id, user_id, message_payload)
+
+    def import_partners(direction, partners, status):
+        # Each direction is a stage of the import. If the task is run again,
+        # completed stages and partners are skipped.
+        field = f'n_{direction}_partners'
+        completed_stages, completed_partners = get_checkpoint(import_id)
+        n_imported = SynapseImport.objects.values_list(field, flat=True) \
+                .get(id=import_id) if completed_partners else 0
+        if direction in completed_stages:
+            return n_imported
+
+        progress.set_status(status)
+        remaining_partners = [p for p in partners
+                if int(p) not in completed_partners]
+        # Progress is written on all paths, so that the checkpoint matches
+        # the imported partners when the calling task fails or is cancelled.
+        try:
+            for partner_segment_id, was_imported in import_partner_segments(
+                    project_id, user_id, synapse_import, remaining_partners,
+                    with_autapses, annotations, tags):
+                task_logger.debug(f'imported {direction} segment with id {partner_segment_id}')
+                if was_imported:
+                    n_imported += 1
+                    progress.set(**{field: n_imported})
+                progress.complete_partner(partner_segment_id)
+                check_cancelled(import_id)
+        finally:
+            progress.flush()
+        complete_stage(import_id, direction)
+        return n_imported
 
     n_upstream_partners = 0
     if fetch_upstream_partners:
         task_logger.debug(f'fetching upstream partners: {upstream_partners}')
-        synapse_import.status = SynapseImport.Status.FETCH_PRE_PARTNERS
-        synapse_import.save()
-
-        last_update = 0
-        for partner_segment_id in upstream_partners:
-            task_logger.debug(f'importing presynaptic segment with id {partner_segment_id}')
-            was_imported = import_autoseg_skeleton_with_synapses(project_id, user_id,
-                    import_id, partner_segment_id, False,
-                    with_autapses=with_autapses, set_status=False,
-                    annotations=annotations, tags=tags)
-            if was_imported:
-                n_upstream_partners += 1
-            if n_upstream_partners // update_step > last_update:
-                last_update += 1
-                synapse_import.n_upstream_partners = n_upstream_partners
-                synapse_import.save()
-            task_logger.debug('done')
+        n_upstream_partners = import_partners('upstream', upstream_partners,
+                SynapseImport.Status.FETCH_PRE_PARTNERS)
 
     n_downstream_partners = 0
     if fetch_downstream_partners:
         task_logger.debug(f'fetching downstream partners: {downstream_partners}')
-        synapse_import.status = SynapseImport.Status.FETCH_POST_PARTNERS
-        synapse_import.save()
-        last_update = 0
-        for partner_segment_id in downstream_partners:
-            task_logger.debug(f'importing postsynaptic segment with id {partner_segment_id}')
-            was_imported = import_autoseg_skeleton_with_synapses(project_id, user_id,
-                    import_id, partner_segment_id, False,
-                    with_autapses=with_autapses, set_status=False,
-                    annotations=annotations, tags=tags)
-            if was_imported:
-                n_downstream_partners += 1
-            if n_downstream_partners // update_step > last_update:
-                last_update += 1
-                synapse_import.n_downstream_partners = n_downstream_partners
-                synapse_import.save()
-            task_logger.debug('done')
-
-    # Update status for this import task
-    if n_downstream_partners + n_upstream_partners > 0:
-        synapse_import.n_upstream_partners = n_upstream_partners
-        synapse_import.n_downstream_partners = n_downstream_partners
-        synapse_import.save()
+        n_downstream_partners = import_partners('downstream',
+                downstream_partners, SynapseImport.Status.FETCH_POST_PARTNERS)
+
+    notify_partner_import(project_id, user_id, segment_id, fetch_upstream,
+            fetch_downstream, n_upstream_partners, n_downstream_partners,
+            message_user, message_payload)
 
+    return False
+
+
+def notify_partner_import(project_id, user_id, segment_id, fetch_upstream,
+        fetch_downstream, n_upstream_partners, n_downstream_partners,
+        message_user=True, message_payload=None, error=None):
+    """Inform the user about the result of a partner import, which failed
+    with <error>, if passed in.
+    """
     try:
-        if message_user:
+        if message_user and error is None:
             payload = {
                 'task': 'import-partner-fragments',
                 'segment_id': segment_id,
@@ -494,14 +1459,475 @@ def import_upstream_downstream_partners(project_id, user_id, import_id, segment_
         msg_user(user_id, 'circuitmap-update', payload)
 
 
+def get_plan_key(kind, project_id, object_id, version, distance_threshold,
+        with_autapses, score_thresholds):
+    """Return a cache key for the import plan of an existing skeleton (kind
+    "skeleton") or a not yet imported segment (kind "segment") with the passed
+    in import parameters. For skeletons, <version> has to identify the skeleton
+    state the plan is computed for.
+    """
+    key = repr((kind, int(project_id), int(object_id), version,
+            int(distance_threshold), bool(with_autapses),
+            sorted(score_thresholds.items())))
+    return 'circuitmap-plan-' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cache_plan(key, plan):
+    """Store an import plan so that a later import with the same inputs can
+    reuse it.
+    """
+    cache.set(key, plan, getattr(settings, 'CIRCUITMAP_PLAN_CACHE_TIMEOUT', 3600))
+
+
+def get_segment_plan(cursor, project_id, segment_id, rows, with_autapses,
+        score_thresholds, cache_result=False):
+    """Return the import plan for a not yet imported autoseg skeleton with the
+    passed in treenode rows (see autoseg_skeleton_to_rows()). Node IDs are
+    deterministic, which allows cached plans, e.g. of previews, to be reused
+    for the actual import.
+    """
+    plan_key = get_plan_key('segment', project_id, segment_id, None, -1,
+            with_autapses, score_thresholds)
+    plan = cache.get(plan_key)
+    metrics.inc('circuitmap_cache_requests_total', cache='plan',
+            result='miss' if plan is None else 'hit')
+    if plan is None:
+        with measure('kdtree', nodes=len(rows['id'])):
+            tree = SkeletonTree(rows['id'], rows['location'])
+        pre_links, post_links = fetch_link_queries(cursor,
+                [(set([int(segment_id)]), None)], score_thresholds)
+        plan = compute_synapse_plan(cursor, tree, pre_links, post_links, -1,
+                with_autapses)
+        plan['segment_ids'] = set([int(segment_id)])
+        if cache_result:
+            cache_plan(plan_key, plan)
+    return plan
+
+
+def prepare_autoseg_skeleton(cursor, project_id, segment_id, s1,
+        with_autapses, score_thresholds, segment_import, compute_plan=False):
+    """Convert the autoseg skeleton <s1> into treenode rows and simplify them
+    according to <segment_import>. Returns the rows along with the import plan
+    for the skeleton's synapses. The plan is only computed if <compute_plan>
+    is true or if it is needed for the simplification, otherwise a cached plan
+    or None is returned.
+    """
+    rows = autoseg_skeleton_to_rows(s1, segment_id, project_id)
+
+    tolerance = segment_import.simplify_tolerance if segment_import else None
+    node_budget = segment_import.simplify_node_budget if segment_import else None
+    simplify = tolerance is not None or node_budget is not None
+    if compute_plan or simplify:
+        plan = get_segment_plan(cursor, project_id, segment_id, rows,
+                with_autapses, score_thresholds)
+    else:
+        # A preview of this import might have computed the synapses of the
+        # new skeleton already.
+        plan = cache.get(get_plan_key('segment', project_id, segment_id,
+                None, -1, with_autapses, score_thresholds))
+
+    if simplify:
+        # Nodes synapses attach to are kept during simplification, which
+        # requires the synapses to be known first.
+        n_vertices = len(rows['id'])
+        rows = simplify_skeleton_rows(rows, tolerance, node_budget,
+                set(t for t, _ in plan['treenode_connector']))
+        task_logger.debug(f'Simplified skeleton from {n_vertices} to {len(rows["id"])} nodes')
+
+    return rows, plan
+
+
+def _connector_location(link):
+    """Return the location of a connector for the passed in link."""
+    return {
+        'pre_x': float(link['pre_x']),
+        'pre_y': float(link['pre_y']),
+        'pre_z': float(link['pre_z']),
+    }
+
+
+def fetch_link_queries(cursor, link_queries, score_thresholds=None):
+    """Retrieve the synaptic links for each (segment IDs, bounding box) tuple
+    in <link_queries>. Returns a data frame of presynaptic and one of
+    postsynaptic links.
+    """
+    all_pre_links = []
+    all_post_links = []
+
+    # retrieve synaptic links for each group of autoseg segments
+    task_logger.debug('Iterating overlapping segments')
+    for segment_ids, bounding_box in link_queries:
+        if not segment_ids:
+            continue
+        task_logger.debug(f'Process {len(segment_ids)} segments')
+        all_pre_links.append(get_links_for_segments(cursor, segment_ids,
+                'segmentid_pre', bounding_box, score_thresholds))
+        all_post_links.append(get_links_for_segments(cursor, segment_ids,
+                'segmentid_post', bounding_box, score_thresholds))
+
+    all_pre_links_concat = pd.concat(all_pre_links) if all_pre_links \
+            else pd.DataFrame(columns=cols)
+    all_post_links_concat = pd.concat(all_post_links) if all_post_links \
+            else pd.DataFrame(columns=cols)
+
+    return all_pre_links_concat, all_post_links_concat
+
+
+@measure('filtering')
+def compute_synapse_plan(cursor, tree, all_pre_links_concat,
+        all_post_links_concat, distance_threshold, with_autapses,
+        existing_links=None):
+    """Find all synaptic links in the passed in pre and post link data frames
+    (see fetch_link_queries()) that can be attached to the skeleton represented
+    by <tree>. Links in <existing_links>, a set of (connector ID, relation
+    name) tuples, are skipped. No data is written. Returns a plan dictionary
+    with the connectors to create (by connector ID) and the links to create (by
+    treenode ID and connector ID).
+    """
+    connectors = {}
+    treenode_connector = {}
+
+    task_logger.debug(f'Total nr prelinks collected: {len(all_pre_links_concat)}')
+    task_logger.debug(f'Total nr postlinks collected: {len(all_post_links_concat)}')
+
+    # for all pre/post links, if clust_con_offset > 0, retrieve the respective
+    # links and use the presynaptic location as representative location for the link
+    tmp_list = all_pre_links_concat[all_pre_links_concat['clust_con_offset']>0]['clust_con_offset'].tolist()
+    if len(tmp_list) == 0:
+        all_pre_links_concat_remap_connector = None
+    else:
+        all_pre_links_concat_remap_connector = get_links_from_offset(cursor, tmp_list).set_index('offset')
+        task_logger.debug(f'Total # representative prelinks collected: {len(all_pre_links_concat_remap_connector)}')
+
+    tmp_list = all_post_links_concat[all_post_links_concat['clust_con_offset']>0]['clust_con_offset'].tolist()
+    if len(tmp_list) == 0:
+        all_post_links_concat_remap_connector = None
+    else:
+        all_post_links_concat_remap_connector = get_links_from_offset(cursor, tmp_list).set_index('offset')
+        task_logger.debug(f'Total # representative postlinks collected: {len(all_post_links_concat_remap_connector)}')
+
+    # Faciltate autapse checking
+    seen_skeleton_connectors = set()
+
+    if len(all_pre_links_concat) > 0:
+        task_logger.debug('Find closest distances to skeleton for pre')
+        all_pre_links_concat = match_links_to_tree(tree, all_pre_links_concat,
+                ['pre_x', 'pre_y', 'pre_z'], distance_threshold)
+        task_logger.debug(f'{len(all_pre_links_concat)} prelinks are within distance threshold')
+
+        seen_treenode_links = set()
+        seen_connector_links = dict()
+
+        # Iterate over all presynaptic links found for the current skeleton.
+        for idx, r in all_pre_links_concat.iterrows():
+            # skip selflinks, if no autapses are wanted
+            if not with_autapses and r['segmentid_pre'] == r['segmentid_post']:
+                continue
+            # Prevent duplicates treenode references in pre-segment
+            link_id = (r['segmentid_pre'], r['skeleton_node_id_index'])
+            if link_id in seen_treenode_links:
+                continue
+            seen_treenode_links.add(link_id)
+
+            treenode_id = int(r['treenode_id'])
+
+            # if representative presynaptic location found, use it
+            if r['clust_con_offset'] > 0 and not all_pre_links_concat_remap_connector is None:
+                l = all_pre_links_concat_remap_connector.loc[r['clust_con_offset']]
+                connector_id = CONNECTORID_OFFSET + int(r['clust_con_offset']) * 10
+                task_logger.debug(f'found representative connector (prelink) {connector_id} for treenode {treenode_id} of {r["segmentid_pre"]} to {r["segmentid_post"]}')
+                if not connector_id in connectors:
+                    connectors[connector_id] = _connector_location(l)
+            else:
+                # otherwise, use presynaptic location of link instead
+                connector_id = CONNECTORID_OFFSET + int(r['offset']) * 10
+                if not connector_id in connectors:
+                    connectors[connector_id] = _connector_location(r)
+
+            # Prevent duplicate links from pre-fragment to selected
+            # connector.
+            connector_link_id = (r['segmentid_pre'], connector_id)
+            existing_link_data = seen_connector_links.get(connector_link_id)
+            if existing_link_data is None or existing_link_data[2] > r['dist2']:
+                seen_connector_links[connector_link_id] = (treenode_id, connector_id, r['dist2'])
+
+            # remember skeleton link
+            if not with_autapses:
+                seen_skeleton_connectors.add(connector_id)
+
+        # Mark all final pre link sites to be stored in the database
+        for treenode_id, connector_id, _ in seen_connector_links.values():
+            if existing_links and (connector_id, 'presynaptic_to') in existing_links:
+                continue
+            task_logger.debug(f'Marking link from treenode {treenode_id} to connector {connector_id} for import')
+            treenode_connector[(treenode_id, connector_id)] = {'type': 'presynaptic_to'}
+
+    if len(all_post_links_concat) > 0:
+        task_logger.debug('find closest distances to skeleton for post')
+        all_post_links_concat = match_links_to_tree(tree, all_post_links_concat,
+                ['post_x', 'post_y', 'post_z'], distance_threshold)
+        task_logger.debug(f'{len(all_post_links_concat)} postlinks are within distance threshold')
+
+        seen_treenode_links = set()
+        seen_connector_links = dict()
+
+        for idx, r in all_post_links_concat.iterrows():
+            if r['segmentid_pre'] == r['segmentid_post']:
+                # skip selflinks
+                continue
+            # Prevent duplicates treenode references in pre-segment
+            link_id = (r['segmentid_post'], r['skeleton_node_id_index'])
+            if link_id in seen_treenode_links:
+                continue
+            seen_treenode_links.add(link_id)
+
+            treenode_id = int(r['treenode_id'])
+
+            # if representative presynaptic location found, use it
+            if r['clust_con_offset'] > 0 and not all_post_links_concat_remap_connector is None:
+                l = all_post_links_concat_remap_connector.loc[r['clust_con_offset']]
+                connector_id = CONNECTORID_OFFSET + int(r['clust_con_offset']) * 10
+                task_logger.debug(f'found representative connector (postlink) {connector_id} for treenode {treenode_id} of {r["segmentid_pre"]} to {r["segmentid_post"]}')
+                if not connector_id in connectors:
+                    connectors[connector_id] = _connector_location(l)
+            else:
+                connector_id = CONNECTORID_OFFSET + int(r['offset']) * 10
+                if not connector_id in connectors:
+                    connectors[connector_id] = _connector_location(r)
+            # skip post links that form autapses
+            if connector_id in seen_skeleton_connectors:
+                task_logger.debug(f'skipping autapse: {connector_id}')
+                continue
+
+            # Prevent duplicate links from selected connector to post-fragment
+            connector_link_id = (r['segmentid_post'], connector_id)
+            existing_link_data = seen_connector_links.get(connector_link_id)
+            if existing_link_data is None or existing_link_data[2] > r['dist2']:
+                seen_connector_links[connector_link_id] = (treenode_id, connector_id, r['dist2'])
+
+        # Mark all final post link sites to be stored in the database
+        for treenode_id, connector_id, _ in seen_connector_links.values():
+            if existing_links and (connector_id, 'postsynaptic_to') in existing_links:
+                continue
+            task_logger.debug(f'Marking link from connector {connector_id} to treenode {treenode_id} for import')
+            treenode_connector[(treenode_id, connector_id)] = {'type': 'postsynaptic_to'}
+
+    # Without an existing link to it, there is no need to create a
+    # connector during an incremental import.
+    if existing_links is not None:
+        linked_connectors = set(c for _, c in treenode_connector)
+        connectors = dict((c, r) for c, r in connectors.items()
+                if c in linked_connectors)
+
+    return {
+        'connectors': connectors,
+        'treenode_connector': treenode_connector,
+    }
+
+
+def match_existing_connectors(cursor, project_id, plans, radius=None):
+    """Replace planned connectors with existing, not imported connectors of the
+    project within <radius> (default: CIRCUITMAP_CONNECTOR_MATCH_RADIUS), e.g.
+    manually placed ones at the same synapse. All planned connectors of the
+    passed in dictionary of plans (by skeleton ID) are matched in a single
+    spatial query. Planned connectors that exist already aren't replaced. The
+    plans are updated in place, matched connectors are removed from the
+    connectors to create and their links are attached to the closest existing
+    connector instead. Returns a dictionary mapping replaced to existing
+    connector IDs.
+    """
+    if radius is None:
+        radius = getattr(settings, 'CIRCUITMAP_CONNECTOR_MATCH_RADIUS', 0)
+    connectors = {}
+    for plan in plans.values():
+        connectors.update(plan['connectors'])
+    if radius <= 0 or not connectors:
+        return {}
+
+    connector_ids = list(connectors.keys())
+    cursor.execute("""
+        SELECT c.id, ec.id
+        FROM UNNEST(%(connector_ids)s::bigint[], %(x)s::real[], %(y)s::real[],
+            %(z)s::real[]) c(id, x, y, z)
+        CROSS JOIN LATERAL (
+            SELECT cg.id
+            FROM connector_geom cg
+            WHERE cg.project_id = %(project_id)s
+            AND cg.id < %(min_imported_id)s
+            AND cg.geom &&& ST_3DMakeBox(
+                ST_MakePoint(c.x - %(radius)s, c.y - %(radius)s, c.z - %(radius)s),
+                ST_MakePoint(c.x + %(radius)s, c.y + %(radius)s, c.z + %(radius)s))
+            AND ST_3DDWithin(cg.geom, ST_MakePoint(c.x, c.y, c.z), %(radius)s)
+            ORDER BY ST_3DDistance(cg.geom, ST_MakePoint(c.x, c.y, c.z))
+            LIMIT 1
+        ) ec
+        WHERE NOT EXISTS (
+            SELECT 1 FROM connector
+            WHERE id = c.id
+        )
+    """, {
+        'project_id': project_id,
+        'radius': float(radius),
+        'min_imported_id': CONNECTORID_OFFSET,
+        'connector_ids': connector_ids,
+        'x': [connectors[c]['pre_x'] for c in connector_ids],
+        'y': [connectors[c]['pre_y'] for c in connector_ids],
+        'z': [connectors[c]['pre_z'] for c in connector_ids],
+    })
+    matches = dict(cursor.fetchall())
+    task_logger.debug(f'Matched {len(matches)} of {len(connectors)} connectors to existing connectors')
+    if not matches:
+        return matches
+
+    for plan in plans.values():
+        plan['connectors'] = dict((c, l) for c, l in plan['connectors'].items()
+                if c not in matches)
+        treenode_connector = {}
+        for (treenode_id, connector_id), val in plan['treenode_connector'].items():
+            treenode_connector[(treenode_id, matches.get(connector_id, connector_id))] = val
+        plan['treenode_connector'] = treenode_connector
+
+    return matches
+
+
+def insert_synapse_plan(cursor, project_id, skeleton_id, plan, tags=None):
+    """Create the connectors and links of an import plan (see
+    compute_synapse_plan()) for the passed in skeleton and add <tags> to the
+    connectors. Returns the ID of the transaction that performed the import.
+    """
+    return insert_synapse_plans(cursor, project_id, {skeleton_id: plan}, tags)
+
+
+@measure('link_write')
+def insert_synapse_plans(cursor, project_id, plans, tags=None):
+    """Create the connectors and links of multiple import plans, passed in as
+    dictionary mapping skeleton IDs to plans, in one transaction. Connectors
+    shared between plans are only created once. Returns the ID of the
+    transaction that performed the import.
+    """
+    connectors = {}
+    link_skeleton_ids, link_treenode_ids, link_connector_ids, link_relation_ids = [], [], [], []
+    for skeleton_id, plan in plans.items():
+        connectors.update(plan['connectors'])
+        for (treenode_id, connector_id), val in plan['treenode_connector'].items():
+            link_skeleton_ids.append(int(skeleton_id))
+            link_treenode_ids.append(int(treenode_id))
+            link_connector_ids.append(int(connector_id))
+            link_relation_ids.append(get_relation_id(cursor, project_id, val['type']))
+
+    # TODO: optimize based on scores
+    confidence_value = 5
+
+    with transaction.atomic():
+        # insert connectors
+        task_logger.debug(f'Inserting {len(connectors)} connectors')
+        connector_ids = list(connectors.keys())
+        cursor.execute("""
+            INSERT INTO connector (id, user_id, editor_id, project_id,
+                location_x, location_y, location_z)
+            SELECT c.id, %(user_id)s, %(user_id)s, %(project_id)s, c.x, c.y, c.z
+            FROM UNNEST(%(connector_ids)s::bigint[], %(x)s::int[],
+                %(y)s::int[], %(z)s::int[]) c(id, x, y, z)
+            ON CONFLICT (id) DO NOTHING
+        """, {
+            'project_id': project_id,
+            'user_id': DEFAULT_IMPORT_USER,
+            'connector_ids': connector_ids,
+            'x': [int(connectors[c]['pre_x']) for c in connector_ids],
+            'y': [int(connectors[c]['pre_y']) for c in connector_ids],
+            'z': [int(connectors[c]['pre_z']) for c in connector_ids],
+        })
+        n_written_connectors = cursor.rowcount
+
+        # insert links
+        task_logger.debug(f'Inserting {len(link_treenode_ids)} synaptic links')
+        cursor.execute("""
+            INSERT INTO treenode_connector (user_id, project_id, treenode_id,
+                connector_id, relation_id, skeleton_id, confidence)
+            SELECT %(user_id)s, %(project_id)s, l.treenode_id, l.connector_id,
+                l.relation_id, l.skeleton_id, %(confidence)s
+            FROM UNNEST(%(skeleton_ids)s::bigint[], %(treenode_ids)s::bigint[],
+                %(connector_ids)s::bigint[], %(relation_ids)s::bigint[])
+                l(skeleton_id, treenode_id, connector_id, relation_id)
+            ON CONFLICT ON CONSTRAINT treenode_connector_project_id_treenode_id_connector_id_relation DO NOTHING
+        """, {
+            'project_id': project_id,
+            'user_id': DEFAULT_IMPORT_USER,
+            'confidence': confidence_value,
+            'skeleton_ids': link_skeleton_ids,
+            'treenode_ids': link_treenode_ids,
+            'connector_ids': link_connector_ids,
+            'relation_ids': link_relation_ids,
+        })
+        n_written_links = cursor.rowcount
+        task_logger.debug('Inserting done')
+
+        # Remember the transaction that did the actual import
+        cursor.execute('SELECT txid_current()')
+        txid = cursor.fetchone()[0]
+
+    metrics.inc('circuitmap_rows_written_total', n_written_connectors,
+            table='connector')
+    metrics.inc('circuitmap_rows_written_total', n_written_links,
+            table='treenode_connector')
+
+    # add tags to connectors
+    if tags:
+        task_logger.debug('Add tags')
+        cursor.execute("""
+            WITH insert_missing_labels AS (
+                INSERT INTO class_instance (user_id, project_id, class_id, name)
+                SELECT %(user_id)s, %(project_id)s, %(label_class_id)s, label.name
+                FROM UNNEST(%(label_names)s::text[]) label(name)
+                LEFT JOIN LATERAL(
+                    SELECT id FROM class_instance ci
+                    WHERE ci.name = label.name
+                    AND ci.project_id = %(project_id)s
+                    AND ci.class_id = %(label_class_id)s
+                ) ci ON TRUE
+                WHERE ci.id IS NULL
+            )
+            INSERT INTO connector_class_instance
+                (user_id, project_id, relation_id, connector_id, class_instance_id)
+            SELECT %(user_id)s, %(project_id)s, %(labeled_as_id)s, c.id, ci.id
+            FROM UNNEST(%(label_names)s::text[]) label(name)
+            JOIN LATERAL (
+                SELECT id FROM class_instance ci
+                WHERE ci.name = label.name
+                AND ci.project_id = %(project_id)s
+                AND ci.class_id = %(label_class_id)s
+            ) ci ON TRUE
+            CROSS JOIN UNNEST(%(connector_ids)s::bigint[]) c(id)
+        """, {
+            'project_id': project_id,
+            'user_id': DEFAULT_IMPORT_USER,
+            'connector_ids': list(connectors.keys()),
+            'label_names': tags,
+            'label_class_id': get_project_ids(cursor, project_id).label_class,
+            'labeled_as_id': get_relation_id(cursor, project_id, 'labeled_as'),
+        })
+
+    return txid
+
+
 @shared_task
+@collects_timings
 def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
         distance_threshold, active_skeleton_id, autoseg_segment_id = None,
         message_user=True, message_payload=None, with_autapses=False,
-        set_status=True, annotations=None, tags=None):
+        set_status=True, annotations=None, tags=None, preview=False, plan=None,
+        synapse_import=None):
     """Find and import all synapses for the existing skeleton. If status is
     provided.
 
+    When called directly, the SynapseImport instance of <import_id> can be
+    passed in as <synapse_import> to avoid loading it again.
+
+    If <preview> is true, the import is only computed and its expected
+    statistics are stored, nothing is written to CATMAID's tables. The computed
+    plan is cached and a following import with the same inputs will reuse it.
+    Alternatively, a precomputed <plan> can be passed in.
+
     Code like this might be needed for make tasks that use asyncio (websockets
     messages) work with RabbitMQ:
 
@@ -516,319 +1942,159 @@ def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
         …
     """
     task_logger.debug('task: import_synapses_for_existing_skeleton started')
+    if set_status and is_cancelled(import_id):
+        task_logger.info(f'Import {import_id} was cancelled')
+        # Imports of autoseg skeletons are released by their segment import.
+        if autoseg_segment_id is None:
+            coalescing.release(import_id)
+        return
     error = None
     connectors = {}
     treenode_connector = {}
     start_time = timer()
 
-    synapse_import = None
     try:
         # Set status to computing
-        synapse_import = SynapseImport.objects.get(id=import_id)
+        if synapse_import is None:
+            synapse_import = SynapseImport.objects.get(id=import_id)
         if set_status:
+            metrics.observe_queue_wait(synapse_import)
             synapse_import.status = SynapseImport.Status.COMPUTING
-            synapse_import.save()
+            save_unless_cancelled(synapse_import, ['status'])
 
-        # Retrieve skeleton with all nodes directly from the database
+        # Retrieve skeleton with all nodes from the database and store it in a
+        # KD-tree for fast distance lookups. Trees are cached for each skeleton
+        # version.
         cursor = connection.cursor()
-        cursor.execute('''
-            SELECT t.id, t.parent_id, t.location_x, t.location_y, t.location_z
-            FROM treenode t
-            WHERE t.skeleton_id = %(skeleton_id)s
-            AND t.project_id = %(project_id)s
-        ''', {
-            'project_id': int(project_id),
-            'skeleton_id': int(active_skeleton_id),
-        })
-
-        # convert record to pandas data frame
-        skeleton = pd.DataFrame.from_records(cursor.fetchall(),
-            columns=['id', 'parent_id', 'x', 'y', 'z'])
-        task_logger.debug(f'Skeleton {active_skeleton_id} has {len(skeleton)} nodes')
-
-        # accessing the most recent autoseg data
-        fafbseg.google.segmentation.use_google_storage(cv, use_threads=True)
-        task_logger.debug(f'Using google storage {cv}')
-
-        if autoseg_segment_id is not None:
-            task_logger.debug('Active skeleton {} is derived from segment id {}'.format(active_skeleton_id, autoseg_segment_id))
-            overlapping_segmentids = set([int(autoseg_segment_id)])
-        else:
-            # retrieve segment ids
-            task_logger.debug('Getting autoseg segments')
-            segment_ids = fafbseg.google.segmentation._get_seg_ids(skeleton[['x','y','z']])
-
-            task_logger.debug(f'Found segment IDs for skeleton: {segment_ids}')
-
-            overlapping_segmentids = set(chain.from_iterable(segment_ids))
-            task_logger.debug(f'found {len(overlapping_segmentids)} overlapping segments')
-
-            # Explicitly remove segments with IDs marked as ignored (e.g.
-            # background).
-            if hasattr(settings, 'CIRCUITMAP_IGNORED_SEGMENT_IDS'):
-                overlapping_segmentids = overlapping_segmentids - set(settings.CIRCUITMAP_IGNORED_SEGMENT_IDS)
-                task_logger.debug(f'Removed segments with the following IDs: {settings.CIRCUITMAP_IGNORED_SEGMENT_IDS}')
-
-        # Store skeleton in KD-tree for fast distance lookups
-        tree = sp.KDTree( skeleton[['x', 'y', 'z']] )
-        task_logger.debug('KD tree built for skeleton')
-
-        all_pre_links = []
-        all_post_links = []
-
-        cur = connection.cursor()
-
-        # retrieve synaptic links for each autoseg skeleton
-        # todo: list shouldn't be needed
-        task_logger.debug('Iterating overlapping segments')
-        for segment_id in overlapping_segmentids:
-            task_logger.debug(f'Process segment: {segment_id}')
-            all_pre_links.append(get_links(cur, segment_id, 'segmentid_pre'))
-            all_post_links.append(get_links(cur, segment_id, 'segmentid_post'))
-
-        all_pre_links_concat = pd.concat(all_pre_links)
-        all_post_links_concat = pd.concat(all_post_links)
-
-        task_logger.debug(f'Total nr prelinks collected: {len(all_pre_links_concat)}')
-        task_logger.debug(f'Total nr postlinks collected: {len(all_post_links_concat)}')
-
-        # for all pre/post links, if clust_con_offset > 0, retrieve the respective
-        # links and use the presynaptic location as representative location for the link
-        tmp_list = all_pre_links_concat[all_pre_links_concat['clust_con_offset']>0]['clust_con_offset'].tolist()
-        if len(tmp_list) == 0:
-            all_pre_links_concat_remap_connector = None
-        else:
-            all_pre_links_concat_remap_connector = get_links_from_offset(cursor, tmp_list).set_index('offset')
-            task_logger.debug(f'Total # representative prelinks collected: {len(all_pre_links_concat_remap_connector)}')
-
-        tmp_list = all_post_links_concat[all_post_links_concat['clust_con_offset']>0]['clust_con_offset'].tolist()
-        if len(tmp_list) == 0:
-            all_post_links_concat_remap_connector = None
-        else:
-            all_post_links_concat_remap_connector = get_links_from_offset(cursor, tmp_list).set_index('offset')
-            task_logger.debug(f'Total # representative postlinks collected: {len(all_post_links_concat_remap_connector)}')
-
-        # Faciltate autapse checking
-        seen_skeleton_connectors_links = set()
-
-        if len(all_pre_links_concat) > 0:
-            task_logger.debug('Find closest distances to skeleton for pre')
-            res = tree.query(all_pre_links_concat[['pre_x','pre_y', 'pre_z']])
-            all_pre_links_concat['dist2'] = res[0]
-            all_pre_links_concat['skeleton_node_id_index'] = res[1]
-
-            seen_treenode_links = set()
-            seen_connector_links = dict()
-
-            # Iterate over all presynaptic links found for the current skeleton.
-            for idx, r in all_pre_links_concat.iterrows():
-                # skip link if beyond distance threshold
-                if distance_threshold >= 0 and r['dist2'] > distance_threshold:
-                    continue
-                # skip selflinks, if no autapses are wanted
-                if not with_autapses and r['segmentid_pre'] == r['segmentid_post']:
-                    continue
-                # Prevent duplicates treenode references in pre-segment
-                link_id = (r['segmentid_pre'], r['skeleton_node_id_index'])
-                if link_id in seen_treenode_links:
-                    continue
-                seen_treenode_links.add(link_id)
-
-                treenode_id = int(skeleton.loc[r['skeleton_node_id_index']]['id'])
-
-                # if representative presynaptic location found, use it
-                if r['clust_con_offset'] > 0 and not all_pre_links_concat_remap_connector is None:
-                    l = all_pre_links_concat_remap_connector.loc[r['clust_con_offset']]
-                    connector_id = CONNECTORID_OFFSET + int(r['clust_con_offset']) * 10
-                    task_logger.debug(f'found representative connector (prelink) {connector_id} for treenode {treenode_id} of {r["segmentid_pre"]} to {r["segmentid_post"]}')
-                    if not connector_id in connectors:
-                        connectors[connector_id] = l.to_dict()
-                else:
-                    # otherwise, use presynaptic location of link instead
-                    connector_id = CONNECTORID_OFFSET + int(r['offset']) * 10
-                    if not connector_id in connectors:
-                        connectors[connector_id] = r.to_dict()
-
-                # Prevent duplicate links from pre-fragment to selected
-                # connector.
-                connector_link_id = (r['segmentid_pre'], connector_id)
-                existing_link_data = seen_connector_links.get(connector_link_id)
-                if existing_link_data is None or existing_link_data[2] > r['dist2']:
-                    seen_connector_links[connector_link_id] = (treenode_id, connector_id, r['dist2'])
-
-                # remember skeleton link
-                if not with_autapses:
-                    seen_skeleton_connectors_links.add((active_skeleton_id, connector_id))
-
-            # Mark all final pre link sites to be stored in the database
-            for treenode_id, connector_id, _ in seen_connector_links.values():
-                task_logger.debug(f'Marking link from treenode {treenode_id} to connector {connector_id} for import')
-                treenode_connector[(treenode_id, connector_id)] = {'type': 'presynaptic_to'}
-
-        if len(all_post_links_concat) > 0:
-            task_logger.debug('find closest distances to skeleton for post')
-            res = tree.query(all_post_links_concat[['post_x','post_y', 'post_z']])
-            all_post_links_concat['dist2'] = res[0]
-            all_post_links_concat['skeleton_node_id_index'] = res[1]
-
-            seen_treenode_links = set()
-            seen_connector_links = dict()
-
-            for idx, r in all_post_links_concat.iterrows():
-                # skip link if beyond distance threshold
-                if distance_threshold >= 0 and r['dist2'] > distance_threshold:
-                    continue
-                if r['segmentid_pre'] == r['segmentid_post']:
-                    # skip selflinks
-                    continue
-                # Prevent duplicates treenode references in pre-segment
-                link_id = (r['segmentid_post'], r['skeleton_node_id_index'])
-                if link_id in seen_treenode_links:
-                    continue
-                seen_treenode_links.add(link_id)
-
-                treenode_id = int(skeleton.loc[r['skeleton_node_id_index']]['id'])
-
-                # if representative presynaptic location found, use it
-                if r['clust_con_offset'] > 0 and not all_post_links_concat_remap_connector is None:
-                    l = all_post_links_concat_remap_connector.loc[r['clust_con_offset']]
-                    connector_id = CONNECTORID_OFFSET + int(r['clust_con_offset']) * 10
-                    task_logger.debug(f'found representative connector (postlink) {connector_id} for treenode {treenode_id} of {r["segmentid_pre"]} to {r["segmentid_post"]}')
-                    if not connector_id in connectors:
-                        connectors[connector_id] = l.to_dict()
+        tree = get_skeleton_tree(cursor, project_id, active_skeleton_id)
+        task_logger.debug(f'Skeleton {active_skeleton_id} has {len(tree)} nodes')
+
+        # Only links close enough to the skeleton and with the required minimum
+        # scores need to be retrieved.
+        bounding_box = tree.bounding_box(distance_threshold) \
+                if distance_threshold >= 0 else None
+        score_thresholds = synapse_import.get_score_thresholds()
+
+        # In incremental mode, only nodes that were added or changed since the
+        # last import with the same parameters are looked at, if there is such
+        # an import.
+        base_import = None
+        if autoseg_segment_id is None and synapse_import.incremental:
+            base_import = get_incremental_base_import(synapse_import)
+
+        # Previews are cached and reused by the next import with the same
+        # inputs, as long as the skeleton didn't change. Plans of incremental
+        # imports depend on their base import and aren't cached.
+        plan_key = None
+        if base_import is None:
+            plan_key = get_plan_key('skeleton', project_id, active_skeleton_id,
+                    tree.version, distance_threshold, with_autapses,
+                    score_thresholds)
+            if plan is None:
+                plan = cache.get(plan_key)
+                metrics.inc('circuitmap_cache_requests_total', cache='plan',
+                        result='miss' if plan is None else 'hit')
+                if plan is not None:
+                    task_logger.debug('Using cached import plan')
+
+        if plan is None:
+            # accessing the most recent autoseg data
+            cv = use_google_storage()
+            task_logger.debug(f'Using volume {cv}')
+
+            # A list of segment sets along with the bounding box to fetch their
+            # links in.
+            link_queries = []
+            existing_links = None
+
+            if autoseg_segment_id is not None:
+                task_logger.debug('Active skeleton {} is derived from segment id {}'.format(active_skeleton_id, autoseg_segment_id))
+                overlapping_segmentids = set([int(autoseg_segment_id)])
+                link_queries.append((overlapping_segmentids, bounding_box))
+            elif base_import:
+                task_logger.debug(f'Incremental import based on import {base_import.id}')
+                changed_locations = get_changed_node_locations(cursor, project_id,
+                        active_skeleton_id, base_import.skeleton_edition_time)
+                task_logger.debug(f'{len(changed_locations)} nodes changed since last import')
+
+                known_segmentids = set(base_import.segment_ids)
+                if len(changed_locations) > 0:
+                    changed_segmentids = get_overlapping_segments(changed_locations)
                 else:
-                    connector_id = CONNECTORID_OFFSET + int(r['offset']) * 10
-                    if not connector_id in connectors:
-                        connectors[connector_id] = r.to_dict()
-                # skip post links that form autapses
-                if (active_skeleton_id, connector_id) in seen_skeleton_connectors_links:
-                    task_logger.debug(f'skipping autapse: {active_skeleton_id}, {connector_id}')
-                    continue
-
-                # Prevent duplicate links from selected connector to post-fragment
-                connector_link_id = (r['segmentid_post'], connector_id)
-                existing_link_data = seen_connector_links.get(connector_link_id)
-                if existing_link_data is None or existing_link_data[2] > r['dist2']:
-                    seen_connector_links[connector_link_id] = (treenode_id, connector_id, r['dist2'])
-
-            # Mark all final post link sites to be stored in the database
-            for treenode_id, connector_id, _ in seen_connector_links.values():
-                task_logger.debug(f'Marking link from connector {connector_id} to treenode {treenode_id} for import')
-                treenode_connector[(treenode_id, connector_id)] = {'type': 'postsynaptic_to'}
-
-        # insert into database
-        task_logger.debug('fetch relations')
-        cursor.execute("SELECT id,relation_name from relation where project_id = {project_id};".format(project_id=project_id))
-        res = cursor.fetchall()
-        relations = dict([(v,u) for u,v in res])
-
-        with_multi = True
-        queries = []
-        with transaction.atomic():
-            # insert connectors
-            task_logger.debug('start inserting connectors')
-            for connector_id, r in connectors.items():
-                q = """
-            INSERT INTO connector (id, user_id, editor_id, project_id, location_x, location_y, location_z)
-                        VALUES ({},{},{},{},{},{},{}) ON CONFLICT (id) DO NOTHING;
-                    """.format(
-                    connector_id,
-                    DEFAULT_IMPORT_USER,
-                    DEFAULT_IMPORT_USER,
-                    project_id,
-                    int(r['pre_x']),
-                    int(r['pre_y']),
-                    int(r['pre_z']))
-
-                if with_multi:
-                    queries.append(q)
+                    changed_segmentids = set()
+                overlapping_segmentids = known_segmentids | changed_segmentids
+
+                # Segments that weren't overlapping before can have links
+                # anywhere close to the skeleton. Links of already known
+                # segments are only new if they are close to a changed node.
+                link_queries.append((changed_segmentids - known_segmentids,
+                        bounding_box))
+                if distance_threshold >= 0 and len(changed_locations) > 0:
+                    changed_bounding_box = (
+                            changed_locations.min(axis=0) - distance_threshold,
+                            changed_locations.max(axis=0) + distance_threshold)
                 else:
-                    cursor.execute(q)
-
-            # insert links
-            # TODO: optimize based on scores
-            confidence_value = 5
-
-            task_logger.debug('start insert links')
-            for idx, val in treenode_connector.items():
-                skeleton_node_id, connector_id = idx
-                q = """
-                    INSERT INTO treenode_connector (user_id, project_id,
-                        treenode_id, connector_id, relation_id, skeleton_id,
-                        confidence)
-                    VALUES ({},{},{},{},{},{},{})
-                    ON CONFLICT ON CONSTRAINT treenode_connector_project_id_treenode_id_connector_id_relation DO NOTHING;
-                    """.format(
-                    DEFAULT_IMPORT_USER,
-                    project_id,
-                    skeleton_node_id,
-                    connector_id,
-                    relations[val['type']],
-                    active_skeleton_id,
-                    confidence_value)
-
-                if with_multi:
-                    queries.append(q)
-                else:
-                    cursor.execute(q)
-
-            if with_multi:
-                #task_logger.debug('run multiquery. nr queries {}'.format(len(queries))
-                task_logger.debug(f'Inserting {len(queries)} synaptic links')
-                cursor.execute('\n'.join(queries))
-                task_logger.debug('multiquery done')
-
-        # add tags to connectors
-        if tags:
-            task_logger.debug('Add tags')
-            cursor.execute("""
-                WITH label_rel AS (
-                    SELECT id FROM relation
-                    WHERE relation_name = 'labeled_as'
-                    AND project_id = %(project_id)s
-                ), label_class AS (
-                    SELECT id FROM class
-                    WHERE class_name = 'label'
-                    AND project_id = %(project_id)s
-                ), insert_missing_labels AS (
-                    INSERT INTO class_instance (user_id, project_id, class_id, name)
-                    SELECT %(user_id)s, %(project_id)s, lc.id, label.name
-                    FROM label_class lc,
-                    UNNEST(%(label_names)s::text[]) label(name)
-                    LEFT JOIN LATERAL(
-                        SELECT id FROM class_instance ci
-                        WHERE ci.name = label.name
-                        AND ci.project_id = %(project_id)s
-                        AND ci.class_id = lc.id
-                    ) ci ON TRUE
-                    WHERE ci.id IS NULL
-                )
-                INSERT INTO connector_class_instance
-                    (user_id, project_id, relation_id, connector_id, class_instance_id)
-                SELECT %(user_id)s, %(project_id)s, lr.id, c.id, ci.id
-                FROM label_rel lr, label_class lc,
-                UNNEST(%(label_names)s::text[]) label(name)
-                JOIN LATERAL (
-                    SELECT id FROM class_instance ci
-                    WHERE ci.name = label.name
-                    AND ci.project_id = %(project_id)s
-                    AND ci.class_id = lc.id
-                ) ci ON TRUE
-                CROSS JOIN UNNEST(%(connector_ids)s::bigint[]) c(id)
-            """, {
-                'project_id': project_id,
-                'user_id': DEFAULT_IMPORT_USER,
-                'connector_ids': list(connectors.keys()),
-                'label_names': tags,
-            })
+                    changed_bounding_box = None
+                link_queries.append((changed_segmentids & known_segmentids,
+                        changed_bounding_box))
 
-        if set_status:
-            synapse_import.status = SynapseImport.Status.DONE
-            synapse_import.status_detail = ""
-            synapse_import.runtime = timer() - start_time
-            synapse_import.n_imported_connectors = len(connectors)
-            synapse_import.n_imported_links = len(treenode_connector)
-            synapse_import.save()
+                existing_links = get_skeleton_links(cursor, project_id,
+                        active_skeleton_id)
+            else:
+                # retrieve segment ids
+                task_logger.debug('Getting autoseg segments')
+                overlapping_segmentids = get_overlapping_segments(tree.locations)
+                link_queries.append((overlapping_segmentids, bounding_box))
+
+            pre_links, post_links = fetch_link_queries(cursor, link_queries,
+                    score_thresholds)
+            plan = compute_synapse_plan(cursor, tree, pre_links, post_links,
+                    distance_threshold, with_autapses, existing_links)
+            plan['segment_ids'] = overlapping_segmentids
+
+            if preview and plan_key:
+                cache_plan(plan_key, plan)
+
+        # Attach links to close by existing connectors. This depends on the
+        # current state of the project and is therefore not part of cached
+        # plans.
+        plan = dict(plan)
+        match_existing_connectors(cursor, project_id,
+                {active_skeleton_id: plan})
+
+        connectors = plan['connectors']
+        treenode_connector = plan['treenode_connector']
+
+        if preview:
+            if set_status:
+                synapse_import.status = SynapseImport.Status.DONE
+                synapse_import.status_detail = ""
+                synapse_import.runtime = timer() - start_time
+                synapse_import.n_expected_connectors = len(connectors)
+                synapse_import.n_expected_links = len(treenode_connector)
+                save_unless_cancelled(synapse_import, ['status',
+                        'status_detail', 'runtime', 'n_expected_connectors',
+                        'n_expected_links'])
+        else:
+            txid = insert_synapse_plan(cursor, project_id, active_skeleton_id,
+                    plan, tags)
+
+            if set_status:
+                synapse_import.status = SynapseImport.Status.DONE
+                synapse_import.status_detail = ""
+                synapse_import.txid = txid
+                # Remember the skeleton state this import was computed for, so
+                # that later incremental imports can build on it.
+                if autoseg_segment_id is None:
+                    synapse_import.skeleton_edition_time = tree.version[1]
+                    synapse_import.segment_ids = sorted(plan.get('segment_ids', []))
+                synapse_import.runtime = timer() - start_time
+                synapse_import.n_imported_connectors = len(connectors)
+                synapse_import.n_imported_links = len(treenode_connector)
+                save_unless_cancelled(synapse_import, ['status',
+                        'status_detail', 'txid', 'skeleton_edition_time',
+                        'segment_ids', 'runtime', 'n_imported_connectors',
+                        'n_imported_links'])
         task_logger.debug('task: import_synapses_for_existing_skeleton started: done')
     except Exception as ex:
         error_message = traceback.format_exc()
@@ -839,7 +2105,12 @@ def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
             synapse_import.runtime = duration
             synapse_import.status = SynapseImport.Status.ERROR
             synapse_import.status_detail = str(error)
-            synapse_import.save()
+            save_unless_cancelled(synapse_import, ['runtime', 'status',
+                    'status_detail'])
+
+    # Imports of autoseg skeletons are released by their segment import.
+    if set_status and autoseg_segment_id is None:
+        coalescing.release(import_id)
 
     if message_user:
         task_logger.debug('Creating user message')
@@ -855,6 +2126,11 @@ def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
         elif has_zero_results:
             msg.title = f"No synapses were found that could be added to skeleton #{active_skeleton_id}"
             msg.action = f"?pid={project_id}&active_skeleton_id={active_skeleton_id}&tool=tracingtool"
+        elif preview:
+            msg.title = f"Synapse import preview for skeleton #{active_skeleton_id}"
+            msg.text = (f"Importing would create {len(connectors)} synapses (connector nodes) " +
+                f"and {len(treenode_connector)} links")
+            msg.action = f"?pid={project_id}&active_skeleton_id={active_skeleton_id}&tool=tracingtool"
         else:
             msg.title = f"Synapses imported for skeleton #{active_skeleton_id}"
             msg.text = (f"Imported {len(connectors)} synapses (connector nodes) " +
@@ -869,6 +2145,7 @@ def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
             'n_inserted_synapses': len(connectors),
             'n_inserted_links': len(treenode_connector),
             'skeleton_id': active_skeleton_id,
+            'preview': preview,
         }
         if error:
             payload['error'] = str(error)
@@ -879,88 +2156,95 @@ def import_synapses_for_existing_skeleton(project_id, user_id, import_id,
 
 
 @shared_task(base=LoggingTask)
+@collects_timings
 def import_autoseg_skeleton_with_synapses(project_id, user_id, import_id,
         segment_id, message_user=True, message_payload=None,
-        with_autapses=False, set_status=True, annotations=None, tags=None):
+        with_autapses=False, set_status=True, annotations=None, tags=None,
+        preview=False, skeleton=None, synapse_import=None,
+        segment_import=None, imported_before=None, prepared=None):
+    """Import the autoseg skeleton of the passed in segment, if it wasn't
+    imported before, and import its synapses. An already downloaded
+    <skeleton> of the segment can be passed in.
+
+    When called directly, the SynapseImport and SegmentImport instances can be
+    passed in to avoid loading them again. If <imported_before> is False, the
+    segment is known to be new and its existence isn't checked. Treenode rows
+    and plan of the skeleton can be passed in as <prepared>, see
+    prepare_autoseg_skeleton().
+    """
 
-    synapse_import = SynapseImport.objects.get(id=import_id)
-    segment_import = synapse_import.segmentimport_set.all()
-    if len(segment_import) > 1:
-        raise ValueError('Expected single segment import entry')
-    else:
-        segment_import = segment_import[0]
+    if synapse_import is None:
+        synapse_import = SynapseImport.objects.get(id=import_id)
+    if segment_import is None:
+        segment_import = synapse_import.segmentimport_set.all()
+        if len(segment_import) > 1:
+            raise ValueError('Expected single segment import entry')
+        else:
+            segment_import = segment_import[0]
 
+    plan = None
     try:
-        # ID handling: method globally unique ID
-        def mapping_skel_nid(segment_id, nid, project_id):
-            max_nodes = 100000 # max. number of nodes / autoseg skeleton allowed
-            nr_projects = 10 # max number of projects / instance allowed
-            return int( int(segment_id) * max_nodes * nr_projects + int(nid) * nr_projects + int(project_id) )
-
         task_logger.debug('task: import_autoseg_skeleton_with_synapses started')
         cursor = connection.cursor()
 
         # check if skeleton of autoseg segment_id was previously imported
-        task_logger.debug('check if already imported')
-        cursor.execute('SELECT id, skeleton_id FROM treenode WHERE project_id = {} and id = {}'.format( \
-            int(project_id), mapping_skel_nid(segment_id, 0, int(project_id))))
-        res = cursor.fetchone()
-        task_logger.debug(f'fetched: {res}')
+        if imported_before is False:
+            res = None
+        else:
+            task_logger.debug('check if already imported')
+            cursor.execute('SELECT id, skeleton_id FROM treenode WHERE project_id = {} and id = {}'.format( \
+                int(project_id), mapping_skel_nid(segment_id, 0, int(project_id))))
+            res = cursor.fetchone()
+            task_logger.debug(f'fetched: {res}')
 
         if not res is None:
             node_id, skeleton_class_instance_id = res
             if set_status:
                 synapse_import.skeleton_id = skeleton_class_instance_id
-                synapse_import.save()
+                synapse_import.save(update_fields=['skeleton_id'])
             task_logger.debug('autoseg skeleton was previously imported. skip reimport. (current skeletonid is {})'.format(skeleton_class_instance_id))
+        elif preview:
+            # Compute the synapses that would be imported for the autoseg
+            # skeleton, without creating it. Node IDs are deterministic, which
+            # allows the actual import to reuse this plan.
+            task_logger.debug('fetch skeleton for segment_id {} (preview)'.format(segment_id))
+            s1 = skeleton if skeleton is not None else get_autoseg_skeleton(segment_id)
+            rows = autoseg_skeleton_to_rows(s1, segment_id, project_id)
+            plan = get_segment_plan(cursor, project_id, segment_id, rows,
+                    with_autapses, synapse_import.get_score_thresholds(),
+                    cache_result=True)
+
+            if set_status:
+                synapse_import.n_expected_connectors = len(plan['connectors'])
+                synapse_import.n_expected_links = len(plan['treenode_connector'])
+                synapse_import.save(update_fields=['n_expected_connectors',
+                        'n_expected_links'])
+            task_logger.debug('task: import_autoseg_skeleton_with_synapses done (preview)')
+            return True
         else:
             # fetch and insert autoseg skeleton at location
             task_logger.debug('fetch skeleton for segment_id {}'.format(segment_id))
 
-            s1 = cv.skeleton.get(int(segment_id))
+            s1 = skeleton if skeleton is not None else get_autoseg_skeleton(segment_id)
             task_logger.debug('fetched.')
             nr_of_vertices = len(s1.vertices)
             task_logger.debug('number of vertices {} for {}'.format(nr_of_vertices, segment_id))
 
             task_logger.debug('autoseg skeleton for {} has {} nodes'.format(segment_id, nr_of_vertices))
 
-            task_logger.debug('generate graph for skeleton')
-            g=nx.Graph()
-            attrs = []
-            for idx in range(nr_of_vertices):
-                x,y,z=map(int,s1.vertices[idx,:])
-                r = s1.radius[idx]
-                attrs.append((int(idx),{'x':x,'y':y,'z':z,'r':float(r) }))
-            g.add_nodes_from(attrs)
-            edgs = []
-            for u,v in s1.edges:
-                edgs.append((int(u), int(v)))
-            g.add_edges_from(edgs)
-
-            # TODO: check if it skeleton already imported
-            # this check depends on the chosen implementation
-            task_logger.debug('check number of connected components')
-            nr_components = nx.number_connected_components(g)
-            if nr_components > 1:
-                task_logger.debug('more than one component in skeleton graph. use only largest component')
-                largest_cc = max(nx.connected_components(g), key=len)
-                graph = g.subgraph(largest_cc)
+            if prepared is None:
+                task_logger.debug('convert skeleton, using only the largest component')
+                rows, plan = prepare_autoseg_skeleton(cursor, project_id,
+                        segment_id, s1, with_autapses,
+                        synapse_import.get_score_thresholds(), segment_import)
             else:
-                graph = g
-
-            # do relabeling and choose root node
-            g2 = nx.relabel_nodes(g, lambda x: mapping_skel_nid(segment_id, x, project_id))
-            root_skeleton_id = mapping_skel_nid(segment_id, 0, project_id)
-            new_tree = nx.bfs_tree(g2, root_skeleton_id)
+                rows, plan = prepared
+            n_imported_nodes = len(rows['id'])
 
             task_logger.debug('fetch relations and classes')
-            cursor.execute("SELECT id,relation_name from relation where project_id = {project_id};".format(project_id=project_id))
-            res = cursor.fetchall()
-            relations = dict([(v,u) for u,v in res])
-
-            cursor.execute("SELECT id,class_name from class where project_id = {project_id};".format(project_id=project_id))
-            res = cursor.fetchall()
-            classes = dict([(v,u) for u,v in res])
+            project_ids = get_project_ids(cursor, project_id)
+            relations = project_ids.relations
+            classes = project_ids.classes
 
 
             query = """
@@ -990,97 +2274,64 @@ def import_autoseg_skeleton_with_synapses(project_id, user_id, import_id,
             cici_id = cursor.fetchone()[0]
 
             # insert treenodes
-
-            queries = []
-            with_multi = True
-            with transaction.atomic():
-                # insert root node
-                parent_id = ""
-                n = g2.nodes[root_skeleton_id]
-                query = """INSERT INTO treenode (id, project_id, location_x, location_y, location_z, editor_id,
-                            user_id, skeleton_id, radius) VALUES ({},{},{},{},{},{},{},{},{}) ON CONFLICT (id) DO NOTHING;
-                    """.format(
-                     root_skeleton_id,
-                     project_id,
-                     n['x'],
-                     n['y'],
-                     n['z'],
-                     DEFAULT_IMPORT_USER,
-                     DEFAULT_IMPORT_USER,
-                     skeleton_class_instance_id,
-                     n['r'])
-                if with_multi:
-                    queries.append(query)
-                else:
-                    cursor.execute(query)
-
-                # insert all chidren
-                n_imported_nodes = 0
-                for parent_id, skeleton_node_id in new_tree.edges(data=False):
-                    n = g2.nodes[skeleton_node_id]
-                    query = """INSERT INTO treenode (id,project_id, location_x, location_y, location_z, editor_id,
-                                user_id, skeleton_id, radius, parent_id) VALUES ({},{},{},{},{},{},{},{},{},{}) ON CONFLICT (id) DO NOTHING;
-                        """.format(
-                         skeleton_node_id,
-                         project_id,
-                         n['x'],
-                         n['y'],
-                         n['z'],
-                         DEFAULT_IMPORT_USER,
-                         DEFAULT_IMPORT_USER,
-                         skeleton_class_instance_id,
-                         n['r'],
-                        parent_id)
-                    if with_multi:
-                        queries.append(query)
-                    else:
-                        cursor.execute(query)
-                    n_imported_nodes += 1
-
-                task_logger.debug('run multiquery')
-                if with_multi:
-                    cursor.execute('\n'.join(queries))
+            task_logger.debug(f'Inserting {n_imported_nodes} nodes')
+            with transaction.atomic(), measure('tree_insert', nodes=n_imported_nodes):
+                cursor.execute("""
+                    INSERT INTO treenode (id, project_id, location_x,
+                        location_y, location_z, editor_id, user_id,
+                        skeleton_id, radius, parent_id)
+                    SELECT t.id, %(project_id)s, t.x, t.y, t.z, %(user_id)s,
+                        %(user_id)s, %(skeleton_id)s, t.radius,
+                        NULLIF(t.parent_id, -1)
+                    FROM UNNEST(%(ids)s::bigint[], %(x)s::real[], %(y)s::real[],
+                        %(z)s::real[], %(radius)s::real[], %(parent_ids)s::bigint[])
+                        t(id, x, y, z, radius, parent_id)
+                    ON CONFLICT (id) DO NOTHING
+                """, {
+                    'project_id': project_id,
+                    'user_id': DEFAULT_IMPORT_USER,
+                    'skeleton_id': skeleton_class_instance_id,
+                    'ids': rows['id'].tolist(),
+                    'x': rows['location'][:, 0].tolist(),
+                    'y': rows['location'][:, 1].tolist(),
+                    'z': rows['location'][:, 2].tolist(),
+                    'radius': rows['radius'].tolist(),
+                    'parent_ids': rows['parent_id'].tolist(),
+                })
+                metrics.inc('circuitmap_rows_written_total', cursor.rowcount,
+                        table='treenode')
 
             if set_status:
                 synapse_import.skeleton_id = skeleton_class_instance_id
                 segment_import.n_imported_nodes += n_imported_nodes
-                synapse_import.save()
+                synapse_import.save(update_fields=['skeleton_id'])
+                segment_import.save(update_fields=['n_imported_nodes'])
 
             # add annotations to imported neurons
             if annotations:
                 task_logger.debug('Add annotations')
                 cursor.execute("""
-                    WITH ann_rel AS (
-                        SELECT id FROM relation
-                        WHERE relation_name = 'annotated_with'
-                        AND project_id = %(project_id)s
-                    ), ann_class AS (
-                        SELECT id FROM class
-                        WHERE class_name = 'annotation'
-                        AND project_id = %(project_id)s
-                    ), insert_missing_annotations AS (
+                    WITH insert_missing_annotations AS (
                         INSERT INTO class_instance (user_id, project_id, class_id, name)
-                        SELECT %(user_id)s, %(project_id)s, ac.id, ann.name
-                        FROM ann_class ac,
-                        UNNEST(%(annotation_names)s::text[]) ann(name)
+                        SELECT %(user_id)s, %(project_id)s, %(annotation_class_id)s, ann.name
+                        FROM UNNEST(%(annotation_names)s::text[]) ann(name)
                         LEFT JOIN LATERAL (
                             SELECT id FROM class_instance ci
                             WHERE ci.name = ann.name
-                            AND ci.class_id = ac.id
+                            AND ci.class_id = %(annotation_class_id)s
                             AND ci.project_id = %(project_id)s
                         ) ci ON TRUE
                         WHERE ci.id IS NULL
                     )
                     INSERT INTO class_instance_class_instance
                         (user_id, project_id, relation_id, class_instance_a, class_instance_b)
-                    SELECT %(user_id)s, %(project_id)s, ar.id, n.id, ci.id
-                    FROM ann_rel ar, ann_class ac,
-                    UNNEST(%(annotation_names)s::text[]) ann(name)
+                    SELECT %(user_id)s, %(project_id)s, %(annotated_with_id)s, n.id, ci.id
+                    FROM UNNEST(%(annotation_names)s::text[]) ann(name)
                     JOIN LATERAL (
                         SELECT id FROM class_instance ci
                         WHERE ci.name = ann.name
                         AND ci.project_id = %(project_id)s
-                        AND ci.class_id = ac.id
+                        AND ci.class_id = %(annotation_class_id)s
                     ) ci ON TRUE
                     CROSS JOIN UNNEST(%(neuron_ids)s::bigint[]) n(id)
                 """, {
@@ -1088,6 +2339,8 @@ def import_autoseg_skeleton_with_synapses(project_id, user_id, import_id,
                     'user_id': DEFAULT_IMPORT_USER,
                     'neuron_ids': [neuron_class_instance_id],
                     'annotation_names': annotations,
+                    'annotation_class_id': project_ids.annotation_class,
+                    'annotated_with_id': get_relation_id(cursor, project_id, 'annotated_with'),
                 })
 
         # call import_synapses_for_existing_skeleton with autoseg skeleton as seed
@@ -1096,7 +2349,8 @@ def import_autoseg_skeleton_with_synapses(project_id, user_id, import_id,
         import_synapses_for_existing_skeleton(project_id, user_id, import_id,
             -1,  skeleton_class_instance_id, segment_id, message_user,
             message_payload, with_autapses, set_status=set_status,
-            annotations=annotations, tags=tags)
+            annotations=annotations, tags=tags, preview=preview, plan=plan,
+            synapse_import=synapse_import)
 
         task_logger.debug('task: import_autoseg_skeleton_with_synapses done')
 
@@ -1108,11 +2362,94 @@ def import_autoseg_skeleton_with_synapses(project_id, user_id, import_id,
     return True
 
 
+def get_import_list_filters(request, project_id):
+    """Parse the filters of a synapse import list request into an SQL
+    condition and its parameters.
+    """
+    conditions = ['si.project_id = %(project_id)s']
+    params = {
+        'project_id': int(project_id),
+    }
+
+    status = get_request_list(request.GET, 'status', None)
+    if status:
+        labels = dict((label.lower(), value) for value, label in SynapseImport.Status.choices)
+        values = set(labels.values())
+        params['status'] = []
+        for s in status:
+            value = int(s) if s.isdigit() else labels.get(s.lower())
+            if value not in values:
+                raise ClientError(f'Unknown status: {s}')
+            params['status'].append(value)
+        conditions.append('si.status = ANY(%(status)s::int[])')
+    for field in ('user_id', 'skeleton_id'):
+        values = get_request_list(request.GET, field, None, map_fn=int)
+        if values:
+            params[field] = values
+            conditions.append(f'si.{field} = ANY(%({field})s::bigint[])')
+    for name, operator in (('since', '>='), ('until', '<')):
+        value = request.GET.get(name)
+        if value:
+            params[name] = parse_datetime(value)
+            if params[name] is None:
+                raise ClientError(f'Invalid time for "{name}": {value}')
+            conditions.append(f'si.edition_time {operator} %({name})s')
+
+    return ' AND '.join(conditions), params
+
+
+def get_import_list_state(request, project_id):
+    """Get the most recent edition time and the number of synapse imports
+    matching the filters of the passed in request, along with a digest of the
+    timings of their segment imports, which are part of the list as well. The
+    result is stored with the request, because it is needed for both ETag and
+    Last-Modified.
+    """
+    state = getattr(request, '_circuitmap_import_list_state', None)
+    if state is None:
+        where, params = get_import_list_filters(request, project_id)
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT MAX(si.edition_time), COUNT(DISTINCT si.id),
+                md5(string_agg(seg.id || ':' || COALESCE(seg.timings::text, ''), ','
+                    ORDER BY seg.id))
+            FROM circuitmap_synapseimport si
+            LEFT JOIN circuitmap_segmentimport seg
+                ON seg.synapse_import_id = si.id
+            WHERE {where}
+        """, params)
+        state = cursor.fetchone()
+        request._circuitmap_import_list_state = state
+    return state
+
+
+def get_import_list_etag(request, project_id):
+    last_edition_time, n_imports, segment_digest = get_import_list_state(
+            request, project_id)
+    key = f'{last_edition_time}|{n_imports}|{segment_digest}|{request.GET.urlencode()}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_import_list_last_modified(request, project_id):
+    return get_import_list_state(request, project_id)[0]
+
+
 class SynapseImportList(APIView):
 
     @method_decorator(requires_user_role(UserRole.Browse))
-    def get(self, request:HttpRequest, project_id) -> JsonResponse:
-        """List all available point clouds or optionally a sub set.
+    @method_decorator(condition(etag_func=get_import_list_etag,
+            last_modified_func=get_import_list_last_modified))
+    def get(self, request:HttpRequest, project_id) -> HttpResponse:
+        """List synapse imports of a project, most recently changed first.
+        Without a limit, all matching imports are returned as a list.
+
+        With a limit, an object with one page of imports ("imports") and the
+        cursor of the next page ("next", null for the last page) is returned.
+        The cursor has to be passed in as "before" to get the next page.
+
+        Responses have an ETag and a Last-Modified header, based on the most
+        recent change of a matching import. Conditional requests get an empty
+        304 response if nothing changed.
         ---
         parameters:
           - name: project_id
@@ -1120,44 +2457,178 @@ class SynapseImportList(APIView):
             type: integer
             paramType: path
             required: true
+          - name: limit
+            description: Maximum number of imports to return
+            type: integer
+            paramType: form
+            required: false
+          - name: before
+            description: Cursor of the page to return
+            type: string
+            paramType: form
+            required: false
+          - name: status
+            description: Only return imports with one of these status labels or values
+            type: array
+            paramType: form
+            required: false
+          - name: user_id
+            description: Only return imports of these users
+            type: array
+            paramType: form
+            required: false
+          - name: skeleton_id
+            description: Only return imports of these skeletons
+            type: array
+            paramType: form
+            required: false
+          - name: since
+            description: Only return imports changed at or after this ISO time
+            type: string
+            paramType: form
+            required: false
+          - name: until
+            description: Only return imports changed before this ISO time
+            type: string
+            paramType: form
+            required: false
         """
+        where, params = get_import_list_filters(request, project_id)
+        status_label = 'CASE si.status {} END'.format(' '.join(
+                f'WHEN {int(value)} THEN %(status_label_{int(value)})s'
+                for value, _ in SynapseImport.Status.choices))
+        params.update((f'status_label_{int(value)}', str(label))
+                for value, label in SynapseImport.Status.choices)
+
+        limit = request.GET.get('limit')
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            raise ClientError(f'Invalid limit: {limit}')
+        if limit is not None:
+            params['limit'] = max(1, limit)
+            before = request.GET.get('before')
+            if before:
+                # The cursor has the form "<ISO time>,<import ID>"
+                try:
+                    before_time, before_id = before.rsplit(',', 1)
+                    params['before_time'] = parse_datetime(before_time)
+                    params['before_id'] = int(before_id)
+                except ValueError:
+                    params['before_time'] = None
+                if params['before_time'] is None:
+                    raise ClientError('Invalid "before" cursor')
+                where += ' AND (si.edition_time, si.id) < (%(before_time)s, %(before_id)s)'
+
+        # Rows are serialized by the database, which is much faster than
+        # building them in Python for many imports.
         cursor = connection.cursor()
-        cursor.execute("""
-            SELECT id, user_id, project_id, creation_time, edition_time, status,
-                status_detail, runtime, request_id, skeleton_id, n_imported_links,
-                n_imported_connectors, n_upstream_partners, n_downstream_partners,
-                upstream_partner_syn_threshold, downsteam_partner_syn_threshold,
-                distance_threshold, with_autapses, tags, annotations,
-                n_expected_upstream_partners, n_expected_downstream_partners
-            FROM circuitmap_synapseimport si
-            WHERE project_id = %(project_id)s
-        """, {
-            'project_id': project_id,
-        })
-        return JsonResponse([{
-            'id': r[0],
-            'user_id': r[1],
-            'project_id': r[2],
-            'creation_time': r[3],
-            'edition_time': r[4],
-            'status': SynapseImport.Status.labels[r[5]],
-            'status_detail': r[6],
-            'runtime': r[7],
-            'request_id': r[8],
-            'skeleton_id': r[9],
-            'n_imported_links': r[10],
-            'n_imported_connectors': r[11],
-            'n_upstream_partners': r[12],
-            'n_downstream_partners': r[13],
-            'upstream_partner_syn_threshold': r[14],
-            'downsteam_partner_syn_threshold': r[15],
-            'distance_threshold': r[16],
-            'with_autapses': r[17],
-            'tags': r[18],
-            'annotations': r[19],
-            'n_expected_upstream_partners': r[20],
-            'n_expected_downstream_partners': r[21],
-        } for r in cursor.fetchall()], safe=False)
+        cursor.execute(f"""
+            WITH page AS (
+                SELECT si.id, si.user_id, si.project_id, si.creation_time,
+                    si.edition_time,
+                    {status_label} AS status,
+                    si.status_detail, si.runtime, si.request_id, si.skeleton_id,
+                    si.n_imported_links, si.n_imported_connectors,
+                    si.n_upstream_partners, si.n_downstream_partners,
+                    si.upstream_partner_syn_threshold,
+                    si.downsteam_partner_syn_threshold, si.distance_threshold,
+                    si.with_autapses, si.tags, si.annotations,
+                    si.n_expected_upstream_partners,
+                    si.n_expected_downstream_partners, si.preview,
+                    si.n_expected_links, si.n_expected_connectors, si.parent_id,
+                    si.coalesced_with_id, si.queue, si.timings,
+                    (SELECT seg.timings FROM circuitmap_segmentimport seg
+                        WHERE seg.synapse_import_id = si.id
+                        LIMIT 1) AS segment_timings
+                FROM circuitmap_synapseimport si
+                WHERE {where}
+                ORDER BY si.edition_time DESC, si.id DESC
+                {'LIMIT %(limit)s' if limit is not None else ''}
+            )
+            SELECT
+                (SELECT COALESCE(json_agg(p ORDER BY p.edition_time DESC, p.id DESC), '[]')::text
+                    FROM page p),
+                (SELECT COUNT(*) FROM page),
+                (SELECT ARRAY[to_json(p.edition_time) #>> '{{}}', p.id::text] FROM page p
+                    ORDER BY p.edition_time ASC, p.id ASC LIMIT 1)
+        """, params)
+        imports, n_imports, last = cursor.fetchone()
+
+        if limit is None:
+            content = imports
+        else:
+            next_page = f'{last[0]},{last[1]}' if last and n_imports == params['limit'] else None
+            content = f'{{"imports": {imports}, "next": {json.dumps(next_page)}}}'
+
+        response = HttpResponse(content, content_type='application/json')
+        # Clients have to check whether the list changed on every use.
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+@api_view(['GET'])
+@transaction.non_atomic_requests
+@requires_user_role(UserRole.Browse)
+def get_import_changes(request: HttpRequest, project_id=None):
+    """Wait until imports of the project are created, changed or deleted after
+    the passed in time stamp (since) and return the IDs of the changed imports
+    along with the new time stamp (last_update). If nothing changes within
+    the timeout (in seconds, at most CIRCUITMAP_CHANGE_FEED_TIMEOUT, default:
+    25), an empty list is returned. Without time stamp, the current one is
+    returned right away. This allows clients to wait for changes with one
+    open request instead of polling.
+    """
+    max_timeout = getattr(settings, 'CIRCUITMAP_CHANGE_FEED_TIMEOUT', 25)
+    timeout = min(float(request.GET.get('timeout', max_timeout)), max_timeout)
+    since = request.GET.get('since')
+
+    changed = []
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            raise ValueError('Invalid time stamp for "since"')
+        changed = wait_for_import_changes(project_id, since, timeout)
+
+    last_update = get_last_update(connection.cursor(), project_id)
+    if since and last_update < since:
+        last_update = since
+
+    return JsonResponse({
+        'changed': changed,
+        'last_update': last_update,
+    })
+
+
+@api_view(['POST'])
+@requires_user_role(UserRole.Annotate)
+def cancel_synapse_import(request: HttpRequest, project_id=None, import_id=None):
+    """Cancel a queued or running import of the requesting user. Running tasks
+    stop after the partner or stage they are working on. Returns whether the
+    import was cancelled, finished imports can't be cancelled.
+    """
+    synapse_import = get_object_or_404(SynapseImport, id=import_id,
+            project_id=project_id)
+    if synapse_import.user_id != request.user.id and not request.user.is_superuser:
+        raise PermissionError('Only the user who started an import can cancel it')
+    cancelled = cancel_import(synapse_import.id)
+    return JsonResponse({
+        'id': synapse_import.id,
+        'cancelled': cancelled,
+    })
+
+
+@api_view(['GET'])
+def get_metrics(request: HttpRequest):
+    """Return counters and latency histograms of imports of all processes in
+    the Prometheus text format. Only superusers have access, scrapers can use
+    an API token.
+    """
+    if not request.user.is_superuser:
+        return HttpResponse('Only superusers can access metrics', status=403,
+                content_type='text/plain')
+    return HttpResponse(metrics.render(connection.cursor()),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class LastGeneralImportUpdate(APIView):
@@ -1181,7 +2652,7 @@ class LastGeneralImportUpdate(APIView):
             ORDER BY edition_time DESC
             LIMIT 1
         """, {
-            'import_id': import_id,
+            'project_id': project_id,
         })
         r = cursor.fetchone()
         if not r:
@@ -1201,7 +2672,9 @@ class LastImportUpdate(APIView):
 
     @method_decorator(requires_user_role(UserRole.Browse))
     def get(self, request:HttpRequest, project_id, import_id) -> JsonResponse:
-        """Get a date and timestamp of the last updates of ant import.
+        """Get a date and timestamp of the last updates of ant import. The
+        most recent progress reported by a running import is returned as well
+        (or null), it can be more recent than the database state.
         ---
         parameters:
           - name: project_id
@@ -1230,4 +2703,5 @@ class LastImportUpdate(APIView):
             'id': r[0],
             'edition_time': r[1],
             'status': SynapseImport.Status.labels[r[2]],
+            'progress': get_cached_progress(r[0]),
         })
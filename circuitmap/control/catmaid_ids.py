@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""A process level cache of CATMAID relation and class IDs per project."""
+import threading
+
+
+class ProjectIds(object):
+    """Relation and class IDs of a project, each mapped from their name."""
+
+    def __init__(self, relations, classes):
+        self.relations = relations
+        self.classes = classes
+
+    @property
+    def label_class(self):
+        return self.classes['label']
+
+    @property
+    def annotation_class(self):
+        return self.classes['annotation']
+
+
+_project_ids = {} # type: dict
+_project_ids_lock = threading.Lock()
+
+
+def get_project_ids(cursor, project_id):
+    """Get the relation and class IDs of the passed in project. They are loaded
+    only once per process and project, until invalidate_project_ids() is
+    called.
+    """
+    project_id = int(project_id)
+    with _project_ids_lock:
+        ids = _project_ids.get(project_id)
+    if ids is not None:
+        return ids
+
+    cursor.execute('''
+        SELECT relation_name, id FROM relation
+        WHERE project_id = %(project_id)s
+    ''', {
+        'project_id': project_id,
+    })
+    relations = dict(cursor.fetchall())
+
+    cursor.execute('''
+        SELECT class_name, id FROM class
+        WHERE project_id = %(project_id)s
+    ''', {
+        'project_id': project_id,
+    })
+    classes = dict(cursor.fetchall())
+
+    ids = ProjectIds(relations, classes)
+    with _project_ids_lock:
+        _project_ids[project_id] = ids
+    return ids
+
+
+def get_relation_id(cursor, project_id, relation_name):
+    """Get the ID of a relation in the passed in project. If it isn't known, the
+    project's cached IDs are reloaded once, in case the relation was created
+    after they were loaded.
+    """
+    relations = get_project_ids(cursor, project_id).relations
+    if relation_name not in relations:
+        invalidate_project_ids(project_id)
+        relations = get_project_ids(cursor, project_id).relations
+    return relations[relation_name]
+
+
+def get_class_id(cursor, project_id, class_name):
+    """Get the ID of a class in the passed in project, see get_relation_id()."""
+    classes = get_project_ids(cursor, project_id).classes
+    if class_name not in classes:
+        invalidate_project_ids(project_id)
+        classes = get_project_ids(cursor, project_id).classes
+    return classes[class_name]
+
+
+def invalidate_project_ids(project_id=None):
+    """Remove the cached IDs of the passed in project or of all projects, if no
+    project is passed in.
+    """
+    with _project_ids_lock:
+        if project_id is None:
+            _project_ids.clear()
+        else:
+            _project_ids.pop(int(project_id), None)
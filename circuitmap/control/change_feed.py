@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Wait for changes of synapse imports, using Postgres' LISTEN/NOTIFY."""
+import json
+import select
+import time
+
+from django.db import connection
+
+
+CHANNEL = 'circuitmap_import_update'
+
+
+def get_last_update(cursor, project_id):
+    """Return the most recent edition time of all imports in a project or the
+    current time, if there are none.
+    """
+    cursor.execute("""
+        SELECT COALESCE(MAX(edition_time), now())
+        FROM circuitmap_synapseimport
+        WHERE project_id = %(project_id)s
+    """, {
+        'project_id': project_id,
+    })
+    return cursor.fetchone()[0]
+
+
+def get_changed_imports(cursor, project_id, since):
+    """Return the IDs of all imports in a project changed after <since>."""
+    cursor.execute("""
+        SELECT id
+        FROM circuitmap_synapseimport
+        WHERE project_id = %(project_id)s
+        AND edition_time > %(since)s
+        ORDER BY edition_time, id
+    """, {
+        'project_id': project_id,
+        'since': since,
+    })
+    return [r[0] for r in cursor.fetchall()]
+
+
+def wait_for_import_changes(project_id, since, timeout):
+    """Wait up to <timeout> seconds for imports of the passed in project to be
+    created, changed or deleted after <since>. Returns the list of changed
+    import IDs, which is empty if nothing changed. Changes are announced by a
+    database trigger on commit, waiting doesn't need any queries. This only
+    works outside of transactions, inside them changes are only checked once.
+    """
+    project_id = int(project_id)
+    cursor = connection.cursor()
+    if connection.in_atomic_block:
+        return get_changed_imports(cursor, project_id, since)
+
+    # Listen before looking for changes, so that no change is missed.
+    cursor.execute(f'LISTEN {CHANNEL}')
+    pg_connection = connection.connection
+    try:
+        changed = get_changed_imports(cursor, project_id, since)
+        deadline = time.monotonic() + timeout
+        while not changed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if select.select([pg_connection], [], [], remaining) == ([], [], []):
+                break
+            pg_connection.poll()
+            while pg_connection.notifies:
+                notification = pg_connection.notifies.pop(0)
+                try:
+                    payload = json.loads(notification.payload)
+                except ValueError:
+                    continue
+                if payload.get('project_id') == project_id:
+                    changed.append(payload['id'])
+    finally:
+        cursor.execute(f'UNLISTEN {CHANNEL}')
+        pg_connection.poll()
+        del pg_connection.notifies[:]
+
+    return sorted(set(changed))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Cooperative cancellation and persisted checkpoints of synapse imports.
+Import tasks check regularly whether their import was cancelled and record
+completed stages and partners, so that a task that is run again after its
+worker died continues where it stopped.
+"""
+from django.db import connection
+
+from circuitmap.models import SynapseImport
+
+
+class ImportCancelled(Exception):
+    """Raised by import tasks when their import was cancelled."""
+    pass
+
+
+def is_cancelled(import_id):
+    return SynapseImport.objects.filter(id=import_id,
+            status=SynapseImport.Status.CANCELLED).exists()
+
+
+def check_cancelled(import_id):
+    """Raise ImportCancelled if the passed in import was cancelled."""
+    if is_cancelled(import_id):
+        raise ImportCancelled(f'Import {import_id} was cancelled')
+
+
+def save_unless_cancelled(synapse_import, fields):
+    """Write the passed in <fields> of <synapse_import>, unless the import was
+    cancelled in the meantime. Full saves would overwrite the cancellation.
+    Returns True if the fields were written.
+    """
+    n_updated = SynapseImport.objects.filter(id=synapse_import.id) \
+            .exclude(status=SynapseImport.Status.CANCELLED) \
+            .update(**dict((field, getattr(synapse_import, field))
+                    for field in fields))
+    if not n_updated:
+        synapse_import.status = SynapseImport.Status.CANCELLED
+    return n_updated > 0
+
+
+def cancel_import(import_id):
+    """Mark an import along with its batch children as cancelled, unless it
+    is finished already. Running tasks stop at their next check. Returns True
+    if the import was cancelled.
+    """
+    final_statuses = [SynapseImport.Status.DONE, SynapseImport.Status.ERROR,
+            SynapseImport.Status.NO_DATA, SynapseImport.Status.CANCELLED]
+    n_cancelled = SynapseImport.objects.filter(id=import_id) \
+            .exclude(status__in=final_statuses) \
+            .update(status=SynapseImport.Status.CANCELLED,
+                    status_detail='Cancelled by user')
+    if n_cancelled:
+        SynapseImport.objects.filter(parent_id=import_id) \
+                .exclude(status__in=final_statuses) \
+                .update(status=SynapseImport.Status.CANCELLED,
+                        status_detail='Cancelled by user')
+    return n_cancelled > 0
+
+
+def complete_stage(import_id, stage):
+    """Record the completion of an import stage, e.g. "segment" or
+    "upstream". Partners completed in the stage aren't needed anymore.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        UPDATE circuitmap_synapseimport
+        SET completed_stages = array_append(completed_stages, %(stage)s),
+            completed_partners = '{}'::bigint[]
+        WHERE id = %(import_id)s
+        AND NOT %(stage)s = ANY(completed_stages)
+    """, {
+        'import_id': int(import_id),
+        'stage': stage,
+    })
+
+
+def get_checkpoint(import_id):
+    """Return the completed stages and the set of partner segments completed
+    in the current stage of an import.
+    """
+    stages, partners = SynapseImport.objects.values_list('completed_stages',
+            'completed_partners').get(id=import_id)
+    return set(stages), set(int(p) for p in partners)
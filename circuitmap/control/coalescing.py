@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of identical concurrent imports. The first import of a segment
+or skeleton with a particular set of options registers itself in the cache.
+Identical imports requested while it runs follow it instead of running on
+their own: they receive its progress and its result. The registry has to be
+shared by all web and worker processes, which requires a shared cache backend
+like Redis or Memcached.
+"""
+import hashlib
+import logging
+
+from celery import signature
+
+from django.conf import settings
+from django.core.cache import cache
+
+from catmaid.consumers import msg_user
+
+from circuitmap.models import SynapseImport
+
+
+FINAL_STATUSES = (SynapseImport.Status.DONE, SynapseImport.Status.ERROR,
+        SynapseImport.Status.NO_DATA, SynapseImport.Status.CANCELLED)
+
+# Cache backends that aren't shared between processes.
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache')
+
+logger = logging.getLogger(__name__)
+_warned_local_cache = False
+
+# Fields of a finished import that are copied to its followers.
+RESULT_FIELDS = ['status', 'status_detail', 'runtime', 'skeleton_id', 'txid',
+        'n_imported_links', 'n_imported_connectors', 'n_upstream_partners',
+        'n_downstream_partners', 'n_expected_upstream_partners',
+        'n_expected_downstream_partners', 'n_expected_links',
+        'n_expected_connectors']
+
+
+def is_enabled():
+    """Return whether imports are coalesced (CIRCUITMAP_COALESCE_IMPORTS,
+    default: True). With a cache backend that isn't shared between processes,
+    e.g. Django's default local memory cache, imports can't find each other
+    and coalescing is disabled.
+    """
+    global _warned_local_cache
+    if not getattr(settings, 'CIRCUITMAP_COALESCE_IMPORTS', True):
+        return False
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        if not _warned_local_cache:
+            logger.warning('Import coalescing needs a cache shared by all '
+                    f'processes, it is disabled with {backend}')
+            _warned_local_cache = True
+        return False
+    return True
+
+
+def get_inflight_key(project_id, kind, object_id, options):
+    """Get the registry key of an import of the segment or skeleton
+    <object_id>, <kind> is either "segment" or "skeleton". All <options> that
+    change the result of the import, e.g. thresholds, have to be included.
+    """
+    option_hash = hashlib.sha1(repr(sorted(options.items())).encode()).hexdigest()
+    return f'circuitmap-inflight-{int(project_id)}-{kind}-{int(object_id)}-{option_hash}'
+
+
+def _get_import_key(import_id):
+    return f'circuitmap-inflight-import-{int(import_id)}'
+
+
+def _get_task_key(import_id):
+    return f'circuitmap-inflight-task-{int(import_id)}'
+
+
+def claim(key, import_id):
+    """Register the import <import_id> as running for <key>. Returns None if
+    it was registered and has to run, otherwise the ID of the running import
+    it should follow. Registrations expire after CIRCUITMAP_INFLIGHT_TIMEOUT
+    (default: 3600) seconds, in case an import never finishes.
+    """
+    timeout = getattr(settings, 'CIRCUITMAP_INFLIGHT_TIMEOUT', 3600)
+    for _ in range(2):
+        if cache.add(key, int(import_id), timeout):
+            cache.set(_get_import_key(import_id), key, timeout)
+            return None
+        leader_id = cache.get(key)
+        if leader_id is not None:
+            return leader_id
+        # The running import finished in the meantime, try again.
+    return None
+
+
+def follow(synapse_import, leader_id, key, task):
+    """Let <synapse_import> follow the running import <leader_id>, which is
+    registered for <key>. The Celery signature <task> of the follower's own
+    import is kept, so that it can be started if the leader is cancelled. If
+    the leader finished in the meantime, its result is copied right away.
+    """
+    timeout = getattr(settings, 'CIRCUITMAP_INFLIGHT_TIMEOUT', 3600)
+    cache.set(_get_task_key(synapse_import.id), dict(task), timeout)
+    synapse_import.coalesced_with_id = leader_id
+    synapse_import.save(update_fields=['coalesced_with'])
+
+    # The leader releases its registration before it copies its result to
+    # its followers. A follower attached in between would be missed, which
+    # is why it checks the leader's state after it attached.
+    leader = SynapseImport.objects.get(id=leader_id)
+    if leader.status in FINAL_STATUSES:
+        complete_followers(leader, key)
+
+
+def release(import_id):
+    """Remove the registration of a finished import and pass its result on to
+    all imports that follow it. This has to be called after the final state
+    of the import has been saved.
+    """
+    import_key = _get_import_key(import_id)
+    key = cache.get(import_key)
+    if key is not None:
+        if cache.get(key) == int(import_id):
+            cache.delete(key)
+        cache.delete(import_key)
+
+    complete_followers(SynapseImport.objects.get(id=import_id), key)
+
+
+def complete_followers(leader, key=None):
+    """Copy the result of the finished import <leader> to all its unfinished
+    followers and inform their users. A cancellation only applies to the
+    import that was cancelled, followers of a cancelled import are started
+    again instead (see restart_followers()).
+    """
+    followers = list(SynapseImport.objects.filter(coalesced_with=leader)
+            .exclude(status__in=FINAL_STATUSES)
+            .values_list('id', 'user_id', 'request_id'))
+    if not followers:
+        return
+
+    if leader.status == SynapseImport.Status.CANCELLED:
+        restart_followers([f[0] for f in followers], key)
+        return
+
+    SynapseImport.objects.filter(id__in=[f[0] for f in followers]).update(
+            **dict((field, getattr(leader, field)) for field in RESULT_FIELDS))
+
+    for import_id, user_id, request_id in followers:
+        payload = {
+            'task': 'import-coalesced',
+            'import_id': import_id,
+            'coalesced_with': leader.id,
+            'request_id': request_id,
+            'status': SynapseImport.Status(leader.status).label,
+            'skeleton_id': leader.skeleton_id,
+            'n_inserted_synapses': leader.n_imported_connectors,
+            'n_inserted_links': leader.n_imported_links,
+            'n_upstream_partners': leader.n_upstream_partners,
+            'n_downstream_partners': leader.n_downstream_partners,
+        }
+        if leader.status == SynapseImport.Status.ERROR:
+            payload['error'] = leader.status_detail
+        msg_user(user_id, 'circuitmap-update', payload)
+
+
+def restart_followers(follower_ids, key=None):
+    """Start the imports <follower_ids> of a cancelled leader again. The first
+    one becomes the new leader for <key> and the others follow it. If another
+    import registered for <key> in the meantime, all of them follow that one.
+    Followers whose task expired fail.
+    """
+    tasks = cache.get_many([_get_task_key(i) for i in follower_ids])
+    runnable = [i for i in follower_ids if _get_task_key(i) in tasks]
+    expired = [i for i in follower_ids if _get_task_key(i) not in tasks]
+    if expired:
+        SynapseImport.objects.filter(id__in=expired) \
+                .exclude(status__in=FINAL_STATUSES) \
+                .update(status=SynapseImport.Status.ERROR, coalesced_with=None,
+                        status_detail='The followed import was cancelled')
+    if not runnable:
+        return
+
+    new_leader_id = runnable[0]
+    if key is not None:
+        leader_id = claim(key, new_leader_id)
+        if leader_id is not None:
+            SynapseImport.objects.filter(id__in=runnable) \
+                    .update(coalesced_with_id=leader_id)
+            leader = SynapseImport.objects.get(id=leader_id)
+            if leader.status in FINAL_STATUSES:
+                complete_followers(leader, key)
+            return
+
+    SynapseImport.objects.filter(id=new_leader_id).update(coalesced_with=None)
+    SynapseImport.objects.filter(id__in=runnable[1:]) \
+            .update(coalesced_with_id=new_leader_id)
+    task_key = _get_task_key(new_leader_id)
+    cache.delete(task_key)
+    signature(tasks[task_key]).apply_async()
+
+
+def get_followers(import_id):
+    """Return (import ID, user ID, request ID) for each import that follows
+    the passed in import.
+    """
+    return list(SynapseImport.objects.filter(coalesced_with_id=import_id)
+            .values_list('id', 'user_id', 'request_id'))
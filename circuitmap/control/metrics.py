@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Counters and latency histograms of imports, exported in the Prometheus text
+format. Each process collects increments in memory and adds them to the
+shared circuitmap_metric table, at most every CIRCUITMAP_METRICS_FLUSH_INTERVAL
+(default: 10) seconds and after each task. This makes the values of all web
+and Celery worker processes available to every process.
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from circuitmap.models import SynapseImport
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+        30, 60, 300, 900, 3600)
+
+# Name, type and description of all exported metrics.
+METRICS = {
+    'circuitmap_imports': ('gauge', 'Synapse imports by status.'),
+    'circuitmap_import_queue_wait_seconds': ('histogram',
+        'Time from the creation of an import until it starts computing.'),
+    'circuitmap_task_seconds': ('histogram',
+        'Runtime of import tasks by task and outcome.'),
+    'circuitmap_stage_seconds': ('histogram',
+        'Time spent in an import stage, e.g. link fetch or skeleton download.'),
+    'circuitmap_links_fetched_total': ('counter',
+        'Synaptic links read from circuitmap_synlinks.'),
+    'circuitmap_rows_written_total': ('counter',
+        'Rows created by imports by table.'),
+    'circuitmap_cache_requests_total': ('counter',
+        'Look-ups of skeleton and plan caches by cache and result (hit or miss).'),
+}
+
+_buffer = {}
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+_task_starts = {}
+
+
+def _reset():
+    """Drop the increments of the parent process after a fork, the parent
+    writes them itself.
+    """
+    global _buffer, _buffer_lock, _last_flush, _task_starts
+    _buffer = {}
+    _buffer_lock = threading.Lock()
+    _last_flush = time.monotonic()
+    _task_starts = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    """Return the Prometheus representation of a label dictionary, with labels
+    sorted by name so that it can identify a series.
+    """
+    return ','.join(f'{name}="{_escape(value)}"'
+            for name, value in sorted(labels.items()))
+
+
+def _add(name, labels, value):
+    key = (name, format_labels(labels))
+    with _buffer_lock:
+        _buffer[key] = _buffer.get(key, 0) + value
+
+
+def inc(name, value=1, **labels):
+    """Increase the counter <name> with the passed in labels by <value>."""
+    if value:
+        _add(name, labels, value)
+        maybe_flush()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Add a measurement to the histogram <name> with the passed in labels.
+    Buckets are stored cumulatively, like they are exported.
+    """
+    for bound in buckets:
+        if value <= bound:
+            _add(f'{name}_bucket', dict(labels, le=bound), 1)
+    _add(f'{name}_bucket', dict(labels, le='+Inf'), 1)
+    _add(f'{name}_sum', labels, value)
+    _add(f'{name}_count', labels, 1)
+    maybe_flush()
+
+
+def observe_queue_wait(synapse_import):
+    """Record the queue wait time of an import that starts computing. Imports
+    that were started before, e.g. resumed tasks, are ignored.
+    """
+    if synapse_import.status in (SynapseImport.Status.CREATED,
+            SynapseImport.Status.QUEUED) and synapse_import.creation_time:
+        wait = (timezone.now() - synapse_import.creation_time).total_seconds()
+        observe('circuitmap_import_queue_wait_seconds', max(0, wait),
+                queue=synapse_import.queue or 'default')
+
+
+def maybe_flush():
+    interval = getattr(settings, 'CIRCUITMAP_METRICS_FLUSH_INTERVAL', 10)
+    if time.monotonic() - _last_flush >= interval and \
+            not connection.in_atomic_block:
+        flush()
+
+
+def flush():
+    """Add all collected increments to the metric table, in one statement.
+    Errors are logged, metrics must not break imports.
+    """
+    global _buffer, _last_flush
+    with _buffer_lock:
+        increments, _buffer = _buffer, {}
+        _last_flush = time.monotonic()
+    if not increments:
+        return
+
+    # Rows are always locked in the same order to avoid deadlocks between
+    # processes.
+    keys = sorted(increments.keys())
+    try:
+        with transaction.atomic():
+            connection.cursor().execute("""
+                INSERT INTO circuitmap_metric AS m (name, labels, value)
+                SELECT * FROM UNNEST(%(names)s::text[], %(labels)s::text[],
+                    %(values)s::float8[])
+                ON CONFLICT (name, labels)
+                DO UPDATE SET value = m.value + EXCLUDED.value
+            """, {
+                'names': [k[0] for k in keys],
+                'labels': [k[1] for k in keys],
+                'values': [float(increments[k]) for k in keys],
+            })
+    except Exception as ex:
+        logger.warning(f'Could not store {len(keys)} metrics: {ex}')
+
+
+def task_started(task_id, task, **kwargs):
+    """Celery task_prerun handler"""
+    if task.name.startswith('circuitmap.'):
+        _task_starts[task_id] = time.monotonic()
+
+
+def task_finished(task_id, task, state=None, **kwargs):
+    """Celery task_postrun handler, which also writes the metrics of the task.
+    """
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        observe('circuitmap_task_seconds', time.monotonic() - start,
+                task=task.name.rsplit('.', 1)[-1],
+                outcome='success' if state == 'SUCCESS' else 'error')
+        flush()
+
+
+def get_import_counts(cursor):
+    cursor.execute("""
+        SELECT status, COUNT(*)
+        FROM circuitmap_synapseimport
+        GROUP BY status
+    """)
+    labels = dict(SynapseImport.Status.choices)
+    return [(labels.get(status, str(status)), count)
+            for status, count in cursor.fetchall()]
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(cursor):
+    """Return all metrics in the Prometheus text format (version 0.0.4)."""
+    flush()
+    cursor.execute("""
+        SELECT name, labels, value
+        FROM circuitmap_metric
+        ORDER BY name, labels
+    """)
+    series = {}
+    for name, labels, value in cursor.fetchall():
+        base_name = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                base_name = name[:-len(suffix)]
+        series.setdefault(base_name, []).append((name, labels, value))
+    series['circuitmap_imports'] = [('circuitmap_imports',
+            format_labels({'status': status}), count)
+            for status, count in get_import_counts(cursor)]
+
+    lines = []
+    for base_name, (metric_type, description) in METRICS.items():
+        lines.append(f'# HELP {base_name} {description}')
+        lines.append(f'# TYPE {base_name} {metric_type}')
+        rows = series.get(base_name, [])
+        if metric_type == 'histogram':
+            # Buckets have to be listed in increasing order.
+            rows.sort(key=lambda r: (r[0] != f'{base_name}_bucket',
+                    _histogram_series(r[1]), _bucket_bound(r[1])))
+        for name, labels, value in rows:
+            lines.append(f'{name}{{{labels}}} {_format_value(value)}'
+                    if labels else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_series(labels):
+    return ','.join(l for l in labels.split(',') if not l.startswith('le='))
+
+
+def _bucket_bound(labels):
+    for label in labels.split(','):
+        if label.startswith('le='):
+            return float(label[4:-1].replace('+Inf', 'inf'))
+    return 0
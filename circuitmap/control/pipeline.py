@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""A small engine to run import stages as producer/consumer threads."""
+import contextvars
+import queue
+import threading
+from collections import defaultdict
+from timeit import default_timer as timer
+
+from django.conf import settings
+from django.db import connections
+
+
+class Stage(object):
+    """A pipeline stage that applies <function> to each value it receives
+    from the previous stage, using <n_workers> threads.
+    """
+
+    def __init__(self, name, function, n_workers=1):
+        self.name = name
+        self.function = function
+        self.n_workers = max(1, int(n_workers))
+
+
+class StageError(object):
+    """The error a stage raised for an item. It is passed through all
+    following stages unchanged.
+    """
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+_done = object()
+
+
+class Pipeline(object):
+    """Run a list of stages on a sequence of items. Each stage runs in its own
+    threads and passes its results through a bounded queue to the next stage,
+    so that e.g. downloads, computations and database work for different items
+    overlap. Items are yielded with their result in the order they leave the
+    last stage. Stages work on I/O or release the GIL, so threads are
+    sufficient. The time spent in each stage is summed up in <timings>. Stage
+    functions run in a copy of the caller's context, i.e. see its context
+    variables.
+    """
+
+    def __init__(self, stages, queue_size=None):
+        if queue_size is None:
+            queue_size = getattr(settings, 'CIRCUITMAP_PIPELINE_QUEUE_SIZE', 4)
+        self.stages = stages
+        self.queue_size = max(1, int(queue_size))
+        self.timings = defaultdict(float)
+        self._timings_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _put(self, target, value):
+        while not self._stop.is_set():
+            try:
+                target.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _done
+
+    def _feed(self, items, target, n_consumers):
+        try:
+            for item in items:
+                if not self._put(target, (item, item)):
+                    return
+        finally:
+            for _ in range(n_consumers):
+                self._put(target, _done)
+
+    def _work(self, stage, source, target, remaining, n_consumers):
+        try:
+            while True:
+                entry = self._get(source)
+                if entry is _done:
+                    break
+                item, value = entry
+                if not isinstance(value, StageError):
+                    start = timer()
+                    try:
+                        value = stage.function(value)
+                    except Exception as ex:
+                        value = StageError(stage.name, ex)
+                    with self._timings_lock:
+                        self.timings[stage.name] += timer() - start
+                if not self._put(target, (item, value)):
+                    break
+        finally:
+            # Database connections are per thread and need to be closed
+            # explicitly.
+            connections.close_all()
+            with remaining[1]:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in range(n_consumers):
+                    self._put(target, _done)
+
+    def run(self, items):
+        """Start processing the passed in <items> and return a generator of
+        (item, result) tuples. If a stage failed for an item, the result is a
+        StageError. Processing starts right away, so that the caller can do
+        other work before consuming results. The returned generator has to be
+        consumed or stop() has to be called to stop all threads. Closing the
+        generator isn't enough if it was never started.
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, daemon=True,
+                args=(iter(items), queues[0], self.stages[0].n_workers))]
+        # A context can only be entered by one thread at a time.
+        for i, stage in enumerate(self.stages):
+            n_consumers = self.stages[i + 1].n_workers \
+                    if i + 1 < len(self.stages) else 1
+            remaining = [stage.n_workers, threading.Lock()]
+            for _ in range(stage.n_workers):
+                threads.append(threading.Thread(
+                        target=contextvars.copy_context().run, daemon=True,
+                        args=(self._work, stage, queues[i], queues[i + 1],
+                        remaining, n_consumers)))
+
+        self._stop.clear()
+        self._threads = threads
+        for thread in threads:
+            thread.start()
+        return self._results(queues[-1])
+
+    def stop(self):
+        """Stop all threads and wait for them to exit. Items that weren't
+        processed yet are dropped.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _results(self, source):
+        try:
+            while True:
+                entry = self._get(source)
+                if entry is _done:
+                    break
+                yield entry
+        finally:
+            # Stop all threads if the consumer stops early
+            self.stop()
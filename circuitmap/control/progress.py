@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Throttled progress reporting for synapse imports."""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Func, Q, Value
+
+from catmaid.consumers import msg_user
+
+from circuitmap.models import SynapseImport
+from circuitmap.control.coalescing import get_followers
+
+
+def get_progress_key(import_id):
+    return f'circuitmap-progress-{int(import_id)}'
+
+
+def get_cached_progress(import_id):
+    """Return the most recent progress of an import as reported by
+    ImportProgress, or None if none is known.
+    """
+    return cache.get(get_progress_key(import_id))
+
+
+class ImportProgress(object):
+    """Report the progress of a SynapseImport. Field values and counter
+    increments are collected and written with a single UPDATE of only these
+    fields at most every CIRCUITMAP_PROGRESS_WRITE_INTERVAL (default: 5)
+    seconds. The most recent state is also kept in the cache and pushed to the
+    user with msg_user() at most every CIRCUITMAP_PROGRESS_PUSH_INTERVAL
+    (default: 1) seconds, if a <user_id> is given. Imports that follow this
+    import (see coalescing.py) get the same updates. Status changes are
+    written and pushed right away. Call flush() when done.
+    """
+
+    def __init__(self, import_id, user_id=None, message_payload=None):
+        self.import_id = int(import_id)
+        self.user_id = user_id
+        self.message_payload = message_payload
+        self.write_interval = getattr(settings, 'CIRCUITMAP_PROGRESS_WRITE_INTERVAL', 5)
+        self.push_interval = getattr(settings, 'CIRCUITMAP_PROGRESS_PUSH_INTERVAL', 1)
+        self.state = {}
+        self._values = {}
+        self._increments = {}
+        self._cached_increments = {}
+        self._completed_partners = []
+        self._last_write = time.monotonic()
+        self._last_push = 0
+        self._lock = threading.Lock()
+
+    def set(self, **values):
+        """Set import fields to new values, e.g. n_upstream_partners=10."""
+        with self._lock:
+            self._values.update(values)
+            self.state.update(values)
+        self._report(force='status' in values)
+
+    def increment(self, **counters):
+        """Increase integer fields of the import atomically, e.g. to count
+        imported partners from multiple tasks. Cached counters are shared by
+        all reporters of an import.
+        """
+        with self._lock:
+            for field, n in counters.items():
+                self._increments[field] = self._increments.get(field, 0) + n
+                self._cached_increments[field] = \
+                        self._cached_increments.get(field, 0) + n
+        self._report()
+
+    def complete_partner(self, segment_id):
+        """Add a partner segment to the checkpoint of the import. It is
+        written along with the other changes, so that the checkpoint matches
+        the written counters.
+        """
+        with self._lock:
+            self._completed_partners.append(int(segment_id))
+        self._report()
+
+    def set_status(self, status, detail=None):
+        values = {'status': status}
+        if detail is not None:
+            values['status_detail'] = detail
+        self.set(**values)
+
+    def flush(self):
+        """Write and push all pending changes."""
+        self._report(force=True)
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            write = force or now - self._last_write >= self.write_interval
+            push = force or now - self._last_push >= self.push_interval
+            if write:
+                updates = dict(self._values)
+                for field, n in self._increments.items():
+                    updates[field] = F(field) + n
+                if self._completed_partners:
+                    field = SynapseImport._meta.get_field('completed_partners')
+                    updates['completed_partners'] = Func(F('completed_partners'),
+                            Value(self._completed_partners, output_field=field),
+                            function='array_cat', output_field=field)
+                self._values, self._increments = {}, {}
+                self._completed_partners = []
+                self._last_write = now
+            if push:
+                cached_increments = self._cached_increments
+                self._cached_increments = {}
+                self._last_push = now
+
+        if write and updates:
+            imports = SynapseImport.objects.filter(Q(id=self.import_id) |
+                    Q(coalesced_with_id=self.import_id))
+            # Cancelled imports stay cancelled.
+            if 'status' in updates:
+                imports = imports.exclude(status=SynapseImport.Status.CANCELLED)
+            imports.update(**updates)
+        if push:
+            self._push(cached_increments)
+
+    def _push(self, cached_increments):
+        timeout = getattr(settings, 'CIRCUITMAP_PROGRESS_CACHE_TIMEOUT', 3600)
+        for field, n in cached_increments.items():
+            key = f'{get_progress_key(self.import_id)}-{field}'
+            cache.add(key, 0, timeout)
+            value = cache.incr(key, n)
+            with self._lock:
+                self.state[field] = value
+        with self._lock:
+            state = dict(self.state)
+
+        if 'status' in state:
+            state['status'] = SynapseImport.Status(state['status']).label
+        cache.set(get_progress_key(self.import_id), state, timeout)
+        if self.user_id is None:
+            return
+        payload = {
+            'task': 'import-progress',
+            'import_id': self.import_id,
+            'progress': state,
+        }
+        if self.message_payload:
+            payload.update((k, v) for k, v in self.message_payload.items()
+                    if k != 'task')
+        msg_user(self.user_id, 'circuitmap-update', payload)
+
+        for import_id, user_id, request_id in get_followers(self.import_id):
+            msg_user(user_id, 'circuitmap-update', dict(payload,
+                    import_id=import_id, request_id=request_id))
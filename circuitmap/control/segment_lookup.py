@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Look up segment IDs at voxel locations with a per-process chunk cache."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from django.conf import settings
+
+
+class SegmentLookup(object):
+    """Find the segment IDs at voxel locations of a CloudVolume segmentation.
+    Whole chunks are downloaded anyway, so they are kept in a per-process LRU
+    cache of CIRCUITMAP_SEGMENT_CHUNK_CACHE_SIZE (default: 64) chunks. Points
+    in the same chunk are resolved with a single download.
+    """
+
+    def __init__(self, cv, mip=0):
+        self.cv = cv
+        self.mip = mip
+        self.chunk_size = np.array(cv.meta.chunk_size(mip), dtype=np.int64)
+        bounds = cv.meta.bounds(mip)
+        self.min_point = np.array(bounds.minpt, dtype=np.int64)
+        self.max_point = np.array(bounds.maxpt, dtype=np.int64)
+        self._chunks = OrderedDict() # type: OrderedDict
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_chunk(self, chunk_start):
+        key = tuple(chunk_start)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return chunk
+            self.misses += 1
+
+        chunk_end = np.minimum(chunk_start + self.chunk_size, self.max_point)
+        chunk = np.asarray(self.cv[chunk_start[0]:chunk_end[0],
+                chunk_start[1]:chunk_end[1], chunk_start[2]:chunk_end[2]])[..., 0]
+
+        max_size = getattr(settings, 'CIRCUITMAP_SEGMENT_CHUNK_CACHE_SIZE', 64)
+        with self._lock:
+            self._chunks[key] = chunk
+            while len(self._chunks) > max_size:
+                self._chunks.popitem(last=False)
+        return chunk
+
+    def lookup(self, points):
+        """Return the segment ID for each voxel location in <points> (N x 3).
+        Points outside of the volume get segment ID 0.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 3)
+        segment_ids = np.zeros(len(points), dtype=np.uint64)
+        inside = np.all((points >= self.min_point) & (points < self.max_point), axis=1)
+
+        chunk_starts = self.min_point + \
+                (points - self.min_point) // self.chunk_size * self.chunk_size
+        for chunk_start in np.unique(chunk_starts[inside], axis=0):
+            in_chunk = inside & np.all(chunk_starts == chunk_start, axis=1)
+            chunk = self._get_chunk(chunk_start)
+            offsets = points[in_chunk] - chunk_start
+            segment_ids[in_chunk] = chunk[offsets[:, 0], offsets[:, 1], offsets[:, 2]]
+
+        return segment_ids
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Conversion of autoseg skeletons into CATMAID treenode rows."""
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+# ID handling: method globally unique ID
+MAX_NODES = 100000 # max. number of nodes / autoseg skeleton allowed
+NR_PROJECTS = 10 # max number of projects / instance allowed
+
+
+def mapping_skel_nid(segment_id, nid, project_id):
+    return int( int(segment_id) * MAX_NODES * NR_PROJECTS + int(nid) * NR_PROJECTS + int(project_id) )
+
+
+def mapping_skel_nids(segment_id, nids, project_id):
+    """Like mapping_skel_nid(), but for an array of node indices. Returns an
+    int64 array of node IDs. If the node IDs don't fit into int64, an object
+    array of Python integers with the same values as mapping_skel_nid() is
+    returned instead.
+    """
+    nids = np.asarray(nids, dtype=np.int64)
+    if len(nids) == 0:
+        return nids
+    int64_info = np.iinfo(np.int64)
+    bounds = [mapping_skel_nid(segment_id, int(nid), project_id)
+            for nid in (nids.min(), nids.max())]
+    if int64_info.min <= min(bounds) and max(bounds) <= int64_info.max:
+        return np.int64(segment_id) * np.int64(MAX_NODES * NR_PROJECTS) + \
+                nids * np.int64(NR_PROJECTS) + np.int64(project_id)
+    return np.array([mapping_skel_nid(segment_id, nid, project_id)
+            for nid in nids.tolist()], dtype=object)
+
+
+def autoseg_skeleton_to_rows(s1, segment_id, project_id):
+    """Convert the autoseg skeleton <s1> (with vertices, edges and radius) into
+    treenode rows. Only the largest connected component is used. Its root is
+    vertex 0 if it is part of the component, otherwise its first vertex, which
+    then gets the node ID of vertex 0. This way the root node ID can always be
+    derived from the segment ID. Returns a dictionary of arrays, ordered
+    breadth first from the root: "id", "parent_id" (-1 for the root),
+    "location" (N x 3, truncated to integers), "radius" and "vertex" (the
+    original vertex index).
+    """
+    n_vertices = len(s1.vertices)
+    if n_vertices == 0:
+        return {
+            'id': np.zeros(0, dtype=np.int64),
+            'parent_id': np.zeros(0, dtype=np.int64),
+            'location': np.zeros((0, 3), dtype=np.int64),
+            'radius': np.zeros(0, dtype=np.float64),
+            'vertex': np.zeros(0, dtype=np.int64),
+        }
+
+    edges = np.asarray(s1.edges, dtype=np.int64).reshape(-1, 2)
+    adjacency = sparse.coo_matrix(
+            (np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])),
+            shape=(n_vertices, n_vertices)).tocsr()
+
+    n_components, labels = csgraph.connected_components(adjacency,
+            directed=False)
+    if n_components > 1:
+        largest_component = np.bincount(labels).argmax()
+        root = 0 if labels[0] == largest_component else \
+                int(np.argmax(labels == largest_component))
+    else:
+        root = 0
+
+    # The BFS only reaches the root's component and orders parents before
+    # their children.
+    order, predecessors = csgraph.breadth_first_order(adjacency, root,
+            directed=False, return_predecessors=True)
+
+    local_ids = np.arange(n_vertices, dtype=np.int64)
+    local_ids[root] = 0
+    node_ids = mapping_skel_nids(segment_id, local_ids, project_id)
+
+    parents = predecessors[order]
+    has_parent = parents >= 0
+    parent_ids = np.full(len(order), -1, dtype=node_ids.dtype)
+    parent_ids[has_parent] = node_ids[parents[has_parent]]
+
+    return {
+        'id': node_ids[order],
+        'parent_id': parent_ids,
+        'location': np.asarray(s1.vertices)[order].astype(np.int64),
+        'radius': np.asarray(s1.radius, dtype=np.float64)[order],
+        'vertex': order.astype(np.int64),
+    }
+
+
+def _point_segment_distances(points, start, end):
+    """Return the distances of all <points> (N x 3) to the line segment from
+    <start> to <end>.
+    """
+    direction = end - start
+    length2 = float(np.dot(direction, direction))
+    if length2 == 0:
+        return np.linalg.norm(points - start, axis=1)
+    t = np.clip(np.dot(points - start, direction) / length2, 0, 1)
+    return np.linalg.norm(points - (start + t[:, np.newaxis] * direction), axis=1)
+
+
+def _chain_significance(locations):
+    """Return for each interior point of a chain of <locations> the largest
+    tolerance for which the Ramer-Douglas-Peucker algorithm would keep it.
+    """
+    significance = np.zeros(len(locations))
+    stack = [(0, len(locations) - 1, np.inf)]
+    while stack:
+        first, last, cap = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _point_segment_distances(locations[first + 1:last],
+                locations[first], locations[last])
+        split = first + 1 + int(np.argmax(distances))
+        # A point is never more significant than the point that split the
+        # interval it is part of.
+        value = min(float(distances[split - first - 1]), cap)
+        significance[split] = value
+        stack.append((first, split, value))
+        stack.append((split, last, value))
+    return significance[1:-1]
+
+
+def simplify_skeleton_rows(rows, tolerance=None, node_budget=None, keep_ids=None):
+    """Remove nodes of degree two from skeleton rows (see
+    autoseg_skeleton_to_rows()), while keeping the root, branch points, leaves
+    and all nodes in <keep_ids>, e.g. nodes synapses attach to. Chains of
+    degree two nodes between kept nodes are simplified with the
+    Ramer-Douglas-Peucker algorithm: only nodes further away than <tolerance>
+    from the simplified chain are kept. If a <node_budget> is given, at most
+    this many nodes are kept, as long as this isn't less than the number of
+    nodes that have to be kept anyway. Returns new rows with updated parents.
+    """
+    n_nodes = len(rows['id'])
+    if n_nodes == 0 or (tolerance is None and node_budget is None):
+        return rows
+
+    ids = rows['id']
+    locations = rows['location'].astype(np.float64)
+    sorted_index = np.argsort(ids)
+    parent_index = np.full(n_nodes, -1, dtype=np.int64)
+    has_parent = rows['parent_id'] >= 0
+    parent_index[has_parent] = sorted_index[np.searchsorted(ids[sorted_index],
+            rows['parent_id'][has_parent])]
+
+    n_children = np.bincount(parent_index[has_parent], minlength=n_nodes)
+    protected = ~has_parent | (n_children != 1)
+    if keep_ids is not None and len(keep_ids) > 0:
+        protected |= np.isin(ids, np.asarray(list(keep_ids), dtype=ids.dtype))
+
+    # Walk each chain of unprotected nodes from its protected lower end up to
+    # the next protected node.
+    significance = np.full(n_nodes, np.inf)
+    for end in np.flatnonzero(protected & has_parent):
+        chain = [end]
+        current = parent_index[end]
+        while not protected[current]:
+            chain.append(current)
+            current = parent_index[current]
+        if len(chain) == 1:
+            continue
+        chain.append(current)
+        chain = np.array(chain[::-1])
+        significance[chain[1:-1]] = _chain_significance(locations[chain])
+
+    kept = np.ones(n_nodes, dtype=bool)
+    if tolerance is not None:
+        kept &= significance > tolerance
+    if node_budget is not None and kept.sum() > node_budget:
+        n_optional = max(0, int(node_budget) - int(protected.sum()))
+        candidates = np.flatnonzero(kept & ~protected)
+        ranked = candidates[np.argsort(-significance[candidates], kind='stable')]
+        kept[ranked[n_optional:]] = False
+
+    # Rows are ordered breadth first, parents are therefore visited before
+    # their children.
+    kept_ancestor = np.arange(n_nodes)
+    for i in range(n_nodes):
+        if not kept[i] and parent_index[i] >= 0:
+            kept_ancestor[i] = kept_ancestor[parent_index[i]]
+
+    new_parent_ids = np.full(n_nodes, -1, dtype=ids.dtype)
+    new_parent_ids[has_parent] = ids[kept_ancestor[parent_index[has_parent]]]
+
+    return {
+        'id': ids[kept],
+        'parent_id': new_parent_ids[kept],
+        'location': rows['location'][kept],
+        'radius': rows['radius'][kept],
+        'vertex': rows['vertex'][kept],
+    }
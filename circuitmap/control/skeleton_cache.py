@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""A size bounded on-disk LRU cache for autoseg skeletons, shared by all
+processes on a host.
+"""
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from django.conf import settings
+
+
+class CachedSkeleton(object):
+    """An autoseg skeleton with the vertices, edges and radius arrays of a
+    CloudVolume skeleton.
+    """
+
+    def __init__(self, vertices, edges, radius):
+        self.vertices = vertices
+        self.edges = edges
+        self.radius = radius
+
+
+# Number of vertices and edges, followed by float32 vertices (N x 3), uint32
+# edges (M x 2) and float32 radii (N).
+_header = struct.Struct('<II')
+
+
+def encode_skeleton(skeleton):
+    """Encode the vertices, edges and radii of <skeleton> into a compressed
+    binary string.
+    """
+    vertices = np.ascontiguousarray(skeleton.vertices, dtype='<f4').reshape(-1, 3)
+    edges = np.ascontiguousarray(skeleton.edges, dtype='<u4').reshape(-1, 2)
+    radius = np.ascontiguousarray(skeleton.radius, dtype='<f4').reshape(-1)
+    data = _header.pack(len(vertices), len(edges)) + vertices.tobytes() + \
+            edges.tobytes() + radius.tobytes()
+    return zlib.compress(data, 1)
+
+
+def decode_skeleton(data):
+    """Decode a skeleton encoded with encode_skeleton()."""
+    data = zlib.decompress(data)
+    n_vertices, n_edges = _header.unpack_from(data)
+    offset = _header.size
+    vertices = np.frombuffer(data, dtype='<f4', count=n_vertices * 3,
+            offset=offset).reshape(-1, 3)
+    offset += vertices.nbytes
+    edges = np.frombuffer(data, dtype='<u4', count=n_edges * 2,
+            offset=offset).reshape(-1, 2)
+    offset += edges.nbytes
+    radius = np.frombuffer(data, dtype='<f4', count=n_vertices, offset=offset)
+    return CachedSkeleton(vertices, edges, radius)
+
+
+class SkeletonCache(object):
+    """Skeletons are stored in a SQLite database, keyed by CloudVolume URL,
+    skeleton key and segment ID. If the total size of all entries exceeds
+    <max_size> bytes, the least recently used entries are removed. SQLite's
+    locking makes the cache safe to use from multiple processes. Hits and
+    misses are counted in the database as well.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS skeleton (
+                    key TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            db.execute('''
+                CREATE INDEX IF NOT EXISTS skeleton_last_access
+                ON skeleton (last_access)
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS counter (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            db.execute('''
+                INSERT OR IGNORE INTO counter (name, value)
+                VALUES ('hits', 0), ('misses', 0)
+            ''')
+
+    def _connect(self):
+        # Connections are neither shared between threads nor across forks.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def get_key(cloudvolume_url, skeleton_key, segment_id):
+        return f'{cloudvolume_url}|{skeleton_key}|{int(segment_id)}'
+
+    def get(self, cloudvolume_url, skeleton_key, segment_id):
+        """Return the cached skeleton or None if it isn't cached."""
+        key = self.get_key(cloudvolume_url, skeleton_key, segment_id)
+        with self._connect() as db:
+            row = db.execute('SELECT data FROM skeleton WHERE key = ?',
+                    (key,)).fetchone()
+            if row is None:
+                db.execute("UPDATE counter SET value = value + 1 WHERE name = 'misses'")
+                return None
+            db.execute('UPDATE skeleton SET last_access = ? WHERE key = ?',
+                    (time.time(), key))
+            db.execute("UPDATE counter SET value = value + 1 WHERE name = 'hits'")
+        return decode_skeleton(row[0])
+
+    def put(self, cloudvolume_url, skeleton_key, segment_id, skeleton):
+        """Store a skeleton and evict least recently used skeletons, if the
+        cache is larger than its maximum size.
+        """
+        key = self.get_key(cloudvolume_url, skeleton_key, segment_id)
+        data = encode_skeleton(skeleton)
+        with self._connect() as db:
+            db.execute('''
+                INSERT OR REPLACE INTO skeleton (key, data, size, last_access)
+                VALUES (?, ?, ?, ?)
+            ''', (key, sqlite3.Binary(data), len(data), time.time()))
+            total_size = db.execute('SELECT COALESCE(SUM(size), 0) FROM skeleton').fetchone()[0]
+            if total_size > self.max_size:
+                # Keep the most recently used entries that fit
+                db.execute('''
+                    DELETE FROM skeleton
+                    WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS cum_size
+                            FROM skeleton
+                        ) s
+                        WHERE s.cum_size > ?
+                    )
+                ''', (self.max_size,))
+
+    def stats(self):
+        """Return the number of hits and misses along with the number of
+        entries and their total size in bytes.
+        """
+        with self._connect() as db:
+            counters = dict(db.execute('SELECT name, value FROM counter').fetchall())
+            n_entries, size = db.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM skeleton').fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'n_entries': n_entries,
+            'size': size,
+        }
+
+    def clear(self):
+        """Remove all entries and reset all counters."""
+        with self._connect() as db:
+            db.execute('DELETE FROM skeleton')
+            db.execute('UPDATE counter SET value = 0')
+
+
+_skeleton_cache = None
+_skeleton_cache_lock = threading.Lock()
+
+
+def get_skeleton_cache():
+    """Get the skeleton cache of this host. Its location and size are defined
+    by CIRCUITMAP_SKELETON_CACHE_PATH (default: circuitmap-skeletons.sqlite in
+    the temporary directory) and CIRCUITMAP_SKELETON_CACHE_MAX_SIZE (default:
+    1 GiB). If the path is set to None, no cache is used and None is returned.
+    """
+    global _skeleton_cache
+    path = getattr(settings, 'CIRCUITMAP_SKELETON_CACHE_PATH',
+            os.path.join(tempfile.gettempdir(), 'circuitmap-skeletons.sqlite'))
+    if not path:
+        return None
+    with _skeleton_cache_lock:
+        if _skeleton_cache is None or _skeleton_cache.path != path:
+            max_size = getattr(settings, 'CIRCUITMAP_SKELETON_CACHE_MAX_SIZE', 2**30)
+            _skeleton_cache = SkeletonCache(path, max_size)
+        return _skeleton_cache
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Spatial helpers to match synaptic links to skeleton nodes."""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.spatial as sp
+
+from django.conf import settings
+
+from circuitmap.control.timings import measure
+
+class SkeletonTree(object):
+    """A KD-tree of all nodes of a skeleton along with the node IDs and the
+    bounding box of the skeleton. Instances are immutable and can therefore be
+    shared between the pre and post link passes of an import as well as between
+    imports of the same skeleton version.
+    """
+
+    def __init__(self, node_ids, locations, version=None):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        self.version = version
+        if len(self.locations) > 0:
+            self.tree = sp.cKDTree(self.locations)
+            self.bb_min = self.locations.min(axis=0)
+            self.bb_max = self.locations.max(axis=0)
+        else:
+            self.tree = None
+            self.bb_min = None
+            self.bb_max = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def bounding_box(self, padding=0):
+        """Return the bounding box of the skeleton as pair of minimum and
+        maximum corner, expanded by <padding> in every direction. If the
+        skeleton has no nodes, None is returned.
+        """
+        if self.tree is None:
+            return None
+        return self.bb_min - padding, self.bb_max + padding
+
+    def in_bounding_box(self, points, padding=0):
+        """Return a boolean mask of all <points> that are inside the bounding
+        box of the skeleton, expanded by <padding>.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self.tree is None:
+            return np.zeros(len(points), dtype=bool)
+        bb_min, bb_max = self.bounding_box(padding)
+        return np.all((points >= bb_min) & (points <= bb_max), axis=1)
+
+    def query(self, points, distance_threshold=-1):
+        """Find the closest skeleton node for each point. If
+        <distance_threshold> is not negative, only nodes within this distance
+        are considered. Returns the distances and node indices. Points without
+        a node in range have an infinite distance and the index len(self).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self.tree is None or len(points) == 0:
+            return (np.full(len(points), np.inf),
+                    np.full(len(points), len(self), dtype=np.int64))
+        # The upper bound of cKDTree is exclusive, nodes at exactly the
+        # threshold distance are matched as well.
+        upper_bound = np.inf if distance_threshold < 0 else \
+                np.nextafter(distance_threshold, np.inf)
+        workers = getattr(settings, 'CIRCUITMAP_KDTREE_WORKERS', -1)
+        try:
+            return self.tree.query(points, distance_upper_bound=upper_bound,
+                    workers=workers)
+        except TypeError:
+            # SciPy < 1.6 calls the parameter n_jobs
+            return self.tree.query(points, distance_upper_bound=upper_bound,
+                    n_jobs=workers)
+
+
+def cluster_bounding_boxes(bounding_boxes):
+    """Group overlapping (minimum, maximum) bounding boxes. Boxes that are None
+    are skipped. Returns a list of (indices, bounding box) tuples, one for each
+    group, with the indices of its boxes and their combined bounding box. The
+    combined boxes don't overlap each other.
+    """
+    clusters = [([i], (np.asarray(bb[0]), np.asarray(bb[1])))
+            for i, bb in enumerate(bounding_boxes) if bb is not None]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(clusters)):
+            for j in range(len(clusters) - 1, i, -1):
+                (indices_a, (min_a, max_a)), (indices_b, (min_b, max_b)) = \
+                        clusters[i], clusters[j]
+                if np.all(min_a <= max_b) and np.all(min_b <= max_a):
+                    clusters[i] = (indices_a + indices_b,
+                            (np.minimum(min_a, min_b), np.maximum(max_a, max_b)))
+                    del clusters[j]
+                    merged = True
+    return clusters
+
+
+_tree_cache = OrderedDict() # type: OrderedDict
+_tree_cache_lock = threading.Lock()
+
+
+def get_skeleton_tree(cursor, project_id, skeleton_id):
+    """Get a SkeletonTree for the passed in skeleton. Trees are cached per
+    process and identified by the number of nodes and the most recent node edit,
+    so that repeated imports of an unchanged skeleton don't need to load and
+    index the skeleton again.
+    """
+    cursor.execute('''
+        SELECT COUNT(*), MAX(t.edition_time)
+        FROM treenode t
+        WHERE t.skeleton_id = %(skeleton_id)s
+        AND t.project_id = %(project_id)s
+    ''', {
+        'project_id': int(project_id),
+        'skeleton_id': int(skeleton_id),
+    })
+    version = tuple(cursor.fetchone())
+    key = (int(project_id), int(skeleton_id))
+
+    with _tree_cache_lock:
+        tree = _tree_cache.get(key)
+        if tree is not None and tree.version == version:
+            _tree_cache.move_to_end(key)
+            return tree
+
+    with measure('kdtree') as counters:
+        cursor.execute('''
+            SELECT t.id, t.location_x, t.location_y, t.location_z
+            FROM treenode t
+            WHERE t.skeleton_id = %(skeleton_id)s
+            AND t.project_id = %(project_id)s
+        ''', {
+            'project_id': int(project_id),
+            'skeleton_id': int(skeleton_id),
+        })
+        rows = cursor.fetchall()
+        tree = SkeletonTree([r[0] for r in rows], [r[1:] for r in rows], version)
+        counters['nodes'] = len(rows)
+
+    max_size = getattr(settings, 'CIRCUITMAP_SKELETON_TREE_CACHE_SIZE', 32)
+    with _tree_cache_lock:
+        _tree_cache[key] = tree
+        _tree_cache.move_to_end(key)
+        while len(_tree_cache) > max_size:
+            _tree_cache.popitem(last=False)
+
+    return tree
+
+
+def match_links_to_tree(tree, links, location_columns, distance_threshold=-1):
+    """Find the closest skeleton node for every link in the <links> data frame,
+    using the location in <location_columns>. If <distance_threshold> is not
+    negative, links outside of the skeleton's bounding box expanded by the
+    threshold are dropped before the KD-tree is queried and only links with a
+    node in range are returned. The returned data frame has the additional
+    columns "dist2" (distance to closest node), "skeleton_node_id_index" and
+    "treenode_id".
+    """
+    locations = links[location_columns].values
+    if distance_threshold >= 0:
+        in_bb = tree.in_bounding_box(locations, distance_threshold)
+        links = links[in_bb]
+        locations = locations[in_bb]
+
+    dist, idx = tree.query(locations, distance_threshold)
+    found = idx < len(tree)
+    links = links[found].copy()
+    links['dist2'] = dist[found]
+    links['skeleton_node_id_index'] = idx[found]
+    links['treenode_id'] = tree.node_ids[idx[found]]
+
+    return links
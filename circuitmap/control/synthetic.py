@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Generate a small synthetic precomputed dataset on the local file system,
+with a segmentation volume, sharded skeletons and matching synaptic links.
+"""
+import csv
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Columns of circuitmap_synlinks that are written, in this order.
+SYNLINK_COLUMNS = ['pre_x', 'pre_y', 'pre_z', 'post_x', 'post_y', 'post_z',
+        'scores', 'cleft_scores', 'dist', 'segmentid_pre', 'segmentid_post',
+        'offset', 'prob_min', 'prob_max', 'prob_sum', 'prob_mean', 'prob_count',
+        'cleft_id', 'clust_con_offset']
+
+SKELETON_ATTRIBUTES = [{
+    'id': 'radius',
+    'data_type': 'float32',
+    'num_components': 1,
+}]
+
+
+def random_skeleton(rng, n_nodes, size, step=4.0, branch_probability=0.05):
+    """Create a random walk skeleton of <n_nodes> voxel locations inside a
+    volume of <size>. With <branch_probability> a node continues from a
+    random earlier node instead of the last one. Returns vertices (N x 3) and
+    edges (N-1 x 2, child and parent).
+    """
+    size = np.asarray(size, dtype=np.float64)
+    vertices = np.zeros((n_nodes, 3))
+    vertices[0] = rng.uniform(0, size)
+    direction = rng.normal(size=3)
+    edges = []
+    for i in range(1, n_nodes):
+        parent = i - 1
+        if rng.random() < branch_probability:
+            parent = int(rng.integers(0, i))
+            direction = rng.normal(size=3)
+        direction = direction / np.linalg.norm(direction) + rng.normal(scale=0.3, size=3)
+        direction /= np.linalg.norm(direction)
+        location = vertices[parent] + step * direction
+        # Reflect at the volume boundaries
+        location = np.abs(location)
+        location = np.where(location > size - 1, 2 * (size - 1) - location, location)
+        vertices[i] = location
+        edges.append((i, parent))
+    return vertices, np.array(edges, dtype=np.uint32).reshape(-1, 2)
+
+
+def paint_skeleton(labels, vertices, edges, segment_id):
+    """Set all voxels along the edges of a skeleton (in voxel space) to
+    <segment_id>.
+    """
+    for child, parent in edges:
+        start, end = vertices[child], vertices[parent]
+        n_samples = max(2, int(np.ceil(np.linalg.norm(end - start))) + 1)
+        points = np.linspace(start, end, n_samples).astype(np.int64)
+        labels[points[:, 0], points[:, 1], points[:, 2]] = segment_id
+    points = vertices.astype(np.int64)
+    labels[points[:, 0], points[:, 1], points[:, 2]] = segment_id
+
+
+def random_synlinks(rng, skeletons, links_per_segment, max_partners=4,
+        first_offset=0):
+    """Create synaptic links between skeletons ({segment ID: physical
+    vertices}). Each segment gets about <links_per_segment> presynaptic links.
+    A presynaptic location is linked to up to <max_partners> close vertices of
+    other segments, these links share their clust_con_offset. Returns a list of
+    rows with SYNLINK_COLUMNS.
+    """
+    segment_ids = np.concatenate([np.full(len(v), s, dtype=np.uint64)
+            for s, v in skeletons.items()])
+    vertices = np.concatenate(list(skeletons.values()))
+    tree = cKDTree(vertices)
+    k = min(len(vertices), 8 * max_partners)
+
+    rows = []
+    offset = first_offset
+    for segment_id, segment_vertices in skeletons.items():
+        n_pre = rng.poisson(links_per_segment / ((1 + max_partners) / 2))
+        for pre_index in rng.integers(0, len(segment_vertices), n_pre):
+            pre = segment_vertices[pre_index]
+            distances, indices = tree.query(pre, k=k)
+            candidates = [(d, i) for d, i in zip(np.atleast_1d(distances),
+                    np.atleast_1d(indices)) if segment_ids[i] != segment_id]
+            n_partners = int(rng.integers(1, max_partners + 1))
+            clust_con_offset = offset
+            for dist, index in candidates[:n_partners]:
+                post = vertices[index]
+                probs = rng.integers(0, 256, 4)
+                rows.append([
+                    float(pre[0]), float(pre[1]), float(pre[2]),
+                    float(post[0]), float(post[1]), float(post[2]),
+                    float(rng.uniform(0, 1)), int(rng.integers(0, 256)),
+                    float(dist), int(segment_id), int(segment_ids[index]),
+                    offset, int(probs.min()), int(probs.max()),
+                    int(probs.sum()), int(probs.mean()), len(probs),
+                    clust_con_offset, clust_con_offset,
+                ])
+                offset += 1
+    return rows
+
+
+def shard_bits_for(n_segments):
+    """Use about 256 segments per shard."""
+    return max(0, int(np.ceil(np.log2(max(1, n_segments / 256)))))
+
+
+def generate_dataset(path, n_segments=100, n_nodes=200, links_per_segment=20,
+        size=(256, 256, 64), resolution=(1, 1, 1), chunk_size=(64, 64, 64),
+        first_segment_id=1000000, skeleton_key='skeletons', seed=None,
+        progress=None):
+    """Write a precomputed segmentation to the directory <path>, along with
+    sharded skeletons in <path>/<skeleton_key> and a synlinks.csv file with
+    synaptic links between them. Each of the <n_segments> segments is a
+    random walk skeleton with <n_nodes> nodes. Skeleton and link locations
+    are physical locations (voxel location times <resolution>). Returns the
+    URL of the volume and the list of link rows.
+    """
+    from cloudvolume import CloudVolume, Skeleton
+    from cloudvolume.datasource.precomputed.sharding import (
+            ShardingSpecification, synthesize_shard_files)
+
+    log = progress or (lambda message: None)
+    rng = np.random.default_rng(seed)
+    path = os.path.abspath(path)
+    url = f'precomputed://file://{path}'
+    resolution = np.asarray(resolution, dtype=np.float64)
+
+    labels = np.zeros(tuple(size), dtype=np.uint64)
+    skeletons = {}
+    edges = {}
+    for i in range(n_segments):
+        segment_id = first_segment_id + i
+        vertices, segment_edges = random_skeleton(rng, n_nodes, size)
+        paint_skeleton(labels, vertices, segment_edges, segment_id)
+        skeletons[segment_id] = vertices.astype(np.int64) * resolution
+        edges[segment_id] = segment_edges
+    log(f'Created {n_segments} skeletons')
+
+    info = CloudVolume.create_new_info(num_channels=1,
+            layer_type='segmentation', data_type='uint64', encoding='raw',
+            resolution=[int(r) for r in resolution], voxel_offset=[0, 0, 0],
+            volume_size=list(size), chunk_size=list(chunk_size))
+    cv = CloudVolume(url, info=info, progress=False)
+    cv.commit_info()
+    cv[:, :, :] = labels[..., np.newaxis]
+    log(f'Wrote segmentation of size {size}')
+
+    spec = ShardingSpecification(type='neuroglancer_uint64_sharded_v1',
+            preshift_bits=0, hash='murmurhash3_x86_128', minishard_bits=4,
+            shard_bits=shard_bits_for(n_segments),
+            minishard_index_encoding='gzip', data_encoding='gzip')
+    data = {}
+    for segment_id, vertices in skeletons.items():
+        skeleton = Skeleton(vertices.astype(np.float32), edges[segment_id],
+                radii=np.ones(len(vertices), dtype=np.float32),
+                segid=segment_id, extra_attributes=SKELETON_ATTRIBUTES)
+        data[segment_id] = skeleton.to_precomputed()
+
+    skeleton_path = os.path.join(path, skeleton_key)
+    os.makedirs(skeleton_path, exist_ok=True)
+    with open(os.path.join(skeleton_path, 'info'), 'w') as f:
+        json.dump({
+            '@type': 'neuroglancer_skeletons',
+            'transform': [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0],
+            'vertex_attributes': SKELETON_ATTRIBUTES,
+            'sharding': spec.to_dict(),
+            'spatial_index': None,
+        }, f)
+    for filename, content in synthesize_shard_files(spec, data).items():
+        with open(os.path.join(skeleton_path, filename), 'wb') as f:
+            f.write(content)
+    log(f'Wrote sharded skeletons to {skeleton_path}')
+
+    rows = random_synlinks(rng, skeletons, links_per_segment)
+    with open(os.path.join(path, 'synlinks.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SYNLINK_COLUMNS)
+        writer.writerows(rows)
+    log(f'Created {len(rows)} synaptic links')
+
+    return url, rows
+
+
+def load_synlinks(cursor, csv_path):
+    """Copy the synaptic links of a synlinks.csv file created by
+    generate_dataset() into circuitmap_synlinks. Offsets continue after the
+    largest existing offset. Returns the number of loaded links.
+    """
+    cursor.execute('SELECT COALESCE(MAX("offset") + 1, 0) FROM circuitmap_synlinks')
+    first_offset = cursor.fetchone()[0]
+
+    cursor.execute('''
+        CREATE TEMPORARY TABLE circuitmap_synlinks_import
+        (LIKE circuitmap_synlinks INCLUDING DEFAULTS)
+        ON COMMIT DROP
+    ''')
+    columns = ', '.join(f'"{c}"' for c in SYNLINK_COLUMNS)
+    with open(csv_path) as f:
+        cursor.copy_expert(f'''
+            COPY circuitmap_synlinks_import ({columns})
+            FROM STDIN WITH (FORMAT csv, HEADER true)
+        ''', f)
+
+    select_columns = ', '.join(
+        f'"{c}" + %(first_offset)s' if c in ('offset', 'clust_con_offset', 'cleft_id')
+        else f'"{c}"' for c in SYNLINK_COLUMNS)
+    cursor.execute(f'''
+        INSERT INTO circuitmap_synlinks ({columns})
+        SELECT {select_columns}
+        FROM circuitmap_synlinks_import
+    ''', {
+        'first_offset': first_offset,
+    })
+    return cursor.rowcount
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Collect the time spent in the stages of an import, e.g. segment look-up,
+link fetch or link writes, both in total and per partner segment.
+"""
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Now
+
+from circuitmap.models import SegmentImport, SynapseImport
+from circuitmap.control.metrics import observe
+
+
+_current = contextvars.ContextVar('circuitmap_timings', default=None)
+_partner = contextvars.ContextVar('circuitmap_timings_partner', default=None)
+
+
+class ImportTimings(object):
+    """The summed up time and number of calls of each stage, along with
+    optional counters like the number of fetched rows. Stage times of up to
+    CIRCUITMAP_TIMINGS_MAX_PARTNERS (default: 1000) partner segments are kept
+    separately.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.partners = {}
+        self.max_partners = getattr(settings, 'CIRCUITMAP_TIMINGS_MAX_PARTNERS', 1000)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, partner=None, **counters):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'time': 0.0, 'count': 0})
+            entry['time'] += seconds
+            entry['count'] += 1
+            for name, value in counters.items():
+                entry[name] = entry.get(name, 0) + value
+            if partner is not None:
+                partner = str(partner)
+                if partner in self.partners or len(self.partners) < self.max_partners:
+                    partner_entry = self.partners.setdefault(partner, {})
+                    partner_entry[stage] = partner_entry.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'stages': dict((stage, dict(entry)) for stage, entry in self.stages.items()),
+                'partners': dict((p, dict(e)) for p, e in self.partners.items()),
+            }
+
+
+def merge_timings(a, b):
+    """Return the sum of two nested timing dictionaries."""
+    result = dict(a or {})
+    for key, value in (b or {}).items():
+        if isinstance(value, dict):
+            result[key] = merge_timings(result.get(key), value)
+        elif isinstance(value, (int, float)) and isinstance(result.get(key), (int, float)):
+            result[key] = result[key] + value
+        else:
+            result[key] = value
+    return result
+
+
+def store_timings(import_id, timings):
+    """Add the passed in timings to the timings stored with an import. Tasks
+    of the same import can run in parallel, which is why the import is locked
+    for the update.
+    """
+    with transaction.atomic():
+        synapse_import = SynapseImport.objects.select_for_update() \
+                .only('timings').filter(id=import_id).first()
+        if synapse_import is None:
+            return
+        synapse_import.timings = merge_timings(synapse_import.timings,
+                timings.as_dict())
+        synapse_import.save(update_fields=['timings'])
+
+
+def store_segment_timings(import_id):
+    """Store the stage timings collected so far as timings of the segment
+    import of <import_id>. The edition time of the synapse import is updated
+    as well, so that import lists including the segment timings are known to
+    be changed.
+    """
+    timings = _current.get()
+    if timings is not None:
+        with transaction.atomic():
+            SegmentImport.objects.filter(synapse_import_id=import_id).update(
+                    timings=timings.as_dict()['stages'])
+            SynapseImport.objects.filter(id=import_id).update(edition_time=Now())
+
+
+@contextmanager
+def collect_timings(import_id):
+    """Collect the timings of all measured stages in this block and add them
+    to the timings of the import <import_id> at its end. Nested blocks, e.g.
+    of tasks called directly, add to the outermost block.
+    """
+    timings = _current.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = ImportTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        store_timings(import_id, timings)
+
+
+def collects_timings(task_function):
+    """Decorator for import tasks, which take the import ID as third
+    argument, to collect the timings of the task.
+    """
+    @functools.wraps(task_function)
+    def wrapper(project_id, user_id, import_id, *args, **kwargs):
+        with collect_timings(import_id):
+            return task_function(project_id, user_id, import_id, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def partner_timings(segment_id):
+    """Attribute stages measured in this block to a partner segment."""
+    token = _partner.set(segment_id)
+    try:
+        yield
+    finally:
+        _partner.reset(token)
+
+
+@contextmanager
+def measure(stage, **counters):
+    """Measure the time spent in this block as <stage>, if timings are
+    collected. The yielded dictionary can be used to add counters, e.g. the
+    number of rows, once they are known. The time is also added to the
+    circuitmap_stage_seconds metric.
+    """
+    timings = _current.get()
+    counters = dict(counters)
+    start = timer()
+    try:
+        yield counters
+    finally:
+        seconds = timer() - start
+        if timings is not None:
+            timings.add(stage, seconds, _partner.get(), **counters)
+        observe('circuitmap_stage_seconds', seconds, stage=stage)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Lazily created, per-process access to the segmentation volume and its
+skeleton source.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+from django.conf import settings
+
+from .settings import CLOUDVOLUME_URL, CLOUDVOLUME_SKELETONS
+from circuitmap.control.segment_lookup import SegmentLookup
+
+
+logger = logging.getLogger(__name__)
+
+_volume = None
+_volume_pid = None
+_segment_lookup = None
+_volume_lock = threading.Lock()
+
+
+def _reset():
+    """Forget the volume of the parent process. Its connections and threads
+    can't be used after a fork.
+    """
+    global _volume, _volume_pid, _segment_lookup, _volume_lock
+    _volume = None
+    _volume_pid = None
+    _segment_lookup = None
+    # The lock might have been held by another thread during the fork.
+    _volume_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def create_cloudvolume(url=None, skeleton_key=None):
+    """Create a CloudVolume for <url> (default: CLOUDVOLUME_URL) that reads
+    sharded skeletons from <skeleton_key> (default: CLOUDVOLUME_SKELETONS).
+    This fetches the skeleton info file.
+    """
+    from cloudvolume import CloudVolume
+    from cloudvolume.datasource.precomputed.skeleton.sharded import \
+            ShardedPrecomputedSkeletonSource
+
+    url = CLOUDVOLUME_URL if url is None else url
+    skeleton_key = CLOUDVOLUME_SKELETONS if skeleton_key is None else skeleton_key
+
+    cv = CloudVolume(url, use_https=True, parallel=False)
+    cv.meta.info['skeletons'] = skeleton_key
+    cv.skeleton.meta.refresh_info()
+    cv.skeleton = ShardedPrecomputedSkeletonSource(cv.skeleton.meta, cv.cache, cv.config)
+    return cv
+
+
+def get_cloudvolume():
+    """Get the CloudVolume of this process. It is created on first use, which
+    is also the first time the remote volume is contacted. Forked processes
+    create their own.
+    """
+    global _volume, _volume_pid
+    pid = os.getpid()
+    volume = _volume
+    if volume is not None and _volume_pid == pid:
+        return volume
+    with _volume_lock:
+        if _volume is None or _volume_pid != pid:
+            _volume = create_cloudvolume()
+            _volume_pid = pid
+        return _volume
+
+
+def is_google_storage(url=None):
+    """Whether the volume at <url> (default: CLOUDVOLUME_URL) is stored in
+    Google Cloud Storage. Other volumes, e.g. file:// URLs, are accessed
+    through CloudVolume only.
+    """
+    url = CLOUDVOLUME_URL if url is None else url
+    return url.replace('precomputed://', '', 1).startswith('gs://')
+
+
+def use_google_storage():
+    """Let fafbseg look up segments in the volume of this process, if it is
+    stored in Google Cloud Storage.
+    """
+    cv = get_cloudvolume()
+    if is_google_storage():
+        import fafbseg
+        fafbseg.google.segmentation.use_google_storage(cv, use_threads=True)
+    return cv
+
+
+def get_segment_ids(locations):
+    """Return the segment ID for each of the physical <locations> (N x 3).
+    Volumes in Google Cloud Storage are queried through fafbseg, which returns
+    a list of segment IDs per location. Other volumes are looked up with the
+    segment lookup of this process, a list with a single segment ID (none for
+    background) is returned for each location.
+    """
+    if is_google_storage():
+        import fafbseg
+        import pandas as pd
+        return fafbseg.google.segmentation._get_seg_ids(
+                pd.DataFrame(locations, columns=['x', 'y', 'z']))
+
+    lookup = get_segment_lookup()
+    resolution = np.asarray(lookup.cv.meta.resolution(lookup.mip), dtype=np.float64)
+    voxels = np.floor(np.asarray(locations, dtype=np.float64) / resolution)
+    return [[int(s)] if s else [] for s in lookup.lookup(voxels)]
+
+
+def get_segment_lookup():
+    """Get the segment lookup of this process for the segmentation volume."""
+    global _segment_lookup
+    cv = get_cloudvolume()
+    with _volume_lock:
+        if _segment_lookup is None or _segment_lookup.cv is not cv:
+            _segment_lookup = SegmentLookup(cv)
+        return _segment_lookup
+
+
+def warm_up():
+    """Create the CloudVolume of this process in a background thread, so that
+    the first import doesn't wait for it. Errors are only logged, the next
+    get_cloudvolume() call tries again.
+    """
+    def create():
+        try:
+            get_cloudvolume()
+            logger.debug(f'Initialized volume {CLOUDVOLUME_URL} in process {os.getpid()}')
+        except Exception as e:
+            logger.warning(f'Could not initialize volume {CLOUDVOLUME_URL}: {e}')
+
+    thread = threading.Thread(target=create, daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_enabled():
+    """Whether volumes should be initialized right after startup
+    (CIRCUITMAP_VOLUME_WARM_UP, default: False).
+    """
+    return getattr(settings, 'CIRCUITMAP_VOLUME_WARM_UP', False)
@@ -0,0 +1,57 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from circuitmap.control.synthetic import generate_dataset, load_synlinks
+
+
+class Command(BaseCommand):
+    help = ('Writes a synthetic precomputed dataset (segmentation, sharded '
+            'skeletons and synaptic links) to a local directory, so that '
+            'imports can be run without access to remote volumes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Target directory of the dataset')
+        parser.add_argument('--segments', type=int, default=100,
+                help='Number of segments and skeletons')
+        parser.add_argument('--nodes', type=int, default=200,
+                help='Number of nodes per skeleton')
+        parser.add_argument('--links-per-segment', type=float, default=20,
+                help='Average number of presynaptic links per segment')
+        parser.add_argument('--size', type=int, nargs=3, default=[256, 256, 64],
+                metavar=('X', 'Y', 'Z'), help='Volume size in voxels')
+        parser.add_argument('--resolution', type=int, nargs=3, default=[1, 1, 1],
+                metavar=('X', 'Y', 'Z'), help='Voxel resolution in nm')
+        parser.add_argument('--chunk-size', type=int, nargs=3, default=[64, 64, 64],
+                metavar=('X', 'Y', 'Z'), help='Chunk size of the segmentation')
+        parser.add_argument('--first-segment-id', type=int, default=1000000,
+                help='ID of the first segment')
+        parser.add_argument('--skeleton-key', default='skeletons',
+                help='Directory of the skeletons in the dataset')
+        parser.add_argument('--seed', type=int, default=None,
+                help='Seed of the random number generator')
+        parser.add_argument('--no-db', action='store_false', dest='load_links',
+                default=True, help='Only write synlinks.csv, don\'t load the '
+                'links into circuitmap_synlinks')
+
+    def handle(self, *args, **options):
+        url, rows = generate_dataset(options['path'],
+                n_segments=options['segments'], n_nodes=options['nodes'],
+                links_per_segment=options['links_per_segment'],
+                size=options['size'], resolution=options['resolution'],
+                chunk_size=options['chunk_size'],
+                first_segment_id=options['first_segment_id'],
+                skeleton_key=options['skeleton_key'], seed=options['seed'],
+                progress=self.stdout.write)
+
+        if options['load_links']:
+            with transaction.atomic():
+                n_links = load_synlinks(connection.cursor(),
+                        os.path.join(os.path.abspath(options['path']), 'synlinks.csv'))
+            self.stdout.write(f'Loaded {n_links} links into circuitmap_synlinks')
+
+        self.stdout.write(self.style.SUCCESS('Successfully created dataset. Use '
+                'it with these circuitmap settings:'))
+        self.stdout.write(f"CLOUDVOLUME_URL = '{url}'")
+        self.stdout.write(f"CLOUDVOLUME_SKELETONS = '{options['skeleton_key']}'")
@@ -0,0 +1,78 @@
+from django.db import migrations, models
+
+
+# Concurrent index creation can't run in a transaction block, which is why
+# each statement is executed individually.
+forward = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS circuitmap_synlinks_pre_location_idx
+        ON circuitmap_synlinks (segmentid_pre, pre_z, pre_y, pre_x);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS circuitmap_synlinks_post_location_idx
+        ON circuitmap_synlinks (segmentid_post, post_z, post_y, post_x);
+    """,
+]
+
+backward = [
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS circuitmap_synlinks_pre_location_idx;
+    """,
+    """
+    DROP INDEX CONCURRENTLY IF EXISTS circuitmap_synlinks_post_location_idx;
+    """,
+]
+
+
+class Migration(migrations.Migration):
+    """Add optional minimum link scores to synapse imports and add indices that
+    allow to look up synaptic links of a segment in a bounding box. The
+    indices are created concurrently, because the synaptic link table is
+    typically very large and shouldn't be locked for the time the index
+    creation takes.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('circuitmap', '0010_make_import_task_table_cascade_delete_for_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_scores',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_cleft_scores',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_prob_min',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_prob_max',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_prob_mean',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_prob_sum',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='min_prob_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,30 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Add fields to synapse imports that allow incremental imports: a flag to
+    request them and the skeleton state an import was computed for.
+    """
+
+    dependencies = [
+        ('circuitmap', '0011_add_link_score_thresholds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='incremental',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='skeleton_edition_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='segment_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, size=None),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Add fields for import previews, which only compute the expected number
+    of connectors, links and partners.
+    """
+
+    dependencies = [
+        ('circuitmap', '0012_add_incremental_import_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='preview',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='n_expected_links',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='n_expected_connectors',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """Add a parent reference to synapse imports, which allows batch imports of
+    many skeletons to be tracked with one parent and per-skeleton child
+    imports.
+    """
+
+    dependencies = [
+        ('circuitmap', '0013_add_import_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='children', to='circuitmap.SynapseImport'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Store the simplification tolerance and node budget used for imported
+    autoseg skeletons.
+    """
+
+    dependencies = [
+        ('circuitmap', '0014_add_batch_import_parent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='segmentimport',
+            name='simplify_tolerance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='segmentimport',
+            name='simplify_node_budget',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """Add a reference from synapse imports to the running identical import
+    they were coalesced with.
+    """
+
+    dependencies = [
+        ('circuitmap', '0015_add_segment_simplification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='coalesced_with',
+            field=models.ForeignKey(blank=True, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='followers', to='circuitmap.SynapseImport'),
+        ),
+    ]
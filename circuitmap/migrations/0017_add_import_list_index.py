@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+forward = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS circuitmap_synapseimport_project_edition_time_idx
+        ON circuitmap_synapseimport (project_id, edition_time DESC, id DESC);
+"""
+
+backward = """
+    DROP INDEX CONCURRENTLY IF EXISTS circuitmap_synapseimport_project_edition_time_idx;
+"""
+
+
+class Migration(migrations.Migration):
+    """Add an index that backs listing the synapse imports of a project page
+    by page, ordered by edition time and ID, and finding the most recent
+    change. It is created concurrently to not block running imports.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('circuitmap', '0016_add_import_coalescing'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
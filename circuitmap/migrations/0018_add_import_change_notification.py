@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+forward = """
+    CREATE OR REPLACE FUNCTION circuitmap_notify_import_update() RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+    DECLARE
+        row circuitmap_synapseimport;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row := OLD;
+        ELSE
+            row := NEW;
+        END IF;
+        PERFORM pg_notify('circuitmap_import_update', json_build_object(
+            'project_id', row.project_id,
+            'id', row.id,
+            'status', row.status,
+            'op', TG_OP)::text);
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER on_change_circuitmap_synapseimport_notify
+    AFTER INSERT OR UPDATE OR DELETE ON circuitmap_synapseimport
+    FOR EACH ROW EXECUTE PROCEDURE circuitmap_notify_import_update();
+"""
+
+backward = """
+    DROP TRIGGER on_change_circuitmap_synapseimport_notify ON circuitmap_synapseimport;
+    DROP FUNCTION circuitmap_notify_import_update();
+"""
+
+
+class Migration(migrations.Migration):
+    """Send a notification on the channel circuitmap_import_update for each
+    created, changed or deleted synapse import. Notifications are delivered on
+    commit and allow clients to wait for changes instead of polling.
+    """
+
+    dependencies = [
+        ('circuitmap', '0017_add_import_list_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
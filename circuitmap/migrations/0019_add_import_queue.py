@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Store the Celery queue a synapse import was sent to."""
+
+    dependencies = [
+        ('circuitmap', '0018_add_import_change_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='queue',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Add a cancelled status to synapse imports along with checkpoints of
+    completed stages and partners, which allow interrupted imports to resume.
+    """
+
+    dependencies = [
+        ('circuitmap', '0019_add_import_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='synapseimport',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Created'), (1, 'Queued'),
+                (2, 'Computing'), (3, 'Done'), (4, 'Error'),
+                (5, 'Fetch Pre Partners'), (6, 'Fetch Post Partners'),
+                (7, 'No Data'), (8, 'Cancelled')], default=0),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='completed_stages',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.TextField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='synapseimport',
+            name='completed_partners',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(), blank=True, default=list, size=None),
+        ),
+    ]
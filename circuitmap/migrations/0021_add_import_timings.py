@@ -0,0 +1,25 @@
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Store the time spent in the individual stages of synapse and segment
+    imports.
+    """
+
+    dependencies = [
+        ('circuitmap', '0020_add_import_cancellation_and_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseimport',
+            name='timings',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='segmentimport',
+            name='timings',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict),
+        ),
+    ]
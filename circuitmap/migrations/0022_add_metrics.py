@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+forward = """
+    CREATE UNIQUE INDEX circuitmap_metric_name_labels_uniq
+    ON circuitmap_metric (name, labels);
+"""
+
+backward = """
+    DROP INDEX circuitmap_metric_name_labels_uniq;
+"""
+
+
+class Migration(migrations.Migration):
+    """Add a table for counters and histograms of imports, which all web and
+    worker processes add to with upserts.
+    """
+
+    dependencies = [
+        ('circuitmap', '0021_add_import_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Metric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('labels', models.TextField(blank=True, default='')),
+                ('value', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(forward, backward),
+    ]
@@ -3,12 +3,17 @@ from __future__ import unicode_literals
 
 from django.db import models
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, JSONField
 
 from catmaid.models import ClassInstance, Project, Stack
 from catmaid.fields import DbDefaultDateTimeField
 
 
+# Score columns of synaptic links that can be used to filter links on import.
+LINK_SCORE_COLUMNS = ('scores', 'cleft_scores', 'prob_min', 'prob_max',
+        'prob_mean', 'prob_sum', 'prob_count')
+
+
 class Synlinks(models.Model):
     """A synaptic link in the segmentation data, including its pre and post
     location and addition information.
@@ -53,6 +58,7 @@ class SynapseImport(models.Model):
         FETCH_PRE_PARTNERS = 5
         FETCH_POST_PARTNERS = 6
         NO_DATA = 7
+        CANCELLED = 8
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
@@ -79,6 +85,11 @@ class SynapseImport(models.Model):
     n_downstream_partners = models.IntegerField(blank=True, default=0)
     n_expected_upstream_partners = models.IntegerField(blank=True, default=0)
     n_expected_downstream_partners = models.IntegerField(blank=True, default=0)
+    # A preview only computes the expected number of synapses, links and
+    # partners, without writing anything to CATMAID's tables.
+    preview = models.BooleanField(default=False)
+    n_expected_links = models.IntegerField(blank=True, default=0)
+    n_expected_connectors = models.IntegerField(blank=True, default=0)
     # Tags and annotations stored with this import. We don't really need
     # referential integrety here, as this is more of a task description.
     tags = ArrayField(models.TextField(), blank=True, default=list)
@@ -92,11 +103,69 @@ class SynapseImport(models.Model):
     # Whether autapses were allowed
     with_autapses = models.BooleanField(default=False)
 
+    # Optional minimum scores synaptic links need to have to be considered. A
+    # value of NULL means no filtering.
+    min_scores = models.FloatField(blank=True, null=True)
+    min_cleft_scores = models.IntegerField(blank=True, null=True)
+    min_prob_min = models.IntegerField(blank=True, null=True)
+    min_prob_max = models.IntegerField(blank=True, null=True)
+    min_prob_mean = models.IntegerField(blank=True, null=True)
+    min_prob_sum = models.IntegerField(blank=True, null=True)
+    min_prob_count = models.IntegerField(blank=True, null=True)
+
     # This transaction ID is assigned when the import is actually performed. It
     # allows us to quickly find all database objects that were modified during
     # the actual import.
     txid = models.BigIntegerField(blank=True, null=True)
 
+    # Whether only skeleton changes since the last import with the same
+    # parameters should be processed.
+    incremental = models.BooleanField(default=False)
+    # The skeleton state this import was computed for: the most recent node
+    # edition time along with all segments that overlapped with the skeleton.
+    # Later incremental imports only need to look at nodes changed after this
+    # time and segments not in this list.
+    skeleton_edition_time = models.DateTimeField(blank=True, null=True)
+    segment_ids = ArrayField(models.BigIntegerField(), blank=True, default=list)
+
+    # Batch imports of multiple skeletons have one parent import and one child
+    # import per skeleton.
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True,
+            blank=True, related_name='children')
+
+    # Identical imports requested while another one is running don't run on
+    # their own, but follow the running import and get its result.
+    coalesced_with = models.ForeignKey('self', on_delete=models.SET_NULL,
+            null=True, blank=True, related_name='followers')
+
+    # The Celery queue the import was sent to. Partner imports can run on a
+    # separate bulk queue, this is then stored here.
+    queue = models.TextField(blank=True, null=True)
+
+    # Checkpoints of long running imports: completed stages (e.g. "segment",
+    # "upstream", "downstream") and the partner segments completed in the
+    # current stage. A task that is run again, e.g. after its worker died,
+    # skips them.
+    completed_stages = ArrayField(models.TextField(), blank=True, default=list)
+    completed_partners = ArrayField(models.BigIntegerField(), blank=True, default=list)
+
+    # The time spent in each stage of the import (e.g. link fetch, link
+    # writes), summed up over all tasks, and per partner segment. See
+    # control/timings.py.
+    timings = JSONField(blank=True, default=dict)
+
+    def get_score_thresholds(self):
+        """Return a dictionary that maps synaptic link score columns to the
+        minimum value links need to have for this import. Columns without
+        threshold are not included.
+        """
+        thresholds = {}
+        for column in LINK_SCORE_COLUMNS:
+            value = getattr(self, f'min_{column}')
+            if value is not None:
+                thresholds[column] = value
+        return thresholds
+
 
 class SegmentImport(models.Model):
     """An imported segment at a defined location in a particular image stack and
@@ -115,6 +184,14 @@ class SegmentImport(models.Model):
     # The imported segment.
     segment_id = models.BigIntegerField(db_index=True)
     n_imported_nodes = models.IntegerField(default=0)
+    # The time spent in each stage of importing this segment, without its
+    # partners.
+    timings = JSONField(blank=True, default=dict)
+    # Optional simplification of imported skeletons: the maximum distance of
+    # removed nodes to the simplified skeleton and the maximum number of nodes
+    # per skeleton. NULL means no simplification.
+    simplify_tolerance = models.FloatField(blank=True, null=True)
+    simplify_node_budget = models.IntegerField(blank=True, null=True)
     # The location in the dataset this was computed for.
     voxel_x = models.FloatField()
     voxel_y = models.FloatField()
@@ -123,3 +200,17 @@ class SegmentImport(models.Model):
     physical_x = models.FloatField()
     physical_y = models.FloatField()
     physical_z = models.FloatField()
+
+
+class Metric(models.Model):
+    """The value of a metric series, shared by all processes (see
+    control/metrics.py). A series is identified by its name and its labels in
+    the Prometheus format. Histograms are stored as bucket, sum and count
+    series.
+
+    The unique constraint on name and labels is created in the migration
+    directly in SQL.
+    """
+    name = models.TextField()
+    labels = models.TextField(default='', blank=True)
+    value = models.FloatField(default=0)
@@ -21,16 +21,23 @@
     this.content = undefined;
     this.autoSelectResultSkeleton = true;
     this.allowAutapses = false;
+    this.incremental = false;
+    // Optional minimum scores of synaptic links, null disables the filter.
+    this.minLinkScore = null;
+    this.minCleftScore = null;
     this.importAnnotations = CATMAID.TracingTool.getDefaultImportAnnotations();
     this.importTags = CATMAID.TracingTool.getDefaultImportTags();
 
-    // The framework timeout reference, to check for updates if websockets don't
-    // work.
+    // While imports started by this widget are running, the import change
+    // feed is watched with one pending request, to check for updates if
+    // websockets don't work. After errors, the next request is sent after the
+    // update check interval.
     this.updateTimeout = null;
     this.updateCheckInterval = 4000;
-    this.lastEdit = null;
-    this.stopPolling = false;
+    this.lastUpdate = null;
+    this.watchingChanges = false;
     this.pollingEnabled = true;
+    this.runningImports = new Set();
 
     let config = CATMAID.extensionConfig['circuitmap']
     this.sourceRemote = config ? config['seg_name'] : '';
@@ -105,6 +112,30 @@
               this.allowAutapses = e.target.checked;
             },
           },
+          {
+            type: 'numeric',
+            label: 'Min. link score',
+            title: 'If set, only synaptic links with at least this score are imported.',
+            value: this.minLinkScore === null ? '' : this.minLinkScore,
+            length: 5,
+            min: 0,
+            onchange: e => {
+              let value = parseFloat(e.target.value);
+              this.minLinkScore = Number.isNaN(value) ? null : value;
+            }
+          },
+          {
+            type: 'numeric',
+            label: 'Min. cleft score',
+            title: 'If set, only synaptic links with at least this cleft score are imported.',
+            value: this.minCleftScore === null ? '' : this.minCleftScore,
+            length: 5,
+            min: 0,
+            onchange: e => {
+              let value = parseInt(e.target.value, 10);
+              this.minCleftScore = Number.isNaN(value) ? null : value;
+            }
+          },
         ]);
 
         controls.classList.add('vertical-settings');
@@ -124,6 +155,12 @@
             label: 'Import autoseg skeleton at location including synapses',
             onclick: e => this.fetch_location(),
           },
+          {
+            type: 'button',
+            label: 'Preview',
+            title: 'Compute how many synapses and partners would be imported, without importing anything.',
+            onclick: e => this.fetch_location(true, true),
+          },
           {
             type: 'checkbox',
             label: 'Display reference lines',
@@ -203,6 +240,12 @@
             label: 'Fetch synapses for active neuron',
             onclick: e => this.fetch(),
           },
+          {
+            type: 'button',
+            label: 'Preview',
+            title: 'Compute how many synapses would be imported, without importing anything.',
+            onclick: e => this.fetch(true, true),
+          },
           {
             type: 'numeric',
             id: `distance_threshold${this.widgetID}`,
@@ -215,6 +258,15 @@
               this.distance_threshold = parentInt(e.target.value, 10);
             }
           },
+          {
+            type: 'checkbox',
+            label: 'Only changes since last import',
+            title: 'If enabled and there is a previous import for this skeleton with the same settings, only nodes added or changed since then are looked at.',
+            value: this.incremental,
+            onclick: e => {
+              this.incremental = e.target.checked;
+            },
+          },
         ]);
 
         $(controls).tabs();
@@ -253,6 +305,7 @@
                   draw: data.draw,
                   data: importData,
                 });
+                this.updateRunningImports(importData);
                 // Update tracing data only if there was a change observed
                 if (importData && this.lastImportData) {
                   let changed = false;
@@ -266,7 +319,12 @@
                       }
                       let lidElement = lastIdElement[idKey];
                       let [valA, valB] = [idElement[idKey], lastIdElement[idKey]];
-                      if (valA.constructor !== valB.constructor) {
+                      if (valA === null || valB === null) {
+                        if (valA !== valB) {
+                          changed = true;
+                          break;
+                        }
+                      } else if (valA.constructor !== valB.constructor) {
                         changed =true;
                         break;
                       } else if (valA instanceof Array) {
@@ -274,7 +332,12 @@
                           changed = true;
                           break;
                         }
-
+                      } else if (valA instanceof Object) {
+                        // Timings
+                        if (JSON.stringify(valA) !== JSON.stringify(valB)) {
+                          changed = true;
+                          break;
+                        }
                       } else if (valA !== valB) {
                         changed = true;
                         break;
@@ -321,7 +384,8 @@
               render: function(data, type, row, meta) {
                 let status = row.status_detail && row.status_detail.length > 0 ?
                     row.status_detail : 'No details availale';
-                return `<span title="${status}">${data}</a>`;
+                let label = row.preview ? `${data} (preview)` : data;
+                return `<span title="${status}">${label}</a>`;
               }
             }, {
               title: "Last update (UTC)",
@@ -347,7 +411,12 @@
               orderable: true,
               class: 'cm-center',
               render: function(data, type, row, meta) {
-                return data ? (Math.round(data) + 's') : 'N/A';
+                if (type !== 'display') {
+                  return data;
+                }
+                let runtime = data ? (Math.round(data) + 's') : 'N/A';
+                let timings = CircuitmapWidget.formatTimings(row.timings, row.segment_timings);
+                return timings ? `<span title="${timings}">${runtime}</span>` : runtime;
               },
             }, {
               data: "n_imported_links",
@@ -355,12 +424,18 @@
               class: "cm-center",
               searchable: true,
               orderable: true,
+              render: function(data, type, row, meta) {
+                return row.preview ? `(${row.n_expected_links})` : data;
+              },
             }, {
               data: "n_imported_connectors",
               title: "# New connectors",
               class: "cm-center",
               searchable: true,
               orderable: true,
+              render: function(data, type, row, meta) {
+                return row.preview ? `(${row.n_expected_connectors})` : data;
+              },
             }, {
               data: "n_upstream_partners",
               title: "# New up. partners",
@@ -368,7 +443,8 @@
               searchable: true,
               orderable: true,
               render: function(data, type, row, meta) {
-                return `${row.n_upstream_partners} / ${row.n_expected_upstream_partners}`;
+                return row.preview ? `(${row.n_expected_upstream_partners})` :
+                    `${row.n_upstream_partners} / ${row.n_expected_upstream_partners}`;
               },
             }, {
               data: "n_downstream_partners",
@@ -377,7 +453,8 @@
               searchable: true,
               orderable: true,
               render: function(data, type, row, meta) {
-                return `${row.n_downstream_partners} / ${row.n_expected_downstream_partners}`;
+                return row.preview ? `(${row.n_expected_downstream_partners})` :
+                    `${row.n_downstream_partners} / ${row.n_expected_downstream_partners}`;
               },
             }, {
               data: "upstream_partner_syn_threshold",
@@ -417,10 +494,16 @@
               searchable: false,
               orderable: false,
               render: function(data, type, row, meta) {
-                return (!row.skeleton_id || row.skeleton_id === -1) ? '-' :
-                  '<ul class="resultTags">' +
+                let running = !CircuitmapWidget.isFinalStatus(row.status);
+                let cancel = running ?
+                    '<li><a href="#" data-role="cancel-import"><i class="fa fa-times" style="color: dimgrey" title="Cancel import"></i></a></li> ' : '';
+                if (!row.skeleton_id || row.skeleton_id === -1) {
+                  return running ? `<ul class="resultTags">${cancel}</ul>` : '-';
+                }
+                return '<ul class="resultTags">' +
                     '<li><a href="#" data-role="show-3d">3D</a></li> ' +
                     '<li><a href="#" data-role="show-graph"><i class="fa fa-share-alt" style="color: dimgrey" title="Show neighborhood graph"></i></a></li> ' +
+                    cancel +
                   '</ul>';
               },
             }
@@ -507,6 +590,21 @@
             return o;
           }, {});
           skeletonTarget.append(models);
+        }).on('click', 'a[data-role=cancel-import]', e => {
+          let data = this.importTable.row($(e.target).parents('tr')).data();
+          if (!confirm(`Are you sure to cancel import ${data.id}?`)) {
+            return;
+          }
+          CATMAID.fetch(`ext/circuitmap/${project.id}/imports/${data.id}/cancel`, 'POST')
+            .then(result => {
+              if (result.cancelled) {
+                CATMAID.msg("Success", `Import ${data.id} cancelled`);
+              } else {
+                CATMAID.warn(`Import ${data.id} is finished already`);
+              }
+              this.refresh();
+            })
+            .catch(CATMAID.handleError);
         }).on('click', 'a[data-role=show-graph]', e => {
           let data = this.importTable.row($(e.target).parents('tr')).data();
           if (data.skeleton_id === -1) {
@@ -546,8 +644,8 @@
         $('thead th:eq(3)', importTable).attr('title', 'Current status of task');
         $('thead th:eq(4)', importTable).attr('title', 'Last time this task was updated');
         $('thead th:eq(5)', importTable).attr('title', 'Time it took the task to run');
-        $('thead th:eq(6)', importTable).attr('title', 'Number of newly created synaptic links');
-        $('thead th:eq(7)', importTable).attr('title', 'Number of newly created connector nodes (synapses)');
+        $('thead th:eq(6)', importTable).attr('title', 'Number of newly created synaptic links, expected numbers of previews are shown in parentheses');
+        $('thead th:eq(7)', importTable).attr('title', 'Number of newly created connector nodes (synapses), expected numbers of previews are shown in parentheses');
         $('thead th:eq(8)', importTable).attr('title', 'Number of imported presynaptic partners along with the initial expectation. The difference could not be imported.');
         $('thead th:eq(9)', importTable).attr('title', 'Number of imported postsynaptic partners along with the initial expectation. The difference could not be imported.');
         $('thead th:eq(10)', importTable).attr('title', 'The number of synaptic connections to a presynapyic partner that are needed before it can be imported');
@@ -623,7 +721,17 @@
     this.updateMessage();
   };
 
-  CircuitmapWidget.prototype.fetch = function(skipConfirm=false) {
+  CircuitmapWidget.prototype.addScoreThresholds = function(queryData) {
+    if (this.minLinkScore !== null) {
+      queryData['min_scores'] = this.minLinkScore;
+    }
+    if (this.minCleftScore !== null) {
+      queryData['min_cleft_scores'] = this.minCleftScore;
+    }
+    return queryData;
+  };
+
+  CircuitmapWidget.prototype.fetch = function(skipConfirm=false, preview=false) {
     // We can assume the neuron is registered and available as a name
     let activeSkeletonId = SkeletonAnnotations.getActiveSkeletonId();
     if (!activeSkeletonId) {
@@ -649,17 +757,25 @@
       'active_skeleton': activeSkeletonId,
       'request_id': this.sourceHash,
       'with_autapses': this.allowAutapses,
+      'incremental': this.incremental,
+      'preview': preview,
       'annotations': CATMAID.TracingTool.getEffectiveImportAnnotations(
           this.importAnnotations, this.sourceRemote),
       'tags': CATMAID.TracingTool.getEffectiveImportTags(
           this.importTags, this.sourceRemote),
     };
+    this.addScoreThresholds(query_data);
 
-    this.updateMessage(`Fetching synapses for skeleton #${activeSkeletonId}`);
+    this.updateMessage(preview ? `Computing synapse preview for skeleton #${activeSkeletonId}` :
+        `Fetching synapses for skeleton #${activeSkeletonId}`);
     CATMAID.fetch('ext/circuitmap/' + project.id + '/synapses/fetch', 'POST', query_data)
-      .then(e => {
-        CATMAID.msg("Success", "Import process started ...");
+      .then(result => {
+        CATMAID.msg("Success", result.coalesced_with ?
+            `Following the identical running import ${result.coalesced_with} ...` :
+            "Import process started ...");
+        this.runningImports.add(result.import_ref);
         this.refresh();
+        this.watchImportChanges();
       })
       .catch(e => {
         this.updateMessage(`An error occured while fetching synapses for skeleton #{activeSkeletonId}: ${e}`);
@@ -672,15 +788,13 @@
       });
   };
 
-  CircuitmapWidget.prototype.fetch_location = function(skipConfirm=false) {
+  CircuitmapWidget.prototype.fetch_location = function(skipConfirm=false, preview=false) {
     if (!skipConfirm && !confirm('Are you sure to attempt the import of a segmentation fragment along with its synapses?')) {
       return;
     }
     var stackViewer = project.focusedStackViewer;
     var stack = project.focusedStackViewer.primaryStack;
 
-    this.stopPolling = !this.pollingEnabled;
-
     var query_data = {
       'x': stackViewer.x,
       'y': stackViewer.y,
@@ -693,48 +807,26 @@
       'active_skeleton': -1,
       'request_id': this.sourceHash,
       'with_autapses': this.allowAutapses,
+      'preview': preview,
       'annotations': CATMAID.TracingTool.getEffectiveImportAnnotations(
           this.importAnnotations, this.sourceRemote),
       'tags': CATMAID.TracingTool.getEffectiveImportTags(
           this.importTags, this.sourceRemote),
     };
+    this.addScoreThresholds(query_data);
 
     this.updateMessage(`Fetching segment and synapses for stack location (${stackViewer.x}, ${stackViewer.y}, ${stackViewer.z})`);
     CATMAID.fetch('ext/circuitmap/' + project.id + '/synapses/fetch', 'POST', query_data)
       .then(result => {
-        CATMAID.msg("Success", "Import process started ...");
+        CATMAID.msg("Success", result.coalesced_with ?
+            `Following the identical running import ${result.coalesced_with} ...` :
+            "Import process started ...");
+        this.runningImports.add(result.import_ref);
         this.refresh();
 
-        // Create a new fallback timeout, cancel any old one
-        this.lastEdit = new Date(result.edition_time);
-        if (this.updateTimeout) {
-          window.clearTimeout(this.updateTimeout);
-        }
-        let checkForUpdate = () => {
-          CATMAID.fetch(`ext/circuitmap/${project.id}/imports/${result.import_ref}/last-update`)
-            .then(update => {
-              if (this.stopPolling || !this.pollingEnabled) {
-                return;
-              }
-              // Compare to difference of last update and refresh if there is a
-              // change.
-              let lastEdit = new Date(update.edition_time);
-              if (this.lastEdit && lastEdit > this.lastEdit) {
-                this.lastEdit = lastEdit;
-                this.refresh();
-              }
-
-              let status = update.status.toLowerCase();
-              if (status !== 'error' && status !== 'no data' && status !== 'done') {
-                window.setTimeout(checkForUpdate, this.updateCheckInterval);
-              } else {
-                this.stopPolling = true;
-                this.refresh();
-              }
-            })
-            .catch(CATMAID.handleError);
-        };
-        this.updateTimeout = window.setTimeout(checkForUpdate, this.updateCheckInterval)
+        // Changes of the import are picked up by the import change feed, in
+        // case websockets don't work.
+        this.watchImportChanges();
       })
       .catch(e => {
         this.updateMessage(`An error occured while fetching segment and synapses for stack location (${stackViewer.x}, ${stackViewer.y}, ${stackViewer.z}): ${e.message}`);
@@ -749,8 +841,65 @@
 
   };
 
+  /**
+   * Remember which imports of this widget are still running, based on the
+   * passed in import list, and watch for changes while there are any.
+   */
+  CircuitmapWidget.prototype.updateRunningImports = function(importData) {
+    for (let row of importData) {
+      if (row.request_id !== this.sourceHash && !this.runningImports.has(row.id)) {
+        continue;
+      }
+      if (CircuitmapWidget.isFinalStatus(row.status)) {
+        this.runningImports.delete(row.id);
+      } else {
+        this.runningImports.add(row.id);
+      }
+    }
+    this.watchImportChanges();
+  };
+
+  /**
+   * Wait for changes of imports in this project with the import change feed
+   * and refresh the import table if there were any. Only one request is
+   * pending at any time and only while imports of this widget are running.
+   * Refreshing the table updates the running imports and continues watching.
+   */
+  CircuitmapWidget.prototype.watchImportChanges = function() {
+    if (this.watchingChanges || !this.pollingEnabled ||
+        this.runningImports.size === 0) {
+      return;
+    }
+    this.watchingChanges = true;
+    let params = this.lastUpdate ? {'since': this.lastUpdate} : {};
+    CATMAID.fetch(`ext/circuitmap/${project.id}/imports/changes`, 'GET', params)
+      .then(result => {
+        this.watchingChanges = false;
+        if (!this.pollingEnabled) {
+          return;
+        }
+        this.lastUpdate = result.last_update;
+        if (result.changed.length > 0) {
+          this.refresh();
+        } else {
+          this.watchImportChanges();
+        }
+      })
+      .catch(e => {
+        this.watchingChanges = false;
+        if (this.pollingEnabled) {
+          this.updateTimeout = window.setTimeout(() => this.watchImportChanges(),
+              this.updateCheckInterval);
+        }
+        CATMAID.handleError(e);
+      });
+  };
+
   CircuitmapWidget.prototype.destroy = function() {
     this.pollingEnabled = false;
+    if (this.updateTimeout) {
+      window.clearTimeout(this.updateTimeout);
+    }
     // Reset refernce line display if thsi is the last circuitmap widget
     if (WindowMaker.getOpenWidgetsOfType(CircuitmapWidget).size === 1) {
       project.getStackViewers().forEach(s => s.showReferenceLines(
@@ -764,12 +913,19 @@
   };
 
   CircuitmapWidget.prototype.handleCircuitMapTaskUpdate = function(info) {
+    if (info && info.task === 'import-progress') {
+      this.updateImportProgress(info.import_id, info.progress);
+      return;
+    }
     CATMAID.msg(info.message ? info.message : 'Circuit Map computation done', `Task: ${info.task}`);
     if (!info) {
       throw new CATMAID.ValueError('Need circuit map update information');
     } else if (info.task === 'import-synapses') {
       if (info.error) {
         this.updateMessage(`Error during synapse import for skeleton ${info.skeleton_id}`);
+      } else if (info.preview) {
+        this.updateMessage(`Importing would create ${info.n_inserted_synapses} synapses and ${info.n_inserted_links} links ` +
+            `for skeleton ${info.skeleton_id}`);
       } else {
         this.updateMessage(`Imported ${info.n_inserted_synapses} synapses and ${info.n_inserted_links} links` +
             `for skeleton ${info.skeleton_id}`);
@@ -793,6 +949,17 @@
           CATMAID.TracingTool.getTracingLayers().forEach(l => l.forceRedraw());
         }
       }
+    } else if (info.task === 'import-coalesced') {
+      if (info.error) {
+        this.updateMessage(`Error during import ${info.coalesced_with}, which import ${info.import_id} followed: ${info.error}`);
+      } else {
+        this.updateMessage(`Import ${info.import_id} followed the identical import ${info.coalesced_with}: ` +
+            `${info.status}, skeleton ${info.skeleton_id}`);
+        if (info.skeleton_id && info.skeleton_id !== -1) {
+          CATMAID.Skeletons.trigger(
+              CATMAID.Skeletons.EVENT_SKELETON_CHANGED, info.skeleton_id);
+        }
+      }
     } else if (info.task === 'import-partner-fragments') {
       if (info.error) {
         this.updateMessage(`Error during the import of partner fragments for segment ${info.segment_id}`);
@@ -806,12 +973,72 @@
     this.refresh();
   };
 
+  /**
+   * Update the displayed row of an import with progress information, without
+   * reloading the table.
+   */
+  CircuitmapWidget.prototype.updateImportProgress = function(importId, progress) {
+    if (!this.importTable || !progress) {
+      return;
+    }
+    this.importTable.rows().every(function() {
+      let data = this.data();
+      if (data.id === importId) {
+        Object.assign(data, progress);
+        this.invalidate();
+      }
+    });
+    this.importTable.draw(false);
+    if (progress.status) {
+      this.updateMessage(`Import ${importId}: ${progress.status}`);
+    }
+  };
+
   CircuitmapWidget.prototype.refresh = function() {
     if (this.importTable) {
       this.importTable.ajax.reload();
     }
   };
 
+  /**
+   * Return a text representation of the stage timings of an import (see
+   * control/timings.py), to be used as tooltip. The slowest partner segments
+   * are listed too.
+   */
+  CircuitmapWidget.formatTimings = function(timings, segmentTimings, maxPartners=5) {
+    let formatStages = stages => Object.keys(stages)
+      .sort((a, b) => stages[b].time - stages[a].time)
+      .map(stage => {
+        let entry = stages[stage];
+        let counters = Object.keys(entry)
+          .filter(k => k !== 'time' && k !== 'count')
+          .map(k => `${k}: ${entry[k]}`);
+        return `${stage}: ${entry.time.toFixed(2)}s (${entry.count}x` +
+            (counters.length ? `, ${counters.join(', ')})` : ')');
+      });
+
+    let lines = [];
+    if (timings && timings.stages && Object.keys(timings.stages).length > 0) {
+      lines.push('Stages:', ...formatStages(timings.stages));
+    }
+    if (segmentTimings && Object.keys(segmentTimings).length > 0) {
+      lines.push('', 'Segment only:', ...formatStages(segmentTimings));
+    }
+    let partners = timings && timings.partners ? timings.partners : {};
+    let partnerTotals = Object.keys(partners)
+      .map(p => [p, Object.values(partners[p]).reduce((s, t) => s + t, 0)])
+      .sort((a, b) => b[1] - a[1]);
+    if (partnerTotals.length > 0) {
+      lines.push('', `Slowest of ${partnerTotals.length} partners:`,
+          ...partnerTotals.slice(0, maxPartners).map(([p, t]) => `${p}: ${t.toFixed(2)}s`));
+    }
+    return lines.join('\n');
+  };
+
+  CircuitmapWidget.isFinalStatus = function(status) {
+    return ['done', 'error', 'no data', 'cancelled'].includes(status.toLowerCase());
+  };
+
   CircuitmapWidget.findWidgetWithSourceHash = function(sourceHash) {
     let map = CATMAID.WindowMaker.getOpenWidgetsOfType(CircuitmapWidget);
     for (let [win, widget] of map.entries()) {
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from circuitmap.control import coalescing, import_segment_partners
+from circuitmap.models import SynapseImport
+from circuitmap.tests.common import CircuitmapTestCase
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'circuitmap-coalescing-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch('circuitmap.control.coalescing.msg_user')
+class CoalescingTest(CircuitmapTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.key = coalescing.get_inflight_key(self.test_project_id, 'segment',
+                42, {'distance_threshold': 1000})
+
+    def create_import(self, **kwargs):
+        return SynapseImport.objects.create(user_id=self.test_user_id,
+                project_id=self.test_project_id, skeleton_id=-1,
+                status=SynapseImport.Status.COMPUTING, **kwargs)
+
+    def start_follower(self, leader):
+        follower = self.create_import()
+        self.assertEqual(coalescing.claim(self.key, follower.id), leader.id)
+        coalescing.follow(follower, leader.id, self.key,
+                {'task': 'circuitmap.control.import_synapses_and_segment',
+                'args': [follower.id], 'kwargs': {}, 'options': {}})
+        return follower
+
+    def test_leader_success_completes_followers(self, msg_user):
+        leader = self.create_import()
+        self.assertIsNone(coalescing.claim(self.key, leader.id))
+        followers = [self.start_follower(leader) for _ in range(2)]
+
+        SynapseImport.objects.filter(id=leader.id).update(
+                status=SynapseImport.Status.DONE, skeleton_id=7,
+                n_imported_links=3, n_imported_connectors=2)
+        coalescing.release(leader.id)
+
+        self.assertIsNone(cache.get(self.key))
+        for follower in followers:
+            follower.refresh_from_db()
+            self.assertEqual(follower.status, SynapseImport.Status.DONE)
+            self.assertEqual(follower.skeleton_id, 7)
+            self.assertEqual(follower.n_imported_links, 3)
+            self.assertEqual(follower.n_imported_connectors, 2)
+        self.assertEqual(msg_user.call_count, 2)
+
+        # A new import of the same segment runs on its own again
+        self.assertIsNone(coalescing.claim(self.key, self.create_import().id))
+
+    def test_follower_of_finished_leader_completes_right_away(self, msg_user):
+        leader = self.create_import()
+        self.assertIsNone(coalescing.claim(self.key, leader.id))
+        leader.status = SynapseImport.Status.DONE
+        leader.save(update_fields=['status'])
+
+        follower = self.start_follower(leader)
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, SynapseImport.Status.DONE)
+
+    @mock.patch('circuitmap.control.coalescing.signature')
+    def test_cancelled_leader_restarts_followers(self, signature, msg_user):
+        leader = self.create_import()
+        self.assertIsNone(coalescing.claim(self.key, leader.id))
+        first, second = [self.start_follower(leader) for _ in range(2)]
+
+        SynapseImport.objects.filter(id=leader.id).update(
+                status=SynapseImport.Status.CANCELLED)
+        coalescing.release(leader.id)
+
+        # The first follower runs as new leader, the second one follows it.
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, SynapseImport.Status.COMPUTING)
+        self.assertIsNone(first.coalesced_with_id)
+        self.assertEqual(second.status, SynapseImport.Status.COMPUTING)
+        self.assertEqual(second.coalesced_with_id, first.id)
+        self.assertEqual(cache.get(self.key), first.id)
+        signature.assert_called_once()
+        self.assertEqual(signature.call_args[0][0]['args'], [first.id])
+        signature.return_value.apply_async.assert_called_once_with()
+
+    @mock.patch('circuitmap.control.coalescing.signature')
+    def test_cancelled_leader_fails_followers_without_task(self, signature,
+            msg_user):
+        leader = self.create_import()
+        self.assertIsNone(coalescing.claim(self.key, leader.id))
+        follower = self.start_follower(leader)
+        cache.delete(coalescing._get_task_key(follower.id))
+
+        SynapseImport.objects.filter(id=leader.id).update(
+                status=SynapseImport.Status.CANCELLED)
+        coalescing.release(leader.id)
+
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, SynapseImport.Status.ERROR)
+        signature.assert_not_called()
+
+    @mock.patch('circuitmap.control.import_upstream_downstream_partners',
+            side_effect=RuntimeError('Partner look-up failed'))
+    def test_release_on_error(self, import_partners, msg_user):
+        leader = self.create_import()
+        self.assertIsNone(coalescing.claim(self.key, leader.id))
+        follower = self.start_follower(leader)
+
+        with self.assertRaises(RuntimeError):
+            import_segment_partners(self.test_project_id, self.test_user_id,
+                    leader.id, 42, True, False, 5, 5)
+
+        leader.refresh_from_db()
+        follower.refresh_from_db()
+        self.assertEqual(leader.status, SynapseImport.Status.ERROR)
+        self.assertEqual(follower.status, SynapseImport.Status.ERROR)
+        self.assertEqual(follower.status_detail, 'Partner look-up failed')
+        self.assertIsNone(cache.get(self.key))
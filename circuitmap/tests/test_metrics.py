@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from circuitmap.control.metrics import format_labels, render
+
+
+class FakeCursor(object):
+    """Return the passed in metric rows and import counts."""
+
+    def __init__(self, metric_rows, import_counts):
+        self.metric_rows = metric_rows
+        self.import_counts = import_counts
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.rows = self.metric_rows if 'circuitmap_metric' in query \
+                else self.import_counts
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+@mock.patch('circuitmap.control.metrics.flush')
+class MetricsRenderTest(SimpleTestCase):
+
+    def test_label_escaping(self, flush):
+        self.assertEqual(format_labels({'b': 'say "hi"', 'a': 'C:\\tmp\nx'}),
+                'a="C:\\\\tmp\\nx",b="say \\"hi\\""')
+
+    def test_render(self, flush):
+        task = format_labels({'task': 'import_synapses', 'outcome': 'success'})
+        bucket = lambda le: format_labels({'task': 'import_synapses',
+                'outcome': 'success', 'le': le})
+        # Rows as they are sorted by the database, i.e. by text
+        cursor = FakeCursor([
+            ('circuitmap_links_fetched_total', '', 12.0),
+            ('circuitmap_rows_written_total', format_labels({'table': 'treenode'}), 2.5e6),
+            ('circuitmap_rows_written_total', format_labels({'table': 'x"y\\z'}), 1.0),
+            ('circuitmap_task_seconds_bucket', bucket('+Inf'), 3.0),
+            ('circuitmap_task_seconds_bucket', bucket(10), 2.0),
+            ('circuitmap_task_seconds_bucket', bucket(2.5), 1.0),
+            ('circuitmap_task_seconds_bucket', bucket(60), 3.0),
+            ('circuitmap_task_seconds_count', task, 3.0),
+            ('circuitmap_task_seconds_sum', task, 50.25),
+        ], [(3, 2), (4, 1)])
+
+        self.assertEqual(render(cursor), '\n'.join([
+            '# HELP circuitmap_imports Synapse imports by status.',
+            '# TYPE circuitmap_imports gauge',
+            'circuitmap_imports{status="Done"} 2',
+            'circuitmap_imports{status="Error"} 1',
+            '# HELP circuitmap_import_queue_wait_seconds Time from the creation of an import until it starts computing.',
+            '# TYPE circuitmap_import_queue_wait_seconds histogram',
+            '# HELP circuitmap_task_seconds Runtime of import tasks by task and outcome.',
+            '# TYPE circuitmap_task_seconds histogram',
+            'circuitmap_task_seconds_bucket{le="2.5",outcome="success",task="import_synapses"} 1',
+            'circuitmap_task_seconds_bucket{le="10",outcome="success",task="import_synapses"} 2',
+            'circuitmap_task_seconds_bucket{le="60",outcome="success",task="import_synapses"} 3',
+            'circuitmap_task_seconds_bucket{le="+Inf",outcome="success",task="import_synapses"} 3',
+            'circuitmap_task_seconds_count{outcome="success",task="import_synapses"} 3',
+            'circuitmap_task_seconds_sum{outcome="success",task="import_synapses"} 50.25',
+            '# HELP circuitmap_stage_seconds Time spent in an import stage, e.g. link fetch or skeleton download.',
+            '# TYPE circuitmap_stage_seconds histogram',
+            '# HELP circuitmap_links_fetched_total Synaptic links read from circuitmap_synlinks.',
+            '# TYPE circuitmap_links_fetched_total counter',
+            'circuitmap_links_fetched_total 12',
+            '# HELP circuitmap_rows_written_total Rows created by imports by table.',
+            '# TYPE circuitmap_rows_written_total counter',
+            'circuitmap_rows_written_total{table="treenode"} 2500000',
+            'circuitmap_rows_written_total{table="x\\"y\\\\z"} 1',
+            '# HELP circuitmap_cache_requests_total Look-ups of skeleton and plan caches by cache and result (hit or miss).',
+            '# TYPE circuitmap_cache_requests_total counter',
+        ]) + '\n')
+        flush.assert_called_once_with()
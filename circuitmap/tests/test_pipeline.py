@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django.test import SimpleTestCase
+
+from circuitmap.control.pipeline import Pipeline, Stage, StageError
+
+
+class PipelineTest(SimpleTestCase):
+
+    def test_results_in_order_of_completion(self):
+        pipeline = Pipeline([
+            Stage('double', lambda x: x * 2, 2),
+            Stage('increment', lambda x: x + 1),
+        ])
+        results = dict(pipeline.run(range(10)))
+        self.assertEqual(results, dict((i, i * 2 + 1) for i in range(10)))
+
+    def test_errors_are_passed_through(self):
+        def fail_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+
+        pipeline = Pipeline([Stage('check', fail_odd), Stage('same', lambda x: x)])
+        results = dict(pipeline.run(range(4)))
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], StageError)
+        self.assertEqual(results[1].stage, 'check')
+
+    def test_stop_unconsumed_pipeline(self):
+        # The queues fill up, because nobody consumes the results.
+        pipeline = Pipeline([Stage('same', lambda x: x, 2)], queue_size=1)
+        results = pipeline.run(range(100))
+        threads = list(pipeline._threads)
+        self.assertTrue(any(thread.is_alive() for thread in threads))
+
+        pipeline.stop()
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        results.close()
+
+    def test_stop_on_early_close(self):
+        pipeline = Pipeline([Stage('same', lambda x: x)], queue_size=1)
+        results = pipeline.run(range(100))
+        next(results)
+        results.close()
+        self.assertFalse(any(thread.is_alive() for thread in pipeline._threads))
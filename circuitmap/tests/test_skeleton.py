@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from django.test import SimpleTestCase
+
+from circuitmap.control.skeleton import (autoseg_skeleton_to_rows,
+        mapping_skel_nid, mapping_skel_nids, simplify_skeleton_rows)
+
+
+class FakeSkeleton(object):
+    def __init__(self, vertices, edges, radius=None):
+        self.vertices = np.array(vertices, dtype=np.float32)
+        self.edges = np.array(edges, dtype=np.uint32).reshape(-1, 2)
+        self.radius = np.ones(len(vertices), dtype=np.float32) \
+                if radius is None else np.array(radius, dtype=np.float32)
+
+
+class SkeletonConversionTest(SimpleTestCase):
+
+    def test_vectorized_mapping(self):
+        segment_id, project_id = 720575940614010000, 3
+        expected = [mapping_skel_nid(segment_id, i, project_id) for i in range(5)]
+        self.assertEqual(mapping_skel_nids(segment_id, range(5), project_id).tolist(),
+                expected)
+
+    def test_parents_in_bfs_order(self):
+        s1 = FakeSkeleton([[0, 0, 0], [1, 0, 0], [2, 0, 0], [1, 1, 0]],
+                [[1, 0], [1, 2], [3, 1]])
+        rows = autoseg_skeleton_to_rows(s1, 10, 1)
+        ids = [mapping_skel_nid(10, i, 1) for i in range(4)]
+
+        self.assertEqual(rows['id'][0], ids[0])
+        self.assertEqual(rows['parent_id'][0], -1)
+        parents = dict(zip(rows['id'].tolist(), rows['parent_id'].tolist()))
+        self.assertEqual(parents, {ids[0]: -1, ids[1]: ids[0], ids[2]: ids[1],
+                ids[3]: ids[1]})
+        # Parents come before their children
+        seen = set()
+        for node_id, parent_id in zip(rows['id'], rows['parent_id']):
+            self.assertTrue(parent_id == -1 or parent_id in seen)
+            seen.add(node_id)
+
+    def test_largest_component_only(self):
+        # Vertex 0 is part of a small component, the root of the largest
+        # component gets the ID of vertex 0.
+        s1 = FakeSkeleton([[0, 0, 0], [5, 5, 5], [1, 0, 0], [2, 0, 0], [3, 0, 0]],
+                [[0, 1], [2, 3], [3, 4]])
+        rows = autoseg_skeleton_to_rows(s1, 10, 1)
+
+        self.assertEqual(len(rows['id']), 3)
+        self.assertEqual(rows['id'][0], mapping_skel_nid(10, 0, 1))
+        self.assertEqual(rows['vertex'].tolist(), [2, 3, 4])
+        self.assertEqual(rows['location'][:, 0].tolist(), [1, 2, 3])
+
+    def test_simplify_straight_chain(self):
+        # A straight line with a small bump at vertex 3 and a branch at 5
+        s1 = FakeSkeleton([[0, 0, 0], [1, 0, 0], [2, 0, 0], [3, 2, 0], [4, 0, 0],
+                [5, 0, 0], [6, 0, 0], [5, 1, 0]],
+                [[0, 1], [1, 2], [2, 3], [3, 4], [4, 5], [5, 6], [5, 7]])
+        rows = autoseg_skeleton_to_rows(s1, 10, 1)
+        ids = [mapping_skel_nid(10, i, 1) for i in range(8)]
+
+        simplified = simplify_skeleton_rows(rows, tolerance=1.5)
+        self.assertEqual(sorted(simplified['vertex'].tolist()), [0, 3, 5, 6, 7])
+        parents = dict(zip(simplified['id'].tolist(), simplified['parent_id'].tolist()))
+        self.assertEqual(parents, {ids[0]: -1, ids[3]: ids[0], ids[5]: ids[3],
+                ids[6]: ids[5], ids[7]: ids[5]})
+
+        # Synapse nodes are kept
+        simplified = simplify_skeleton_rows(rows, tolerance=1.5, keep_ids=[ids[1]])
+        self.assertEqual(sorted(simplified['vertex'].tolist()), [0, 1, 3, 5, 6, 7])
+
+        # The budget can't remove root, branch or leaf nodes
+        simplified = simplify_skeleton_rows(rows, node_budget=2)
+        self.assertEqual(sorted(simplified['vertex'].tolist()), [0, 5, 6, 7])
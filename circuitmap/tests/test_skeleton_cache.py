@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from circuitmap.control.skeleton_cache import (CachedSkeleton, SkeletonCache,
+        decode_skeleton, encode_skeleton)
+
+
+def random_skeleton(seed, n_vertices=100):
+    rng = np.random.RandomState(seed)
+    return CachedSkeleton(rng.rand(n_vertices, 3).astype(np.float32) * 1000,
+            np.array([[i, i + 1] for i in range(n_vertices - 1)], dtype=np.uint32),
+            rng.rand(n_vertices).astype(np.float32))
+
+
+class SkeletonCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'skeletons.sqlite')
+        # Every access gets a distinct and increasing time.
+        clock = itertools.count(1)
+        patcher = mock.patch('circuitmap.control.skeleton_cache.time.time',
+                side_effect=lambda: float(next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def assertSameSkeleton(self, a, b):
+        np.testing.assert_array_equal(a.vertices, b.vertices)
+        np.testing.assert_array_equal(a.edges, b.edges)
+        np.testing.assert_array_equal(a.radius, b.radius)
+
+    def test_round_trip(self):
+        skeleton = random_skeleton(1)
+        decoded = decode_skeleton(encode_skeleton(skeleton))
+        self.assertSameSkeleton(decoded, skeleton)
+        self.assertEqual(decoded.vertices.shape, (100, 3))
+        self.assertEqual(decoded.edges.shape, (99, 2))
+
+        empty = decode_skeleton(encode_skeleton(CachedSkeleton(
+                np.zeros((0, 3)), np.zeros((0, 2)), np.zeros(0))))
+        self.assertEqual(len(empty.vertices), 0)
+        self.assertEqual(len(empty.edges), 0)
+
+    def test_lru_eviction(self):
+        skeletons = [random_skeleton(i) for i in range(5)]
+        sizes = [len(encode_skeleton(s)) for s in skeletons]
+        # Room for the three largest skeletons, but not for four
+        cache = SkeletonCache(self.path, sum(sorted(sizes)[-3:]))
+
+        for segment_id, skeleton in enumerate(skeletons[:3]):
+            cache.put('precomputed://test', 'skeletons', segment_id, skeleton)
+        # Segment 0 is now more recently used than 1 and 2
+        self.assertIsNotNone(cache.get('precomputed://test', 'skeletons', 0))
+        cache.put('precomputed://test', 'skeletons', 3, skeletons[3])
+        cache.put('precomputed://test', 'skeletons', 4, skeletons[4])
+
+        for segment_id in (1, 2):
+            self.assertIsNone(cache.get('precomputed://test', 'skeletons', segment_id))
+        for segment_id in (0, 3, 4):
+            self.assertSameSkeleton(cache.get('precomputed://test', 'skeletons',
+                    segment_id), skeletons[segment_id])
+
+        stats = cache.stats()
+        self.assertEqual(stats['n_entries'], 3)
+        self.assertEqual(stats['size'], sizes[0] + sizes[3] + sizes[4])
+        self.assertLessEqual(stats['size'], cache.max_size)
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_keys_and_clear(self):
+        cache = SkeletonCache(self.path, 2**20)
+        skeleton = random_skeleton(1)
+        cache.put('precomputed://a', 'skeletons', 1, skeleton)
+
+        self.assertIsNone(cache.get('precomputed://b', 'skeletons', 1))
+        self.assertIsNone(cache.get('precomputed://a', 'skeletons_mip1', 1))
+        self.assertSameSkeleton(cache.get('precomputed://a', 'skeletons', 1), skeleton)
+
+        # A second instance, e.g. of another process, shares the entries
+        other = SkeletonCache(self.path, 2**20)
+        self.assertSameSkeleton(other.get('precomputed://a', 'skeletons', 1), skeleton)
+        self.assertEqual(other.stats()['hits'], 2)
+
+        other.clear()
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0,
+                'n_entries': 0, 'size': 0})
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from circuitmap.control.spatial import (SkeletonTree, cluster_bounding_boxes,
+        match_links_to_tree)
+
+
+class SkeletonTreeTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tree = SkeletonTree([11, 12], [[0, 0, 0], [100, 0, 0]])
+
+    def test_threshold_is_inclusive(self):
+        threshold = 50.0
+        points = [
+            [0, 30, 40],                                  # exactly at threshold
+            [0, 0, np.nextafter(threshold, 0)],           # just inside
+            [0, 0, np.nextafter(threshold, np.inf)],      # just beyond
+            [100, 0, 51],                                 # beyond
+        ]
+        dist, idx = self.tree.query(points, threshold)
+
+        self.assertEqual(dist[0], threshold)
+        self.assertEqual(idx.tolist(), [0, 0, len(self.tree), len(self.tree)])
+        self.assertTrue(np.isinf(dist[2:]).all())
+
+    def test_without_threshold(self):
+        dist, idx = self.tree.query([[0, 0, 1000], [90, 0, 0]])
+        self.assertEqual(idx.tolist(), [0, 1])
+        self.assertEqual(dist.tolist(), [1000, 10])
+
+    def test_empty_tree(self):
+        tree = SkeletonTree([], [])
+        dist, idx = tree.query([[0, 0, 0]], 10)
+        self.assertEqual(idx.tolist(), [0])
+        self.assertTrue(np.isinf(dist).all())
+        self.assertIsNone(tree.bounding_box(10))
+
+    def test_match_links_at_threshold(self):
+        links = pd.DataFrame({
+            'pre_x': [0, 0, 100],
+            'pre_y': [-50, 0, 0],
+            'pre_z': [0, np.nextafter(50.0, np.inf), 0],
+        })
+        matched = match_links_to_tree(self.tree, links,
+                ['pre_x', 'pre_y', 'pre_z'], 50)
+
+        self.assertEqual(matched.index.tolist(), [0, 2])
+        self.assertEqual(matched['treenode_id'].tolist(), [11, 12])
+        self.assertEqual(matched['dist2'].tolist(), [50, 0])
+
+
+class BoundingBoxClusterTest(SimpleTestCase):
+
+    def test_overlapping_boxes_are_merged(self):
+        box = lambda a, b: (np.array(a, dtype=np.float64), np.array(b, dtype=np.float64))
+        clusters = cluster_bounding_boxes([
+            box([0, 0, 0], [1, 1, 1]),
+            None,
+            box([5, 5, 5], [6, 6, 6]),
+            box([2, 0, 0], [3, 1, 1]),
+            # Connects the first and the fourth box
+            box([0.5, 0, 0], [2.5, 1, 1]),
+        ])
+
+        self.assertEqual(sorted(sorted(indices) for indices, _ in clusters),
+                [[0, 3, 4], [2]])
+        merged = [bb for indices, bb in clusters if 0 in indices][0]
+        self.assertEqual(merged[0].tolist(), [0, 0, 0])
+        self.assertEqual(merged[1].tolist(), [3, 1, 1])
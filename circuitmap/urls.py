@@ -11,8 +11,13 @@ urlpatterns = [
     url(r'^is-installed$', circuitmap.control.is_installed),
     url(r'^index$', circuitmap.control.index),
     url(r'^test$', circuitmap.control.test),
+    url(r'^metrics$', circuitmap.control.get_metrics),
     url(r'^(?P<project_id>\d+)/synapses/fetch$', circuitmap.control.fetch_synapses),
+    url(r'^(?P<project_id>\d+)/synapses/fetch-batch$', circuitmap.control.fetch_synapses_batch),
+    url(r'^(?P<project_id>\d+)/segments/at-locations$', circuitmap.control.get_segments_at_locations),
     url(r'^(?P<project_id>\d+)/imports/$', circuitmap.control.SynapseImportList.as_view()),
+    url(r'^(?P<project_id>\d+)/imports/changes$', circuitmap.control.get_import_changes),
     url(r'^(?P<project_id>\d+)/imports/last-update$', circuitmap.control.LastGeneralImportUpdate.as_view()),
+    url(r'^(?P<project_id>\d+)/imports/(?P<import_id>\d+)/cancel$', circuitmap.control.cancel_synapse_import),
     url(r'^(?P<project_id>\d+)/imports/(?P<import_id>\d+)/last-update$', circuitmap.control.LastImportUpdate.as_view()),
 ]